@@ -2,9 +2,12 @@
 基于LangGraph的Agent实现
 """
 import json
-from typing import Dict, Any, List
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, Any, List, Optional, Tuple
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 from langchain_core.tools import tool
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
@@ -12,7 +15,7 @@ from langgraph.graph.message import add_messages
 
 from state import AgentState
 from tools import TOOLS
-from config import OPENAI_API_KEY, AGENT_MODEL, TEMPERATURE, MAX_ITERATIONS
+from config import OPENAI_API_KEY, AGENT_MODEL, TEMPERATURE, MAX_ITERATIONS, TOOL_MAX_WORKERS, TOOL_CALL_TIMEOUT
 
 
 # 创建LLM实例
@@ -144,23 +147,75 @@ def call_model(state: AgentState) -> Dict[str, Any]:
     all_messages = [system_message] + messages
     
     # 调用模型
+    start = time.perf_counter()
     response = llm_with_tools.invoke(all_messages)
+    timing = {"kind": "llm", "name": AGENT_MODEL, "seconds": round(time.perf_counter() - start, 6)}
     
-    return {"messages": [response]}
+    return {"messages": [response], "timings": [timing]}
 
 
-def call_tools(state: AgentState) -> Dict[str, Any]:
-    """调用工具"""
-    messages = state.messages
-    last_message = messages[-1]
+class ToolStep:
+    """工具节点：ToolNode 在构建图时创建一次，之后每个工具步骤复用，并记录每次工具调用的耗时
+
+    同一条 AI 消息中的工具调用每 max_workers 个一批，在本步骤专用的线程池中同时执行，
+    结果按原顺序返回；每批从开始执行时计时，最多等待 timeout 秒（0 表示不限时），
+    超时的调用返回错误消息，其线程在后台运行结束，不占用其他请求的线程。
+    """
     
-    # 创建工具节点
-    tool_node = ToolNode(tools)
+    def __init__(self, tools: List[Any], max_workers: int = 1, timeout: float = 0):
+        self.tool_node = ToolNode(tools)
+        self.max_workers = max(max_workers, 1)
+        self.timeout: Optional[float] = timeout or None
     
-    # 调用工具
-    tool_messages = tool_node.invoke({"messages": [last_message]})
+    def _invoke(self, tool_call: Dict[str, Any]) -> Tuple[List[ToolMessage], Dict[str, Any]]:
+        """执行单个工具调用，返回工具消息与耗时记录"""
+        start = time.perf_counter()
+        result = self.tool_node.invoke({"messages": [AIMessage(content="", tool_calls=[tool_call])]})
+        seconds = round(time.perf_counter() - start, 6)
+        return result["messages"], {"kind": "tool", "name": tool_call["name"], "seconds": seconds}
     
-    return {"messages": tool_messages["messages"]}
+    def _timed_out(self, tool_call: Dict[str, Any], seconds: float) -> Tuple[List[ToolMessage], Dict[str, Any]]:
+        name = tool_call["name"]
+        message = ToolMessage(
+            content=f"Error: {name} timed out after {self.timeout:g}s",
+            name=name,
+            tool_call_id=tool_call["id"],
+            status="error"
+        )
+        return [message], {"kind": "tool", "name": name, "seconds": round(seconds, 6), "timed_out": True}
+    
+    def _run_batch(self, tool_calls: List[Dict[str, Any]]) -> List[Tuple[List[ToolMessage], Dict[str, Any]]]:
+        if len(tool_calls) == 1 and self.timeout is None:
+            return [self._invoke(tool_calls[0])]
+        # 工作线程继承当前运行配置（ToolNode 需要）
+        pool = ContextThreadPoolExecutor(len(tool_calls), thread_name_prefix="tool")
+        try:
+            start = time.perf_counter()
+            futures = [pool.submit(self._invoke, tool_call) for tool_call in tool_calls]
+            results = []
+            for tool_call, future in zip(tool_calls, futures):
+                remaining = None
+                if self.timeout is not None:
+                    remaining = max(0.0, self.timeout - (time.perf_counter() - start))
+                try:
+                    results.append(future.result(timeout=remaining))
+                except FutureTimeoutError:
+                    results.append(self._timed_out(tool_call, time.perf_counter() - start))
+            return results
+        finally:
+            # 不等待超时的调用
+            pool.shutdown(wait=False)
+    
+    def __call__(self, state: AgentState) -> Dict[str, Any]:
+        """调用最后一条 AI 消息中的全部工具"""
+        tool_calls = getattr(state.messages[-1], "tool_calls", None) or []
+        results = []
+        for i in range(0, len(tool_calls), self.max_workers):
+            results.extend(self._run_batch(tool_calls[i:i + self.max_workers]))
+        return {
+            "messages": [message for messages, _ in results for message in messages],
+            "timings": [timing for _, timing in results]
+        }
 
 
 def create_agent_graph() -> StateGraph:
@@ -171,7 +226,8 @@ def create_agent_graph() -> StateGraph:
     
     # 添加节点
     workflow.add_node("agent", call_model)
-    workflow.add_node("tools", call_tools)
+    # 工具节点只构建一次；同一轮的多个工具调用并发执行
+    workflow.add_node("tools", ToolStep(tools, max_workers=TOOL_MAX_WORKERS, timeout=TOOL_CALL_TIMEOUT))
     
     # 设置入口点
     workflow.set_entry_point("agent")
@@ -218,7 +274,12 @@ class LangGraphAgent:
             "final_messages": final_state.messages,
             "iteration_count": final_state.iteration_count,
             "is_finished": final_state.is_finished,
-            "error_message": final_state.error_message
+            "error_message": final_state.error_message,
+            "timings": {
+                "llm_seconds": sum(entry["seconds"] for entry in final_state.timings if entry["kind"] == "llm"),
+                "tool_seconds": sum(entry["seconds"] for entry in final_state.timings if entry["kind"] == "tool"),
+                "calls": final_state.timings
+            }
         }
         
         return result
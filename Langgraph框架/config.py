@@ -13,6 +13,11 @@ AGENT_MODEL = os.getenv("AGENT_MODEL", "gpt-4")
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.7"))
 MAX_ITERATIONS = int(os.getenv("MAX_ITERATIONS", "10"))
 
+# 工具调度配置：同一轮的多个工具调用每 TOOL_MAX_WORKERS 个一批并发执行（为 1 时顺序执行），
+# 单次调用超过 TOOL_CALL_TIMEOUT 秒返回超时错误（0 表示不限时）
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "4"))
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "30"))
+
 # 其他API配置
 SERPER_API_KEY = os.getenv("SERPER_API_KEY")
 WOLFRAM_ALPHA_APPID = os.getenv("WOLFRAM_ALPHA_APPID")
@@ -1,6 +1,7 @@
 """
 Agent状态定义
 """
+import operator
 from typing import List, Dict, Any, Optional, Annotated
 from pydantic import BaseModel, Field
 from langgraph.graph import add_messages
@@ -40,5 +41,8 @@ class AgentState(BaseModel):
     # 最终结果
     final_result: Optional[str] = None
     
+    # LLM 与工具调用耗时明细（各节点追加）
+    timings: Annotated[List[Dict[str, Any]], operator.add] = Field(default_factory=list)
+    
     class Config:
         arbitrary_types_allowed = True
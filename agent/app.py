@@ -1,6 +1,7 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 from book_agent import BookRecommendationAgent
+import json
 import os
 
 app = Flask(__name__, static_folder='.', static_url_path='')
@@ -9,6 +10,23 @@ CORS(app)  # Enable CORS for all routes
 # Create an instance of the agent
 agent = BookRecommendationAgent()
 
+WELCOME_MESSAGE = """👋 欢迎使用图书推荐Agent！
+
+📚 我可以帮助您：
+   • 搜索图书信息
+   • 基于您浏览的图书推荐相似图书
+   • 根据您的阅读偏好推荐图书
+   • 分析您的阅读趋势
+   • 提供个性化的图书推荐
+
+💬 使用示例：
+   • "搜索《三体》"
+   • "我看了《活着》，推荐相似图书"
+   • "推荐科幻小说"
+   • "分析我的阅读偏好"
+
+请告诉我您需要什么帮助吧！"""
+
 @app.route('/')
 def index():
     """Serve the main HTML page"""
@@ -29,10 +47,39 @@ def chat():
     user_id = data.get('user_id', 'default_user')
 
     # Send the message to the agent and get the response
-    response = agent.chat(message, user_id)
+    # ("no_cache": true skips cached LLM replies)
+    response = agent.chat(message, user_id, bypass_cache=bool(data.get('no_cache')))
 
     return jsonify({'response': response})
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Streams the agent's reply as Server-Sent Events.
+
+    Each event is "event: <type>" plus a JSON "data:" line, where type is
+    token (a text fragment), tool (a tool being called), done (the full
+    reply) or error.
+    """
+    data = request.get_json()
+    message = data.get('message')
+
+    if not message:
+        return jsonify({'error': 'No message provided'}), 400
+
+    user_id = data.get('user_id', 'default_user')
+
+    def generate():
+        try:
+            for event in agent.stream_chat(message, user_id, bypass_cache=bool(data.get('no_cache'))):
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            error = {'type': 'error', 'error': str(e)}
+            yield f"event: error\ndata: {json.dumps(error, ensure_ascii=False)}\n\n"
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
 @app.route('/recommend', methods=['POST'])
 def recommend():
     """
@@ -55,24 +102,7 @@ def welcome():
     """
     Returns a welcome message from the agent.
     """
-    welcome_message = """👋 欢迎使用图书推荐Agent！
-
-📚 我可以帮助您：
-   • 搜索图书信息
-   • 基于您浏览的图书推荐相似图书
-   • 根据您的阅读偏好推荐图书
-   • 分析您的阅读趋势
-   • 提供个性化的图书推荐
-
-💬 使用示例：
-   • "搜索《三体》"
-   • "我看了《活着》，推荐相似图书"
-   • "推荐科幻小说"
-   • "分析我的阅读偏好"
-
-请告诉我您需要什么帮助吧！"""
-    
-    return jsonify({'message': welcome_message})
+    return jsonify({'message': WELCOME_MESSAGE})
 
 @app.route('/feedback', methods=['POST'])
 def feedback():
@@ -0,0 +1,210 @@
+"""
+ASGI 服务入口
+
+Flask 视图（app.py）在整轮对话期间占用一个工作线程；这里的视图调用 Agent 的异步接口
+（graph.ainvoke / llm.ainvoke），等待上游模型时让出事件循环，工具在线程池中执行，
+单个进程可同时处理大量对话。同时运行的对话数由 AGENT_MAX_CONCURRENCY 限制，
+超出的请求排队等待。
+
+路由与 app.py 相同，与 Flask 应用共用同一个 Agent 实例。启动方式（需安装 ASGI 服务器）：
+
+    uvicorn asgi:app --port 5000
+"""
+import asyncio
+import json
+import mimetypes
+import os
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable
+
+from pydantic import BaseModel
+
+from app import agent, WELCOME_MESSAGE
+from config import AGENT_MAX_CONCURRENCY
+
+
+STATIC_DIR = os.path.dirname(os.path.abspath(__file__))
+# 只对外提供前端文件，不暴露源码与配置
+STATIC_SUFFIXES = (".html", ".css", ".js", ".png")
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-headers", b"Content-Type"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+]
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    return str(value)
+
+
+def _encode(payload: Any) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, default=_json_default).encode("utf-8")
+
+
+def _sse(event: Dict[str, Any]) -> bytes:
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+async def _read_json(receive: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    try:
+        data = json.loads(body or b"{}")
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+async def _respond(send, status: int, body: bytes, content_type: str = "application/json") -> None:
+    headers = [(b"content-type", content_type.encode("latin-1"))] + CORS_HEADERS
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+class BookAgentASGI:
+    """图书推荐 Agent 的 ASGI 应用"""
+
+    def __init__(self, book_agent=agent, max_concurrency: int = AGENT_MAX_CONCURRENCY, static_dir: str = STATIC_DIR):
+        self.agent = book_agent
+        self.max_concurrency = max_concurrency
+        self.static_dir = static_dir
+        # 信号量绑定事件循环，在第一个请求到达时创建
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.routes: Dict[Tuple[str, str], Callable[..., Awaitable[None]]] = {
+            ("POST", "/chat"): self.chat,
+            ("POST", "/chat/stream"): self.chat_stream,
+            ("POST", "/recommend"): self.recommend,
+            ("POST", "/feedback"): self.feedback,
+            ("GET", "/welcome"): self.welcome,
+        }
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        return self._slots
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        method, path = scope["method"], scope["path"]
+        if method == "OPTIONS":
+            await _respond(send, 204, b"")
+            return
+        handler = self.routes.get((method, path))
+        if handler is not None:
+            await handler(receive, send)
+        elif method == "GET":
+            await self.static(path, send)
+        else:
+            await _respond(send, 404, _encode({"error": "Not found"}))
+
+    async def static(self, path: str, send) -> None:
+        """提供前端页面与静态文件"""
+        relative = "index.html" if path == "/" else path.lstrip("/")
+        file_path = os.path.realpath(os.path.join(self.static_dir, relative))
+        if (
+            os.path.dirname(file_path) != os.path.realpath(self.static_dir)
+            or not file_path.endswith(STATIC_SUFFIXES)
+            or not os.path.isfile(file_path)
+        ):
+            await _respond(send, 404, _encode({"error": "Not found"}))
+            return
+        with open(file_path, "rb") as f:
+            body = f.read()
+        content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+        await _respond(send, 200, body, content_type)
+
+    async def chat(self, receive, send) -> None:
+        data = await _read_json(receive)
+        message = data.get("message")
+        if not message:
+            await _respond(send, 400, _encode({"error": "No message provided"}))
+            return
+        async with self.slots:
+            try:
+                response = await self.agent.achat(
+                    message,
+                    data.get("user_id", "default_user"),
+                    bypass_cache=bool(data.get("no_cache"))
+                )
+            except Exception as e:
+                await _respond(send, 500, _encode({"error": str(e)}))
+                return
+        await _respond(send, 200, _encode({"response": response}))
+
+    async def chat_stream(self, receive, send) -> None:
+        """以 Server-Sent Events 流式返回回复，事件格式与 app.py 相同"""
+        data = await _read_json(receive)
+        message = data.get("message")
+        if not message:
+            await _respond(send, 400, _encode({"error": "No message provided"}))
+            return
+        headers: List[Tuple[bytes, bytes]] = [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ] + CORS_HEADERS
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        async with self.slots:
+            try:
+                events = self.agent.astream_chat(
+                    message,
+                    data.get("user_id", "default_user"),
+                    bypass_cache=bool(data.get("no_cache"))
+                )
+                async for event in events:
+                    await send({"type": "http.response.body", "body": _sse(event), "more_body": True})
+            except Exception as e:
+                error = {"type": "error", "error": str(e)}
+                await send({"type": "http.response.body", "body": _sse(error), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def recommend(self, receive, send) -> None:
+        data = await _read_json(receive)
+        book_title = data.get("book_title")
+        if not book_title:
+            await _respond(send, 400, _encode({"error": "No book title provided"}))
+            return
+        async with self.slots:
+            try:
+                recommendations = await self.agent.arecommend_books(book_title, data.get("user_id", "default_user"))
+            except Exception as e:
+                await _respond(send, 500, _encode({"error": str(e)}))
+                return
+        await _respond(send, 200, _encode({"recommendations": recommendations}))
+
+    async def feedback(self, receive, send) -> None:
+        data = await _read_json(receive)
+        try:
+            result = await asyncio.to_thread(
+                self.agent.submit_feedback,
+                data.get("user_id", "default_user"),
+                data.get("book_title"),
+                data.get("rating"),
+                data.get("comment")
+            )
+        except Exception as e:
+            await _respond(send, 500, _encode({"error": str(e)}))
+            return
+        await _respond(send, 200 if result.get("success") else 400, _encode(result))
+
+    async def welcome(self, receive, send) -> None:
+        await _respond(send, 200, _encode({"message": WELCOME_MESSAGE}))
+
+
+app = BookAgentASGI()
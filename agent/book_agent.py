@@ -1,19 +1,51 @@
 """
 图书推荐Agent实现
 """
+import asyncio
 import json
-from collections import Counter, defaultdict
-from typing import Dict, Any, List, Optional, Tuple
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple, Iterator, AsyncIterator
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
 from langchain_core.tools import tool
 from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode
 from langgraph.graph.message import add_messages
 
+from book_compaction import ResultCompactor
+from book_dispatch import LLM, ToolExecutor, dispatch_metrics, summarize_timings, timing_entry
+from book_entities import AUTHOR, GENRE, TITLE, EntityMatcher
+from book_llm_cache import LLMResponseCache, cache_key, tools_fingerprint
+from book_router import FAST_PATH, PERSONALIZED_INTENTS, IntentClassifier, IntentRouter, answer
+from book_semantic_cache import SemanticResponseCache
+from book_session import PreferenceAggregate, SessionStore
 from book_state import BookRecommendationState, BookInfo, UserPreference
-from book_tools import book_recommendation_tool, book_search_tool, book_analysis_tool
-from config import DEEPSEEK_API_KEY, AGENT_MODEL, TEMPERATURE, DEEPSEEK_BASE_URL
+from book_tools import book_recommendation_tool, book_search_tool, book_analysis_tool, catalog_registry
+from book_user_store import UserStore, get_user_store
+from config import (
+    DEEPSEEK_API_KEY,
+    AGENT_MODEL,
+    TEMPERATURE,
+    DEEPSEEK_BASE_URL,
+    TOOL_MAX_WORKERS,
+    TOOL_CALL_TIMEOUT,
+    TOOL_RESULT_TOKEN_BUDGET,
+    TOOL_RESULT_DESCRIPTION_CHARS,
+    LLM_CACHE_ENABLED,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_TTL,
+    LLM_CACHE_PATH,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_TTL,
+    FAST_PATH_ENABLED,
+    FAST_PATH_CLASSIFIER,
+    FAST_PATH_CLASSIFIER_THRESHOLD,
+    SESSION_MAX_USERS,
+    SESSION_MAX_FEEDBACK,
+)
 
 
 # 创建LLM实例 - 使用DeepSeek
@@ -26,82 +58,103 @@ llm = ChatOpenAI(
 
 
 # 定义图书相关工具
+# 工具直接接收与返回 Python 结构（BookInfo、UserPreference 等模型由 LangChain 按参数注解校验），
+# 结果只在 ToolExecutor 交回模型时压缩并序列化一次（见 book_compaction.ResultCompactor）
 @tool
-def search_books(query: str, limit: int = 10) -> str:
+def search_books(query: str, limit: int = 10) -> Dict[str, Any]:
     """搜索图书"""
-    result = book_search_tool.search_books(query, limit)
-    return json.dumps(result, ensure_ascii=False)
+    return book_search_tool.search_books(query, limit)
 
 
 @tool
-def get_book_details(title: str) -> str:
+def get_book_details(title: str) -> Dict[str, Any]:
     """获取图书详细信息"""
-    result = book_search_tool.get_book_details(title)
-    return json.dumps(result, ensure_ascii=False)
+    return book_search_tool.get_book_details(title)
+
+
+@tool
+def search_by_content(description: str = "", title: str = "", limit: int = 5) -> Dict[str, Any]:
+    """按内容相似度查找图书：给出书名时查找简介与该书相近的图书，否则按一段描述文本检索"""
+    return book_search_tool.search_by_content(description, title, limit)
 
 
 @tool
-def recommend_by_author(author: str, exclude_books: str = "[]") -> str:
+def recommend_by_author(author: str, exclude_books: Optional[List[str]] = None) -> Dict[str, Any]:
     """根据作者推荐图书"""
-    exclude_list = json.loads(exclude_books) if exclude_books else []
-    result = book_recommendation_tool.recommend_by_author(author, exclude_list)
-    return json.dumps(result, ensure_ascii=False)
+    return book_recommendation_tool.recommend_by_author(author, exclude_books or [])
 
 
 @tool
-def recommend_by_genre(genre: str, exclude_books: str = "[]") -> str:
+def recommend_by_genre(genre: str, exclude_books: Optional[List[str]] = None) -> Dict[str, Any]:
     """根据类型推荐图书"""
-    exclude_list = json.loads(exclude_books) if exclude_books else []
-    result = book_recommendation_tool.recommend_by_genre(genre, exclude_list)
-    return json.dumps(result, ensure_ascii=False)
+    return book_recommendation_tool.recommend_by_genre(genre, exclude_books or [])
 
 
 @tool
-def recommend_by_knowledge_graph(book_info: str) -> str:
+def recommend_by_knowledge_graph(book_info: BookInfo) -> Dict[str, Any]:
     """基于知识图谱推荐图书"""
-    book_data = json.loads(book_info)
-    result = book_recommendation_tool.recommend_by_knowledge_graph(book_data)
-    return json.dumps(result, ensure_ascii=False)
+    return book_recommendation_tool.recommend_by_knowledge_graph(book_info.model_dump(exclude_none=True))
 
 
 @tool
-def get_user_preferences(user_id: str) -> str:
+def recommend_by_preferences(
+    preferences: UserPreference,
+    exclude_books: Optional[List[str]] = None,
+    limit: int = 5
+) -> Dict[str, Any]:
+    """根据用户偏好（喜欢的类型/作者、最低评分、出版年份区间）推荐高分图书"""
+    return book_recommendation_tool.recommend_by_preferences(
+        preferences.model_dump(exclude_none=True), exclude_books or [], limit
+    )
+
+
+@tool
+def recommend_by_graph_ranking(
+    book_titles: List[str],
+    exclude_books: Optional[List[str]] = None,
+    limit: int = 5
+) -> Dict[str, Any]:
+    """以用户读过或浏览过的图书为种子，在知识图谱上做多跳加权排序推荐，并给出关联路径"""
+    return book_recommendation_tool.recommend_by_graph_ranking(book_titles, exclude_books or [], limit)
+
+
+@tool
+def get_user_preferences(user_id: str) -> Dict[str, Any]:
     """获取用户偏好"""
     result = book_recommendation_tool.get_user_preferences(user_id)
-    return json.dumps(result, ensure_ascii=False)
+    if result.get("success"):
+        result = {**result, "preferences": UserPreference.model_validate(result["preferences"])}
+    return result
 
 
 @tool
-def update_user_preferences(user_id: str, book_info: str) -> str:
+def update_user_preferences(user_id: str, book_info: BookInfo) -> Dict[str, Any]:
     """更新用户偏好"""
-    book_data = json.loads(book_info)
-    result = book_recommendation_tool.update_user_preferences(user_id, book_data)
-    return json.dumps(result, ensure_ascii=False)
+    return book_recommendation_tool.update_user_preferences(user_id, book_info.model_dump(exclude_none=True))
 
 
 @tool
-def analyze_reading_trends(user_history: str) -> str:
+def analyze_reading_trends(user_history: List[BookInfo]) -> Dict[str, Any]:
     """分析用户阅读趋势"""
-    history_data = json.loads(user_history)
-    result = book_analysis_tool.analyze_reading_trends(history_data)
-    return json.dumps(result, ensure_ascii=False)
+    return book_analysis_tool.analyze_reading_trends([book.model_dump(exclude_none=True) for book in user_history])
 
 
 @tool
-def get_similar_books(book_info: str) -> str:
+def get_similar_books(book_info: BookInfo, limit: int = 5) -> Dict[str, Any]:
     """获取相似图书"""
-    book_data = json.loads(book_info)
-    result = book_analysis_tool.get_similar_books(book_data)
-    return json.dumps(result, ensure_ascii=False)
+    return book_analysis_tool.get_similar_books(book_info.model_dump(exclude_none=True), limit)
 
 
 # 工具列表
 book_tools = [
     search_books,
     get_book_details,
+    search_by_content,
     recommend_by_author,
     recommend_by_genre,
     recommend_by_knowledge_graph,
+    recommend_by_preferences,
+    recommend_by_graph_ranking,
     get_user_preferences,
     update_user_preferences,
     analyze_reading_trends,
@@ -128,8 +181,8 @@ def should_continue(state: BookRecommendationState) -> str:
         return "end"
 
 
-def call_model(state: BookRecommendationState) -> Dict[str, Any]:
-    """调用模型生成响应"""
+def _model_messages(state: BookRecommendationState) -> List[Any]:
+    """构建交给模型的消息列表：系统提示、偏好提示与对话消息"""
     messages = state.messages
     
     # 添加系统消息
@@ -144,9 +197,12 @@ def call_model(state: BookRecommendationState) -> Dict[str, Any]:
     你可以使用以下工具：
     - search_books: 搜索图书
     - get_book_details: 获取图书详细信息
+    - search_by_content: 按内容相似度查找图书（"和某本书内容相近的书"或"关于某个主题的书"）
     - recommend_by_author: 根据作者推荐图书
     - recommend_by_genre: 根据类型推荐图书
     - recommend_by_knowledge_graph: 基于知识图谱推荐
+    - recommend_by_preferences: 按偏好类型/作者、最低评分、出版年份区间推荐高分图书
+    - recommend_by_graph_ranking: 以多本已读图书为种子，按知识图谱多跳关联排序推荐并给出关联路径
     - get_user_preferences: 获取用户偏好
     - update_user_preferences: 更新用户偏好
     - analyze_reading_trends: 分析阅读趋势
@@ -163,25 +219,59 @@ def call_model(state: BookRecommendationState) -> Dict[str, Any]:
         all_messages = [system_message, preference_message] + messages
     else:
         all_messages = [system_message] + messages
-    
-    # 调用模型
-    response = llm_with_tools.invoke(all_messages)
-    
-    return {"messages": [response]}
+    return all_messages
 
 
-def call_tools(state: BookRecommendationState) -> Dict[str, Any]:
-    """调用工具"""
-    messages = state.messages
-    last_message = messages[-1]
-    
-    # 创建工具节点
-    tool_node = ToolNode(book_tools)
-    
-    # 调用工具
-    tool_messages = tool_node.invoke({"messages": [last_message]})
-    
-    return {"messages": tool_messages["messages"]}
+# LLM 响应缓存：交给模型的输入完全相同时直接返回缓存的回复（含工具调用计划）
+llm_cache = LLMResponseCache(LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL, LLM_CACHE_PATH) if LLM_CACHE_ENABLED else None
+_book_tools_fingerprint = tools_fingerprint(book_tools)
+
+
+def _cache_lookup(state: BookRecommendationState, messages: List[Any]) -> Tuple[Optional[str], Optional[Any]]:
+    """返回缓存键与命中的回复；未启用缓存时键为 None，指定 bypass_cache 时只计算键、不读取"""
+    if llm_cache is None:
+        return None, None
+    key = cache_key(messages, AGENT_MODEL, TEMPERATURE, _book_tools_fingerprint)
+    if getattr(state, "bypass_cache", False):
+        return key, None
+    return key, llm_cache.get(key)
+
+
+# 调用过这些工具的回答依赖具体用户的数据，不放入语义响应缓存
+USER_SPECIFIC_TOOLS = frozenset({"get_user_preferences", "update_user_preferences", "analyze_reading_trends"})
+
+
+def _model_update(response: Any, seconds: float, cached: bool = False) -> Dict[str, Any]:
+    if cached:
+        return {"messages": [response], "timings": [{**timing_entry(LLM, AGENT_MODEL, seconds), "cached": True}]}
+    dispatch_metrics.record(LLM, AGENT_MODEL, seconds)
+    return {"messages": [response], "timings": [timing_entry(LLM, AGENT_MODEL, seconds)]}
+
+
+def call_model(state: BookRecommendationState) -> Dict[str, Any]:
+    """调用模型生成响应"""
+    start = time.perf_counter()
+    messages = _model_messages(state)
+    key, cached = _cache_lookup(state, messages)
+    if cached is not None:
+        return _model_update(cached, time.perf_counter() - start, cached=True)
+    response = llm_with_tools.invoke(messages)
+    if key is not None:
+        llm_cache.put(key, response)
+    return _model_update(response, time.perf_counter() - start)
+
+
+async def acall_model(state: BookRecommendationState) -> Dict[str, Any]:
+    """异步调用模型：等待上游响应期间不占用线程"""
+    start = time.perf_counter()
+    messages = _model_messages(state)
+    key, cached = _cache_lookup(state, messages)
+    if cached is not None:
+        return _model_update(cached, time.perf_counter() - start, cached=True)
+    response = await llm_with_tools.ainvoke(messages)
+    if key is not None:
+        llm_cache.put(key, response)
+    return _model_update(response, time.perf_counter() - start)
 
 
 def create_book_agent_graph() -> StateGraph:
@@ -190,9 +280,18 @@ def create_book_agent_graph() -> StateGraph:
     # 创建状态图
     workflow = StateGraph(BookRecommendationState)
     
-    # 添加节点
-    workflow.add_node("agent", call_model)
-    workflow.add_node("tools", call_tools)
+    # 添加节点（同时提供同步与异步实现：graph.invoke 走同步版本，graph.ainvoke 走异步版本）
+    workflow.add_node("agent", RunnableLambda(call_model, afunc=acall_model, name="agent"))
+    # 工具执行器在编译时构建一次，之后每个工具步骤复用；同一轮的多个工具调用并发执行，
+    # 结果压缩后再交给模型
+    tool_executor = ToolExecutor(
+        book_tools,
+        max_workers=TOOL_MAX_WORKERS,
+        timeout=TOOL_CALL_TIMEOUT,
+        compactor=ResultCompactor(TOOL_RESULT_DESCRIPTION_CHARS),
+        token_budget=TOOL_RESULT_TOKEN_BUDGET
+    )
+    workflow.add_node("tools", RunnableLambda(tool_executor, afunc=tool_executor.acall, name="tools"))
     
     # 设置入口点
     workflow.set_entry_point("agent")
@@ -216,49 +315,92 @@ def create_book_agent_graph() -> StateGraph:
 class BookRecommendationAgent:
     """图书推荐Agent类"""
     
-    def __init__(self):
+    def __init__(self, user_store: Optional[UserStore] = None):
         self.graph = create_book_agent_graph().compile()
-        self.conversation_history = defaultdict(list)
-        self.user_feedback = defaultdict(list)
-        self._prepare_metadata()
         self.max_history_entries = 50
         self.recent_window = 5
+        # 对话历史与反馈按用户锁分段保存，多个请求线程可以并发读写；
+        # 同时交给用户数据存储持久化（默认与 get_user_preferences 工具共用进程级存储）
+        self.user_store = user_store or get_user_store()
+        self.sessions = SessionStore(
+            self.max_history_entries,
+            backend=self.user_store,
+            recent_window=self.recent_window,
+            max_users=SESSION_MAX_USERS,
+            max_feedback_entries=SESSION_MAX_FEEDBACK
+        )
+        # _metadata_lock 保护实体自动机与书名表的读写；_refresh_lock 让目录变化后的重新扫描串行执行，
+        # 扫描期间其他请求仍可用旧的元数据抽取实体
+        self._metadata_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._prepare_metadata()
+        # 语义响应缓存：同一偏好提示与实体下换了说法的问题直接复用最终回复，不再运行图
+        self.semantic_cache = SemanticResponseCache(
+            SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_TTL
+        ) if SEMANTIC_CACHE_ENABLED else None
+        # 快速路由：简单意图直接由工具与模板回答
+        self.router = IntentRouter(
+            IntentClassifier(FAST_PATH_CLASSIFIER_THRESHOLD) if FAST_PATH_CLASSIFIER else None
+        ) if FAST_PATH_ENABLED else None
+    
+    @staticmethod
+    def _catalog_graph_version() -> Tuple[int, int]:
+        """元数据只依赖书名、作者、类型，按目录的图结构版本判断是否过期（评分等字段变化不触发）"""
+        return catalog_registry.version, book_recommendation_tool.db.graph_version
     
     def _prepare_metadata(self) -> None:
-        """预处理作者、类型、书名等元数据，便于快速抽取偏好"""
-        books = book_recommendation_tool.db.books
-        author_set = {book.get("author") for book in books if book.get("author")}
-        genre_set = {book.get("genre") for book in books if book.get("genre")}
-        self.author_entries = [(author, author.lower()) for author in sorted(author_set, key=len, reverse=True)]
-        self.genre_entries = [(genre, genre.lower()) for genre in sorted(genre_set, key=len, reverse=True)]
-        title_set = {book.get("title") for book in books if book.get("title")}
-        self.title_entries = [(title, title.lower()) for title in sorted(title_set, key=len, reverse=True)]
-        self.title_lookup: Dict[str, Dict[str, Any]] = {}
-        for book in books:
+        """预处理作者、类型、书名等元数据，便于快速抽取偏好
+
+        作者、类型、书名编译进实体自动机；目录版本变化后再次调用时只增量加入新实体、移除已删除的实体。
+        目录扫描在 _metadata_lock 之外进行，只有更新自动机与替换书名表时持锁。
+        """
+        version = self._catalog_graph_version()
+        entities = set()
+        title_lookup: Dict[str, Dict[str, Any]] = {}
+        for book in book_recommendation_tool.db.iter_books():
             title = book.get("title")
+            for kind, field in ((AUTHOR, "author"), (GENRE, "genre"), (TITLE, "title")):
+                if book.get(field):
+                    entities.add((kind, book[field]))
             if title:
-                self.title_lookup[title.lower()] = book
+                title_lookup[title.lower()] = book
+        with self._metadata_lock:
+            known = getattr(self, "_entities", set())
+            if not hasattr(self, "entity_matcher"):
+                self.entity_matcher = EntityMatcher()
+            self.entity_matcher.update(added=entities - known, removed=known - entities)
+            self._entities = entities
+            self.title_lookup = title_lookup
+            self._metadata_version = version
+    
+    def _refresh_metadata(self) -> None:
+        """目录被替换或书名、作者、类型变化后更新元数据（调用方不能持有 _metadata_lock）"""
+        if self._catalog_graph_version() == self._metadata_version:
+            return
+        with self._refresh_lock:
+            if self._catalog_graph_version() != self._metadata_version:
+                self._prepare_metadata()
     
     def _normalize_user_id(self, user_id: Optional[str]) -> str:
         return user_id or "anonymous_user"
     
     def _append_history(self, user_id: str, entry: Dict[str, Any]) -> None:
-        history = self.conversation_history[user_id]
-        history.append(entry)
-        if len(history) > self.max_history_entries:
-            self.conversation_history[user_id] = history[-self.max_history_entries:]
+        self.sessions.append_history(user_id, entry)
     
     def _extract_entities(self, text: str) -> Tuple[List[str], List[str], List[str]]:
         if not text:
             return [], [], []
-        text_lower = text.lower()
-        authors = {raw for raw, lower in self.author_entries if lower in text_lower}
-        genres = {raw for raw, lower in self.genre_entries if lower in text_lower}
-        titles = {raw for raw, lower in self.title_entries if lower in text_lower}
+        authors, genres, titles = set(), set(), set()
+        self._refresh_metadata()
+        with self._metadata_lock:
+            # 一次扫描找出全部实体，重叠时保留最长匹配
+            for kind, name in self.entity_matcher.extract(text):
+                {AUTHOR: authors, GENRE: genres, TITLE: titles}[kind].add(name)
+            title_lookup = self.title_lookup
         
         # 通过书名自动补全作者/类型偏好
         for title in titles:
-            book = self.title_lookup.get(title.lower())
+            book = title_lookup.get(title.lower())
             if not book:
                 continue
             author = book.get("author")
@@ -304,7 +446,9 @@ class BookRecommendationAgent:
                 rating_value = max(0.0, min(10.0, float(rating)))
             except ValueError:
                 rating_value = None
-        book = self.title_lookup.get(book_title.lower()) if book_title else None
+        self._refresh_metadata()
+        with self._metadata_lock:
+            book = self.title_lookup.get(book_title.lower()) if book_title else None
         author = book.get("author") if book else None
         genre = book.get("genre") if book else None
         feedback_entry = {
@@ -314,52 +458,31 @@ class BookRecommendationAgent:
             "author": author,
             "genre": genre
         }
-        self.user_feedback[normalized_id].append(feedback_entry)
-        self._append_history(normalized_id, {
-            "role": "feedback",
-            "content": json.dumps(feedback_entry, ensure_ascii=False)
-        })
+        # 反馈与对应的历史记录作为一个整体写入
+        with self.sessions.lock(normalized_id):
+            self.sessions.append_feedback(normalized_id, feedback_entry)
+            self._append_history(normalized_id, {
+                "role": "feedback",
+                "content": json.dumps(feedback_entry, ensure_ascii=False)
+            })
         rating_text = f"{rating_value:.1f} 分" if rating_value is not None else "未给出分数"
         if comment:
             return f"已记录您对《{book_title}》的评价（{rating_text}）。评论：{comment}"
         return f"已记录您对《{book_title}》的评价（{rating_text}）。"
     
-    def _feedback_hint_lines(self, user_id: str) -> List[str]:
-        entries = self.user_feedback.get(user_id, [])
-        if not entries:
-            return []
-        positive_authors = Counter()
-        positive_genres = Counter()
-        negative_authors = Counter()
-        negative_genres = Counter()
-        for entry in entries:
-            rating = entry.get("rating")
-            author = entry.get("author")
-            genre = entry.get("genre")
-            if rating is None:
-                continue
-            if rating >= 7.0:
-                if author:
-                    positive_authors[author] += 1
-                if genre:
-                    positive_genres[genre] += 1
-            elif rating <= 4.0:
-                if author:
-                    negative_authors[author] += 1
-                if genre:
-                    negative_genres[genre] += 1
+    def _feedback_hint_lines(self, aggregate: PreferenceAggregate) -> List[str]:
         lines = []
-        if positive_authors:
-            top = ", ".join(name for name, _ in positive_authors.most_common(3))
+        if aggregate.positive_authors:
+            top = ", ".join(name for name, _ in aggregate.positive_authors.most_common(3))
             lines.append(f"- 用户对以下作者评分较高：{top}，可优先推荐其作品")
-        if positive_genres:
-            top = ", ".join(name for name, _ in positive_genres.most_common(3))
+        if aggregate.positive_genres:
+            top = ", ".join(name for name, _ in aggregate.positive_genres.most_common(3))
             lines.append(f"- 用户对以下类型评分较高：{top}")
-        if negative_authors:
-            top = ", ".join(name for name, _ in negative_authors.most_common(3))
+        if aggregate.negative_authors:
+            top = ", ".join(name for name, _ in aggregate.negative_authors.most_common(3))
             lines.append(f"- 以下作者评分较低，可谨慎推荐：{top}")
-        if negative_genres:
-            top = ", ".join(name for name, _ in negative_genres.most_common(3))
+        if aggregate.negative_genres:
+            top = ", ".join(name for name, _ in aggregate.negative_genres.most_common(3))
             lines.append(f"- 以下类型曾被低分评价：{top}")
         return lines
     
@@ -370,32 +493,21 @@ class BookRecommendationAgent:
         return None
     
     def _build_preference_hint(self, user_id: Optional[str]) -> Optional[str]:
-        normalized_id = self._normalize_user_id(user_id)
-        history = self.conversation_history.get(normalized_id, [])
-        user_entries = [entry for entry in history if entry.get("role") == "user"]
-        if not user_entries:
-            return None
-        
-        recent_entries = user_entries[-self.recent_window:]
-        author_counter = Counter()
-        genre_counter = Counter()
-        for entry in recent_entries:
-            for author in entry.get("authors", []):
-                author_counter[author] += 1
-            for genre in entry.get("genres", []):
-                genre_counter[genre] += 1
-        
-        if not author_counter and not genre_counter:
+        """偏好提示：由会话存储中按用户增量维护的累计生成，累计不变时直接复用上次的文本"""
+        return self.sessions.preference_hint(self._normalize_user_id(user_id), self._render_preference_hint)
+    
+    def _render_preference_hint(self, aggregate: PreferenceAggregate) -> Optional[str]:
+        top_authors = aggregate.recent(aggregate.authors)
+        top_genres = aggregate.recent(aggregate.genres)
+        if not top_authors and not top_genres:
             return None
         
         hint_lines = ["请结合以下会话偏好优先推荐相关图书，并在回复中明确指出是“因为你之前提到过……所以优先推荐……”。"]
-        if author_counter:
-            top_authors = [name for name, _ in author_counter.most_common(3)]
+        if top_authors:
             hint_lines.append(f"- 最近关注的作者：{', '.join(top_authors)}")
-        if genre_counter:
-            top_genres = [name for name, _ in genre_counter.most_common(3)]
+        if top_genres:
             hint_lines.append(f"- 最近关注的类型：{', '.join(top_genres)}")
-        feedback_lines = self._feedback_hint_lines(normalized_id)
+        feedback_lines = self._feedback_hint_lines(aggregate)
         if feedback_lines:
             hint_lines.append("- 以下内容来自用户对历史推荐的评分：")
             hint_lines.extend(feedback_lines)
@@ -408,30 +520,94 @@ class BookRecommendationAgent:
         if response:
             self._record_ai_message(user_id, response)
     
-    def run(
+    def _shortcut(
+        self,
+        message: str,
+        preference_hint: Optional[str],
+        bypass_cache: bool = False
+    ) -> Tuple[Optional[Tuple[Any, Any]], Optional[str]]:
+        """运行图之前的捷径：先走快速路由，再查语义缓存
+
+        返回语义缓存的作用域（抽取的实体与目录版本）与直接得到的回复；bypass_cache 时不读取语义缓存。
+        """
+        if not message or (self.router is None and self.semantic_cache is None):
+            return None, None
+        self._refresh_metadata()
+        with self._metadata_lock:
+            entities = self.entity_matcher.extract(message)
+        # 缓存的回复可能引用评分等字段，语义缓存仍按目录的整体版本失效
+        version = (catalog_registry.version, book_recommendation_tool.db.version)
+        if self.router is not None:
+            response = self._fast_path(message, entities, preference_hint)
+            if response is not None:
+                return None, response
+        if self.semantic_cache is None:
+            return None, None
+        if bypass_cache:
+            return (entities, version), None
+        return (entities, version), self.semantic_cache.lookup(message, entities, preference_hint, version)
+    
+    def _fast_path(
+        self,
+        message: str,
+        entities: List[Tuple[str, str]],
+        preference_hint: Optional[str]
+    ) -> Optional[str]:
+        """高置信度的简单意图直接调用工具并套用模板；推荐类意图在有偏好提示时仍交给模型"""
+        start = time.perf_counter()
+        decision = self.router.classify(message, entities)
+        if decision is None or (preference_hint and decision["intent"] in PERSONALIZED_INTENTS):
+            return None
+        response = answer(decision, book_search_tool, book_recommendation_tool)
+        dispatch_metrics.record(FAST_PATH, decision["intent"], time.perf_counter() - start)
+        return response
+    
+    def _semantic_store(
+        self,
+        message: str,
+        preference_hint: Optional[str],
+        scope: Optional[Tuple[Any, Any]],
+        final_messages: List[Any]
+    ) -> None:
+        """缓存正常结束的回复；未得到最终回答或调用过用户相关工具的运行不缓存"""
+        if scope is None or not final_messages:
+            return
+        last_message = final_messages[-1]
+        if not isinstance(last_message, AIMessage) or last_message.tool_calls:
+            return
+        if not isinstance(last_message.content, str) or not last_message.content.strip():
+            return
+        for item in final_messages:
+            if any(call["name"] in USER_SPECIFIC_TOOLS for call in getattr(item, "tool_calls", None) or ()):
+                return
+        self.semantic_cache.store(message, scope[0], preference_hint, last_message.content, scope[1])
+    
+    def _direct_reply(self, user_id: Optional[str], message: str, response: str) -> str:
+        """未运行图直接得到的回复（快速路由或语义缓存）：与正常回复一样记录本轮对话"""
+        self._post_interaction(user_id, message, [AIMessage(content=response)])
+        return response
+    
+    def _initial_state(
         self,
         user_input: str,
-        user_id: str = None,
-        max_iterations: int = 5,
-        preference_hint: Optional[str] = None
-    ) -> Dict[str, Any]:
-        """运行图书推荐Agent"""
-        
-        # 创建初始状态
-        initial_state = BookRecommendationState(
+        user_id: Optional[str],
+        max_iterations: int,
+        preference_hint: Optional[str],
+        bypass_cache: bool = False
+    ) -> BookRecommendationState:
+        return BookRecommendationState(
             messages=[HumanMessage(content=user_input)],
             user_input=user_input,
             user_id=user_id,
             max_iterations=max_iterations,
             iteration_count=0,
-            preference_hint=preference_hint
+            preference_hint=preference_hint,
+            bypass_cache=bypass_cache
         )
-        
-        # 运行图
-        final_state = self.graph.invoke(initial_state)
-        
-        # 提取结果
-        result = {
+    
+    def _run_result(self, user_input: str, user_id: Optional[str], final_state: Dict[str, Any]) -> Dict[str, Any]:
+        """提取运行结果"""
+        return {
             "user_input": user_input,
             "user_id": user_id,
             "final_messages": final_state.get('messages', []),
@@ -439,15 +615,43 @@ class BookRecommendationAgent:
             "recommendation_reasons": final_state.get('recommendation_reasons', []),
             "iteration_count": final_state.get('iteration_count', 0),
             "is_finished": final_state.get('is_finished', False),
-            "error_message": final_state.get('error_message')
+            "error_message": final_state.get('error_message'),
+            "timings": summarize_timings(final_state.get('timings', [])),
+            "tool_tokens": final_state.get('tool_tokens', 0)
         }
+    
+    def run(
+        self,
+        user_input: str,
+        user_id: str = None,
+        max_iterations: int = 5,
+        preference_hint: Optional[str] = None,
+        bypass_cache: bool = False
+    ) -> Dict[str, Any]:
+        """运行图书推荐Agent（bypass_cache 为 True 时不使用 LLM 响应缓存中的回复）"""
         
-        return result
+        # 创建初始状态
+        initial_state = self._initial_state(user_input, user_id, max_iterations, preference_hint, bypass_cache)
+        
+        # 运行图
+        final_state = self.graph.invoke(initial_state)
+        
+        return self._run_result(user_input, user_id, final_state)
     
-    def chat(self, message: str, user_id: str = None) -> str:
-        """简单的聊天接口"""
-        preference_hint = self._build_preference_hint(user_id)
-        result = self.run(message, user_id, preference_hint=preference_hint)
+    async def arun(
+        self,
+        user_input: str,
+        user_id: str = None,
+        max_iterations: int = 5,
+        preference_hint: Optional[str] = None,
+        bypass_cache: bool = False
+    ) -> Dict[str, Any]:
+        """run 的异步版本：模型调用使用 ainvoke，工具在线程池中执行"""
+        initial_state = self._initial_state(user_input, user_id, max_iterations, preference_hint, bypass_cache)
+        final_state = await self.graph.ainvoke(initial_state)
+        return self._run_result(user_input, user_id, final_state)
+    
+    def _reply(self, user_id: Optional[str], message: str, result: Dict[str, Any]) -> str:
         messages = result.get("final_messages", [])
         response = self._extract_last_ai_message(messages)
         self._post_interaction(user_id, message, messages)
@@ -456,6 +660,96 @@ class BookRecommendationAgent:
             return response
         return "抱歉，我无法处理您的图书推荐请求。"
     
+    def chat(self, message: str, user_id: str = None, bypass_cache: bool = False) -> str:
+        """简单的聊天接口：简单意图由快速路由直接回答，其余交给图
+        （bypass_cache 为 True 时不使用语义缓存与 LLM 响应缓存中的回复）"""
+        preference_hint = self._build_preference_hint(user_id)
+        scope, direct = self._shortcut(message, preference_hint, bypass_cache)
+        if direct is not None:
+            return self._direct_reply(user_id, message, direct)
+        result = self.run(message, user_id, preference_hint=preference_hint, bypass_cache=bypass_cache)
+        self._semantic_store(message, preference_hint, scope, result["final_messages"])
+        return self._reply(user_id, message, result)
+    
+    async def achat(self, message: str, user_id: str = None, bypass_cache: bool = False) -> str:
+        """chat 的异步版本（偏好读取、快速路由、会话记录等同步步骤都放到线程中执行，不阻塞事件循环）"""
+        preference_hint = await asyncio.to_thread(self._build_preference_hint, user_id)
+        scope, direct = await asyncio.to_thread(self._shortcut, message, preference_hint, bypass_cache)
+        if direct is not None:
+            return await asyncio.to_thread(self._direct_reply, user_id, message, direct)
+        result = await self.arun(message, user_id, preference_hint=preference_hint, bypass_cache=bypass_cache)
+        await asyncio.to_thread(self._semantic_store, message, preference_hint, scope, result["final_messages"])
+        return await asyncio.to_thread(self._reply, user_id, message, result)
+    
+    @staticmethod
+    def _stream_events(chunk: Any, metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """把 agent 节点输出的消息片段转换为流式事件"""
+        if metadata.get("langgraph_node") != "agent":
+            return []
+        events = []
+        tool_calls = getattr(chunk, "tool_calls", None) or getattr(chunk, "tool_call_chunks", None) or []
+        for tool_call in tool_calls:
+            if tool_call.get("name"):
+                events.append({"type": "tool", "name": tool_call["name"]})
+        if isinstance(chunk.content, str) and chunk.content:
+            events.append({"type": "token", "content": chunk.content})
+        return events
+    
+    def _stream_done(self, user_id: Optional[str], message: str, final_messages: List[Any]) -> Dict[str, Any]:
+        response = self._extract_last_ai_message(final_messages)
+        self._post_interaction(user_id, message, final_messages)
+        return {"type": "done", "response": response or "抱歉，我无法处理您的图书推荐请求。"}
+    
+    def stream_chat(self, message: str, user_id: str = None, bypass_cache: bool = False) -> Iterator[Dict[str, Any]]:
+        """流式聊天接口，基于 LangGraph 的 messages 流逐步产出事件：
+        
+        - {"type": "token", "content": ...}：模型输出的文本片段
+        - {"type": "tool", "name": ...}：模型决定调用工具
+        - {"type": "done", "response": ...}：完整回复（以此为准，覆盖之前的片段）
+        """
+        preference_hint = self._build_preference_hint(user_id)
+        scope, direct = self._shortcut(message, preference_hint, bypass_cache)
+        if direct is not None:
+            yield {"type": "done", "response": self._direct_reply(user_id, message, direct)}
+            return
+        initial_state = self._initial_state(message, user_id, 5, preference_hint, bypass_cache)
+        final_messages: List[Any] = []
+        
+        for mode, data in self.graph.stream(initial_state, stream_mode=["messages", "values"]):
+            if mode == "values":
+                final_messages = data["messages"]
+                continue
+            yield from self._stream_events(*data)
+        
+        self._semantic_store(message, preference_hint, scope, final_messages)
+        yield self._stream_done(user_id, message, final_messages)
+    
+    async def astream_chat(
+        self,
+        message: str,
+        user_id: str = None,
+        bypass_cache: bool = False
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """stream_chat 的异步版本，事件格式相同"""
+        preference_hint = await asyncio.to_thread(self._build_preference_hint, user_id)
+        scope, direct = await asyncio.to_thread(self._shortcut, message, preference_hint, bypass_cache)
+        if direct is not None:
+            response = await asyncio.to_thread(self._direct_reply, user_id, message, direct)
+            yield {"type": "done", "response": response}
+            return
+        initial_state = self._initial_state(message, user_id, 5, preference_hint, bypass_cache)
+        final_messages: List[Any] = []
+        
+        async for mode, data in self.graph.astream(initial_state, stream_mode=["messages", "values"]):
+            if mode == "values":
+                final_messages = data["messages"]
+                continue
+            for event in self._stream_events(*data):
+                yield event
+        
+        await asyncio.to_thread(self._semantic_store, message, preference_hint, scope, final_messages)
+        yield await asyncio.to_thread(self._stream_done, user_id, message, final_messages)
+    
     def recommend_books(self, book_title: str, user_id: str = None) -> Dict[str, Any]:
         """推荐图书的专门方法"""
         query = f"我浏览了图书《{book_title}》，请为我推荐相似的图书"
@@ -464,6 +758,14 @@ class BookRecommendationAgent:
         self._post_interaction(user_id, query, result.get("final_messages", []))
         return result
     
+    async def arecommend_books(self, book_title: str, user_id: str = None) -> Dict[str, Any]:
+        """recommend_books 的异步版本"""
+        query = f"我浏览了图书《{book_title}》，请为我推荐相似的图书"
+        preference_hint = await asyncio.to_thread(self._build_preference_hint, user_id)
+        result = await self.arun(query, user_id, preference_hint=preference_hint)
+        await asyncio.to_thread(self._post_interaction, user_id, query, result.get("final_messages", []))
+        return result
+    
     def submit_feedback(
         self,
         user_id: Optional[str],
@@ -0,0 +1,199 @@
+"""
+工具结果压缩
+
+工具结果在交给模型前经过一层压缩，减少后续每次 call_model 的提示词长度：
+- 字段投影：图书只保留推荐所需字段（书名、作者、类型、评分、年份、简介）
+- 简介截断：超过上限的简介截断并加省略号
+- 去重：本轮对话中已经发给模型的图书只保留书名引用
+- 预算：一轮对话中所有工具结果的估算 token 总数不超过预算，超出时依次去掉简介、缩短列表
+并统计压缩前后的 token 数。
+"""
+import json
+import threading
+from typing import Dict, Any, List, Optional, Iterable, Set, Tuple
+
+from pydantic import BaseModel
+
+
+# 交给模型的图书字段
+BOOK_FIELDS = ("title", "author", "genre", "rating", "publication_year", "description")
+
+# 返回完整字段、不做投影和去重的工具（例如用户明确询问详细信息）
+FULL_DETAIL_TOOLS = ("get_book_details",)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数：中日韩字符按 1 个 token，其余字符按 4 个字符 1 个 token"""
+    wide = sum(1 for char in text if char >= "⺀")
+    return wide + (len(text) - wide + 3) // 4
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _is_book(value: Dict[str, Any]) -> bool:
+    return "title" in value and "author" in value
+
+
+class CompactionMetrics:
+    """累计压缩前后的估算 token 数（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"results": 0, "raw_tokens": 0, "sent_tokens": 0, "deduped_books": 0, "trimmed_results": 0}
+
+    def record(self, raw_tokens: int, sent_tokens: int, deduped_books: int, trimmed: bool) -> None:
+        with self._lock:
+            self._stats["results"] += 1
+            self._stats["raw_tokens"] += raw_tokens
+            self._stats["sent_tokens"] += sent_tokens
+            self._stats["deduped_books"] += deduped_books
+            self._stats["trimmed_results"] += int(trimmed)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "saved_tokens": self._stats["raw_tokens"] - self._stats["sent_tokens"]}
+
+    def reset(self) -> None:
+        with self._lock:
+            for key in self._stats:
+                self._stats[key] = 0
+
+
+# 进程级共享的压缩统计
+compaction_metrics = CompactionMetrics()
+
+
+class CompactionContext:
+    """一轮对话的压缩状态：已发送的书名与剩余 token 预算（None 表示不限）"""
+
+    def __init__(self, sent_titles: Iterable[str] = (), budget: Optional[int] = None):
+        self.sent_titles: Set[str] = set(sent_titles)
+        self.budget = budget
+        self.new_titles: List[str] = []
+        self.used_tokens = 0
+
+
+class ResultCompactor:
+    """工具结果压缩器"""
+
+    def __init__(
+        self,
+        description_chars: int = 80,
+        fields: Tuple[str, ...] = BOOK_FIELDS,
+        full_detail_tools: Tuple[str, ...] = FULL_DETAIL_TOOLS,
+        metrics: Optional[CompactionMetrics] = None
+    ):
+        self.description_chars = description_chars
+        self.fields = fields
+        self.full_detail_tools = full_detail_tools
+        self.metrics = metrics or compaction_metrics
+
+    def _walk(self, value: Any, project: bool, seen: Set[str], counts: Dict[str, int]) -> Any:
+        """去掉空值、投影并去重图书（seen 为已发送及本结果中已出现的书名）、截断简介"""
+        if isinstance(value, BaseModel):
+            value = value.model_dump(exclude_none=True)
+        if isinstance(value, dict):
+            if project and _is_book(value):
+                title = value["title"]
+                if title in seen:
+                    counts["deduped"] += 1
+                    return {"title": title, "seen": True}
+                seen.add(title)
+                value = {field: value.get(field) for field in self.fields}
+            compacted = {}
+            for key, item in value.items():
+                if item is None:
+                    continue
+                if key == "description" and isinstance(item, str) and len(item) > self.description_chars:
+                    item = item[:self.description_chars] + "…"
+                compacted[key] = self._walk(item, project, seen, counts)
+            return compacted
+        if isinstance(value, (list, tuple)):
+            return [self._walk(item, project, seen, counts) for item in value]
+        return value
+
+    @staticmethod
+    def _sent_titles(value: Any) -> List[str]:
+        """最终结果中完整发送的图书书名（不含引用）"""
+        titles = []
+        stack = [value]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, dict):
+                if _is_book(item):
+                    titles.append(item["title"])
+                stack.extend(item.values())
+            elif isinstance(item, list):
+                stack.extend(item)
+        return titles
+
+    @staticmethod
+    def _drop_descriptions(value: Any) -> Any:
+        if isinstance(value, dict):
+            return {key: ResultCompactor._drop_descriptions(item) for key, item in value.items() if key != "description"}
+        if isinstance(value, list):
+            return [ResultCompactor._drop_descriptions(item) for item in value]
+        return value
+
+    @staticmethod
+    def _longest_list(value: Any) -> Optional[List[Any]]:
+        """找出结果中最长的列表（按元素个数）"""
+        best = None
+        stack = [value]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, dict):
+                stack.extend(item.values())
+            elif isinstance(item, list):
+                if len(item) > 1 and (best is None or len(item) > len(best)):
+                    best = item
+                stack.extend(item)
+        return best
+
+    def _fit(self, value: Any, budget: int) -> Tuple[Any, str, bool]:
+        """在预算内编码结果：先去掉简介，再逐次把最长的列表减半"""
+        encoded = _dumps(value)
+        if estimate_tokens(encoded) <= budget:
+            return value, encoded, False
+        if isinstance(value, dict):
+            value = self._drop_descriptions(value)
+            value["truncated"] = True
+            encoded = _dumps(value)
+            while estimate_tokens(encoded) > budget:
+                longest = self._longest_list(value)
+                if longest is None:
+                    break
+                del longest[(len(longest) + 1) // 2:]
+                encoded = _dumps(value)
+            if estimate_tokens(encoded) <= budget:
+                return value, encoded, True
+        notice = {"success": False, "truncated": True, "error": "本轮工具结果已超出上下文预算，请缩小查询范围"}
+        return notice, _dumps(notice), True
+
+    def compact(self, tool_name: str, value: Any, context: CompactionContext) -> str:
+        """压缩单个工具结果并更新本轮的压缩状态，返回交给模型的文本"""
+        if isinstance(value, str):
+            raw_tokens = estimate_tokens(value)
+            encoded, trimmed, deduped = value, False, 0
+        else:
+            plain = value.model_dump() if isinstance(value, BaseModel) else value
+            raw_tokens = estimate_tokens(json.dumps(plain, ensure_ascii=False, default=lambda item: item.model_dump()))
+            counts = {"deduped": 0}
+            project = tool_name not in self.full_detail_tools
+            compacted = self._walk(value, project, set(context.sent_titles), counts)
+            deduped = counts["deduped"]
+            if context.budget is None:
+                encoded, trimmed = _dumps(compacted), False
+            else:
+                compacted, encoded, trimmed = self._fit(compacted, max(context.budget - context.used_tokens, 0))
+            # 只有最终确实发送的图书才计入已发送，被预算裁掉的图书之后仍会完整发送
+            for title in self._sent_titles(compacted):
+                if title not in context.sent_titles:
+                    context.sent_titles.add(title)
+                    context.new_titles.append(title)
+        sent_tokens = estimate_tokens(encoded)
+        context.used_tokens += sent_tokens
+        self.metrics.record(raw_tokens, sent_tokens, deduped, trimmed)
+        return encoded
@@ -0,0 +1,257 @@
+"""
+工具调度
+
+在图编译时构建一次工具执行器（按名称索引工具，不在每个工具步骤重新解析工具定义），
+执行模型发出的 tool_calls，并记录每次工具调用与模型调用的耗时，
+便于区分一轮对话中工具调度与 LLM 各占多少时间。
+
+同一条 AI 消息中的多个工具调用互不依赖，可提交到线程池并发执行（TOOL_MAX_WORKERS），
+结果按原顺序返回，整轮耗时约等于最慢的一个工具。
+异步图（graph.ainvoke）通过 adispatch 在事件循环中等待同一批工具调用，不占用请求线程。
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import ToolMessage
+from langchain_core.tools import BaseTool
+
+from book_compaction import CompactionContext, ResultCompactor
+
+
+# 耗时记录的类型
+LLM = "llm"
+TOOL = "tool"
+TIMEOUT = "timeout"
+
+
+class DispatchMetrics:
+    """按名称累计调用次数与耗时（线程安全），供监控查看"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, kind: str, name: str, seconds: float) -> None:
+        key = f"{kind}:{name}"
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+            stats["count"] += 1
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """返回各项统计的副本（含平均耗时）"""
+        with self._lock:
+            return {
+                key: {**stats, "avg_seconds": stats["total_seconds"] / stats["count"]}
+                for key, stats in self._stats.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+# 进程级共享的调度统计
+dispatch_metrics = DispatchMetrics()
+
+def timing_entry(kind: str, name: str, seconds: float) -> Dict[str, Any]:
+    """单次调用的耗时记录，写入状态的 timings 字段"""
+    return {"kind": kind, "name": name, "seconds": round(seconds, 6)}
+
+
+def summarize_timings(timings: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总一轮对话的耗时：LLM 与工具分别合计，并保留逐次明细"""
+    llm_seconds = sum(entry["seconds"] for entry in timings if entry["kind"] == LLM)
+    tool_seconds = sum(entry["seconds"] for entry in timings if entry["kind"] == TOOL)
+    return {
+        "llm_seconds": round(llm_seconds, 6),
+        "tool_seconds": round(tool_seconds, 6),
+        "calls": list(timings),
+    }
+
+
+class ToolExecutor:
+    """工具执行器：构建一次，作为图的 tools 节点重复使用
+
+    同一轮的工具调用每 max_workers 个一批，在该批专用的线程池中同时执行，结果按原顺序返回；
+    线程池按批创建，不与其他请求共享，排队等待其他请求的时间不计入超时。
+    每批从开始执行时计时，最多等待 timeout 秒（timeout 为 0 或 None 表示不限时，
+    此时 max_workers 为 1 的调用直接在调用线程中执行）。
+    超时的调用返回错误消息，其线程无法强制终止，会在后台运行结束后退出，不占用后续调用的线程。
+    一个进程同时运行的工具线程数最多约为并发对话数乘以 max_workers。
+
+    工具结果按原顺序逐个交给 compactor 压缩并序列化（字段投影、去重、token 预算；
+    未指定时使用默认参数的 ResultCompactor），token_budget 为一轮对话中全部工具结果的估算 token 上限。
+    """
+
+    def __init__(
+        self,
+        tools: Sequence[BaseTool],
+        metrics: Optional[DispatchMetrics] = None,
+        max_workers: int = 1,
+        timeout: Optional[float] = None,
+        compactor: Optional[ResultCompactor] = None,
+        token_budget: Optional[int] = None
+    ):
+        self.tools_by_name: Dict[str, BaseTool] = {tool.name: tool for tool in tools}
+        self.metrics = metrics or dispatch_metrics
+        self.timeout = timeout or None
+        self.compactor = compactor or ResultCompactor()
+        self.token_budget = token_budget or None
+        self.max_workers = max(max_workers, 1)
+
+    def _run(self, tool_call: Dict[str, Any]) -> Tuple[Any, str, Dict[str, Any]]:
+        """执行单个工具调用，返回原始结果、状态与耗时记录；异常转换为错误文本交给模型处理"""
+        name = tool_call["name"]
+        tool = self.tools_by_name.get(name)
+        start = time.perf_counter()
+        if tool is None:
+            output = f"Error: {name} is not a valid tool, try one of [{', '.join(self.tools_by_name)}]."
+            status = "error"
+        else:
+            try:
+                output = tool.invoke(tool_call["args"])
+                status = "success"
+            except Exception as e:
+                output = f"Error: {e!r}\n Please fix your mistakes."
+                status = "error"
+        seconds = time.perf_counter() - start
+        self.metrics.record(TOOL, name, seconds)
+        return output, status, timing_entry(TOOL, name, seconds)
+
+    def _message(
+        self,
+        tool_call: Dict[str, Any],
+        output: Any,
+        status: str,
+        context: Optional[CompactionContext]
+    ) -> ToolMessage:
+        """在交给模型的边界上压缩并序列化结果"""
+        content = self.compactor.compact(tool_call["name"], output, context or CompactionContext())
+        return ToolMessage(content=content, name=tool_call["name"], tool_call_id=tool_call["id"], status=status)
+
+    def execute(
+        self,
+        tool_call: Dict[str, Any],
+        context: Optional[CompactionContext] = None
+    ) -> Tuple[ToolMessage, Dict[str, Any]]:
+        """执行单个工具调用，返回工具消息与耗时记录"""
+        output, status, timing = self._run(tool_call)
+        return self._message(tool_call, output, status, context), timing
+
+    def _timed_out(self, tool_call: Dict[str, Any], seconds: float) -> Tuple[str, str, Dict[str, Any]]:
+        name = tool_call["name"]
+        # 超时的调用在后台结束时仍会按 tool 记录实际耗时，这里单独计数
+        self.metrics.record(TIMEOUT, name, seconds)
+        output = f"Error: {name} timed out after {self.timeout:g}s"
+        return output, "error", {**timing_entry(TOOL, name, seconds), "timed_out": True}
+
+    def _batches(self, tool_calls: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        return [tool_calls[i:i + self.max_workers] for i in range(0, len(tool_calls), self.max_workers)]
+
+    def _inline(self, tool_calls: List[Dict[str, Any]]) -> bool:
+        """单个调用且不限时时无需线程"""
+        return len(tool_calls) == 1 and self.timeout is None
+
+    def _gather(self, tool_calls: List[Dict[str, Any]]) -> List[Tuple[Any, str, Dict[str, Any]]]:
+        """在本批专用的线程池中同时执行一批工具调用，共用从开始执行时计算的截止时间"""
+        if self._inline(tool_calls):
+            return [self._run(tool_calls[0])]
+        pool = ThreadPoolExecutor(len(tool_calls), thread_name_prefix="tool")
+        try:
+            start = time.perf_counter()
+            futures = [pool.submit(self._run, tool_call) for tool_call in tool_calls]
+            outcomes = []
+            for tool_call, future in zip(tool_calls, futures):
+                remaining = None
+                if self.timeout is not None:
+                    remaining = max(0.0, self.timeout - (time.perf_counter() - start))
+                try:
+                    outcomes.append(future.result(timeout=remaining))
+                except FutureTimeoutError:
+                    outcomes.append(self._timed_out(tool_call, time.perf_counter() - start))
+            return outcomes
+        finally:
+            # 不等待超时的调用，其线程结束后自行退出
+            pool.shutdown(wait=False)
+
+    async def _agather(self, tool_calls: List[Dict[str, Any]]) -> List[Tuple[Any, str, Dict[str, Any]]]:
+        """_gather 的异步版本：事件循环只等待结果"""
+        loop = asyncio.get_running_loop()
+        pool = ThreadPoolExecutor(len(tool_calls), thread_name_prefix="tool")
+        try:
+            start = time.perf_counter()
+            futures = [loop.run_in_executor(pool, self._run, tool_call) for tool_call in tool_calls]
+            await asyncio.wait(futures, timeout=self.timeout)
+            outcomes = []
+            for tool_call, future in zip(tool_calls, futures):
+                if future.done():
+                    outcomes.append(future.result())
+                else:
+                    future.cancel()
+                    outcomes.append(self._timed_out(tool_call, time.perf_counter() - start))
+            return outcomes
+        finally:
+            pool.shutdown(wait=False)
+
+    def dispatch(
+        self,
+        tool_calls: List[Dict[str, Any]],
+        context: Optional[CompactionContext] = None
+    ) -> List[Tuple[ToolMessage, Dict[str, Any]]]:
+        """执行一组工具调用，结果与 tool_calls 顺序一致"""
+        outcomes = [outcome for batch in self._batches(tool_calls) for outcome in self._gather(batch)]
+        # 按原顺序序列化，去重与预算分配的结果与执行先后无关
+        context = context or CompactionContext()
+        return [
+            (self._message(tool_call, output, status, context), timing)
+            for tool_call, (output, status, timing) in zip(tool_calls, outcomes)
+        ]
+
+    async def adispatch(
+        self,
+        tool_calls: List[Dict[str, Any]],
+        context: Optional[CompactionContext] = None
+    ) -> List[Tuple[ToolMessage, Dict[str, Any]]]:
+        """dispatch 的异步版本：工具仍在线程池中执行，事件循环只等待结果"""
+        outcomes = []
+        for batch in self._batches(tool_calls):
+            outcomes.extend(await self._agather(batch))
+        context = context or CompactionContext()
+        return [
+            (self._message(tool_call, output, status, context), timing)
+            for tool_call, (output, status, timing) in zip(tool_calls, outcomes)
+        ]
+
+    def _context(self, state: Any) -> CompactionContext:
+        budget = None
+        if self.token_budget is not None:
+            budget = self.token_budget - getattr(state, "tool_tokens", 0)
+        return CompactionContext(getattr(state, "sent_books", ()), budget)
+
+    @staticmethod
+    def _update(results: List[Tuple[ToolMessage, Dict[str, Any]]], context: CompactionContext) -> Dict[str, Any]:
+        return {
+            "messages": [message for message, _ in results],
+            "timings": [timing for _, timing in results],
+            "sent_books": context.new_titles,
+            "tool_tokens": context.used_tokens
+        }
+
+    def __call__(self, state: Any) -> Dict[str, Any]:
+        """图节点入口：执行最后一条 AI 消息中的全部工具调用"""
+        context = self._context(state)
+        results = self.dispatch(getattr(state.messages[-1], "tool_calls", None) or [], context)
+        return self._update(results, context)
+
+    async def acall(self, state: Any) -> Dict[str, Any]:
+        """异步图节点入口"""
+        context = self._context(state)
+        results = await self.adispatch(getattr(state.messages[-1], "tool_calls", None) or [], context)
+        return self._update(results, context)
@@ -0,0 +1,342 @@
+"""
+图书内容向量索引
+
+离线、无需网络的内容相似度检索：
+- 向量化：字符 n-gram 特征哈希到固定维度（带符号哈希），按 TF-IDF 加权后 L2 归一化
+- 存储：向量矩阵保存为带版本后缀的 .npy 文件，加载时以 mmap 方式映射，多个进程共享页缓存；
+  重新保存时写入新文件并原子替换元数据，不影响正在映射旧文件的进程
+- 检索：IVF 倒排聚类（球面 k-means），查询时只扫描与查询最接近的若干个簇
+"""
+import json
+import math
+import os
+import re
+import uuid
+import zlib
+from typing import Dict, Any, List, Optional, Callable, Iterable, Mapping, Tuple
+
+import numpy as np
+
+
+_SPACES = re.compile(r"\s+")
+
+# 参与向量化的字段及权重：简介为主，书名与类型保证无简介的图书也有向量
+DEFAULT_FIELD_WEIGHTS = {"description": 1.0, "title": 0.6, "genre": 0.4}
+# 向量索引依赖的图书字段，只有这些字段变化时索引才需要重建
+CONTENT_BOOK_FIELDS = tuple(DEFAULT_FIELD_WEIGHTS)
+
+# 目录规模不超过该值时直接精确扫描，不建聚类
+EXACT_SEARCH_THRESHOLD = 4096
+
+_META_FILE = "meta.json"
+
+# 加载时数组文件被并发保存删除后的最多尝试次数
+_LOAD_ATTEMPTS = 3
+
+_ARRAY_NAMES = ("vectors", "idf", "centroids", "list_ids", "list_offsets")
+
+
+def _read_meta(path: str) -> Dict[str, Any]:
+    with open(os.path.join(path, _META_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _array_files(meta: Mapping[str, Any]) -> Dict[str, str]:
+    """元数据引用的数组文件名；旧版本元数据没有 files 字段，使用固定文件名"""
+    if "files" in meta:
+        return dict(meta["files"])
+    names = _ARRAY_NAMES if meta.get("has_ivf") else _ARRAY_NAMES[:2]
+    return {name: f"{name}.npy" for name in names}
+
+
+def _char_ngrams(text: str, ngram_range: Tuple[int, int]) -> List[str]:
+    text = _SPACES.sub(" ", text.casefold()).strip()
+    low, high = ngram_range
+    grams = []
+    for n in range(low, high + 1):
+        grams.extend(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams
+
+
+class HashedNgramVectorizer:
+    """字符 n-gram 特征哈希向量化器
+
+    使用 crc32 作为哈希函数，跨进程、跨机器结果一致；哈希值最高位决定特征符号，
+    冲突的特征互相抵消而不是持续累加。
+    """
+
+    def __init__(
+        self,
+        dim: int = 512,
+        ngram_range: Tuple[int, int] = (1, 2),
+        field_weights: Optional[Dict[str, float]] = None
+    ):
+        self.dim = dim
+        self.ngram_range = tuple(ngram_range)
+        self.field_weights = field_weights or dict(DEFAULT_FIELD_WEIGHTS)
+        self.idf = np.ones(dim, dtype=np.float32)
+
+    def term_frequencies(self, book: Mapping[str, Any]) -> np.ndarray:
+        """未加权的哈希词频向量（对数平滑）"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for field, weight in self.field_weights.items():
+            value = book.get(field)
+            if not value:
+                continue
+            for gram in _char_ngrams(str(value), self.ngram_range):
+                code = zlib.crc32(gram.encode("utf-8"))
+                vector[code % self.dim] += weight if code & 0x80000000 else -weight
+        return np.sign(vector) * np.log1p(np.abs(vector))
+
+    def transform_text(self, text: str) -> np.ndarray:
+        """把自由文本（例如一段描述）转换为归一化查询向量"""
+        return self.finalize(self.term_frequencies({"description": text}))
+
+    def finalize(self, frequencies: np.ndarray) -> np.ndarray:
+        """乘以 IDF 并按行 L2 归一化（支持单个向量或矩阵）"""
+        weighted = frequencies * self.idf
+        norms = np.linalg.norm(weighted, axis=-1, keepdims=True)
+        return weighted / np.where(norms > 0, norms, 1.0)
+
+
+def _spherical_kmeans(vectors: np.ndarray, clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """球面 k-means：以内积为相似度，返回归一化的簇中心"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        empty = norms[:, 0] == 0
+        # 空簇重新随机取一个样本作为中心
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        norms[empty] = 1.0
+        centroids = sums / norms
+    return centroids.astype(np.float32)
+
+
+class BookEmbeddingIndex:
+    """图书内容向量的 IVF 近似最近邻索引"""
+
+    def __init__(
+        self,
+        vectorizer: HashedNgramVectorizer,
+        titles: List[str],
+        vectors: np.ndarray,
+        centroids: Optional[np.ndarray] = None,
+        list_ids: Optional[np.ndarray] = None,
+        list_offsets: Optional[np.ndarray] = None,
+        fingerprint: str = ""
+    ):
+        self.vectorizer = vectorizer
+        self.titles = titles
+        self.vectors = vectors
+        self.centroids = centroids
+        self.list_ids = list_ids
+        self.list_offsets = list_offsets
+        self.fingerprint = fingerprint
+        self._positions = {title: position for position, title in enumerate(titles)}
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    @property
+    def is_exact(self) -> bool:
+        return self.centroids is None or len(self.centroids) <= 1
+
+    @classmethod
+    def build(
+        cls,
+        books: Iterable[Mapping[str, Any]],
+        dim: int = 512,
+        chunk_size: int = 4096,
+        fingerprint: str = "",
+        exact_threshold: int = EXACT_SEARCH_THRESHOLD
+    ) -> "BookEmbeddingIndex":
+        """单次遍历图书构建索引：先累计哈希词频与文档频率，再统一乘 IDF 并归一化"""
+        vectorizer = HashedNgramVectorizer(dim)
+        titles: List[str] = []
+        chunks: List[np.ndarray] = []
+        chunk = np.zeros((chunk_size, dim), dtype=np.float32)
+        filled = 0
+        doc_freq = np.zeros(dim, dtype=np.int64)
+        for book in books:
+            frequencies = vectorizer.term_frequencies(book)
+            doc_freq += frequencies != 0
+            chunk[filled] = frequencies
+            filled += 1
+            titles.append(book["title"])
+            if filled == chunk_size:
+                chunks.append(chunk)
+                chunk = np.zeros((chunk_size, dim), dtype=np.float32)
+                filled = 0
+        chunks.append(chunk[:filled])
+        vectors = np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+
+        total = len(titles)
+        vectorizer.idf = (np.log((1.0 + total) / (1.0 + doc_freq)) + 1.0).astype(np.float32)
+        for start in range(0, total, chunk_size):
+            vectors[start:start + chunk_size] = vectorizer.finalize(vectors[start:start + chunk_size])
+
+        if total <= exact_threshold:
+            return cls(vectorizer, titles, vectors, fingerprint=fingerprint)
+
+        # 簇数取 √n；k-means 在抽样上训练，再把全部向量分配到最近的簇
+        clusters = int(math.sqrt(total))
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(total, min(total, clusters * 64), replace=False)]
+        centroids = _spherical_kmeans(sample, clusters)
+        assignment = np.empty(total, dtype=np.int32)
+        for start in range(0, total, chunk_size):
+            assignment[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ centroids.T, axis=1)
+        list_ids = np.argsort(assignment, kind="stable").astype(np.int32)
+        list_offsets = np.zeros(clusters + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=clusters), out=list_offsets[1:])
+        return cls(vectorizer, titles, vectors, centroids, list_ids, list_offsets, fingerprint)
+
+    def save(self, path: str) -> None:
+        """保存到目录：数组写入带版本后缀的新 .npy 文件，最后原子替换元数据
+
+        其他进程可能正以 mmap 映射旧文件，因此从不原地覆盖数组文件；
+        元数据替换后才删除上一版本的数组文件，中途失败时目录中仍是旧的有效索引。
+        """
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, _META_FILE)
+        previous = _read_meta(path) if os.path.exists(meta_path) else None
+        arrays = {
+            "vectors": self.vectors,
+            "idf": self.vectorizer.idf,
+            "centroids": self.centroids,
+            "list_ids": self.list_ids,
+            "list_offsets": self.list_offsets,
+        }
+        tag = uuid.uuid4().hex[:12]
+        files = {}
+        for name, value in arrays.items():
+            if value is not None:
+                files[name] = f"{name}.{tag}.npy"
+                np.save(os.path.join(path, files[name]), value)
+        meta = {
+            "dim": self.vectorizer.dim,
+            "ngram_range": list(self.vectorizer.ngram_range),
+            "field_weights": self.vectorizer.field_weights,
+            "titles": self.titles,
+            "has_ivf": self.centroids is not None,
+            "fingerprint": self.fingerprint,
+            "files": files,
+        }
+        tmp_path = f"{meta_path}.{tag}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+        if previous is not None:
+            for filename in _array_files(previous).values():
+                try:
+                    os.remove(os.path.join(path, filename))
+                except OSError:
+                    # 已被并发保存的进程删除，或仍被映射而无法删除（Windows）
+                    pass
+
+    @classmethod
+    def load(cls, path: str) -> "BookEmbeddingIndex":
+        """加载索引，向量矩阵以只读 mmap 方式映射"""
+        for attempt in range(_LOAD_ATTEMPTS):
+            meta = _read_meta(path)
+            files = _array_files(meta)
+            try:
+                vectorizer = HashedNgramVectorizer(meta["dim"], tuple(meta["ngram_range"]), meta["field_weights"])
+                vectorizer.idf = np.load(os.path.join(path, files["idf"]))
+                vectors = np.load(os.path.join(path, files["vectors"]), mmap_mode="r")
+                ivf = [None, None, None]
+                if meta["has_ivf"]:
+                    ivf = [np.load(os.path.join(path, files[name])) for name in ("centroids", "list_ids", "list_offsets")]
+            except FileNotFoundError:
+                # 读取元数据后其他进程保存了新版本并删除了旧文件，重新读取元数据
+                if attempt == _LOAD_ATTEMPTS - 1:
+                    raise
+                continue
+            return cls(vectorizer, meta["titles"], vectors, *ivf, fingerprint=meta.get("fingerprint", ""))
+
+    def search_vector(
+        self,
+        query: np.ndarray,
+        limit: int = 5,
+        nprobe: int = 8,
+        exclude: Iterable[int] = ()
+    ) -> List[Tuple[int, float]]:
+        """返回与查询向量内积最大的 (位置, 相似度) 列表
+
+        IVF 模式下只扫描与查询最接近的 nprobe 个簇，属于近似检索。
+        """
+        if limit <= 0 or not self.titles or not np.any(query):
+            return []
+        if self.is_exact:
+            candidates = np.arange(len(self.titles))
+        else:
+            probes = min(nprobe, len(self.centroids))
+            nearest = np.argpartition(-(self.centroids @ query), probes - 1)[:probes]
+            candidates = np.concatenate([
+                self.list_ids[self.list_offsets[cluster]:self.list_offsets[cluster + 1]]
+                for cluster in nearest
+            ])
+        excluded = list(exclude)
+        if excluded:
+            candidates = candidates[~np.isin(candidates, excluded)]
+        if candidates.size == 0:
+            return []
+        # 按行号顺序读取，mmap 时顺序访问页面
+        candidates = np.sort(candidates)
+        scores = np.asarray(self.vectors[candidates] @ query)
+        if candidates.size > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            candidates, scores = candidates[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return [(int(candidates[i]), float(scores[i])) for i in order]
+
+    def search_text(self, text: str, limit: int = 5, nprobe: int = 8) -> List[Tuple[str, float]]:
+        """按一段描述文本检索内容相近的图书"""
+        hits = self.search_vector(self.vectorizer.transform_text(text), limit, nprobe)
+        return [(self.titles[position], score) for position, score in hits]
+
+    def similar_to(self, title: str, limit: int = 5, nprobe: int = 8) -> Optional[List[Tuple[str, float]]]:
+        """检索与目录中某本书内容相近的图书（不含自身）；书名不在索引中时返回 None"""
+        position = self._positions.get(title)
+        if position is None:
+            return None
+        hits = self.search_vector(np.asarray(self.vectors[position]), limit, nprobe, exclude=[position])
+        return [(self.titles[other], score) for other, score in hits]
+
+
+def content_fields_changed(old: Mapping[str, Any], new: Mapping[str, Any]) -> bool:
+    """更新前后的图书记录是否改变了向量索引依赖的字段"""
+    return any(old.get(field) != new.get(field) for field in CONTENT_BOOK_FIELDS)
+
+
+def catalog_fingerprint(books: Iterable[Mapping[str, Any]]) -> str:
+    """目录内容指纹（图书数量与各字段的 crc32），用于判断持久化索引是否过期"""
+    checksum = 0
+    count = 0
+    for book in books:
+        text = "\x1f".join(str(book.get(field) or "") for field in ("title", *DEFAULT_FIELD_WEIGHTS))
+        checksum = zlib.crc32(text.encode("utf-8"), checksum)
+        count += 1
+    return f"{count}:{checksum:08x}"
+
+
+def load_or_build_embedding_index(
+    iter_books: Callable[[], Iterable[Mapping[str, Any]]],
+    path: str = "",
+    dim: int = 512
+) -> BookEmbeddingIndex:
+    """构建内容向量索引；指定 path 时优先加载与当前目录指纹一致的已保存索引，否则重建并保存"""
+    if not path:
+        return BookEmbeddingIndex.build(iter_books(), dim)
+    fingerprint = catalog_fingerprint(iter_books())
+    if os.path.exists(os.path.join(path, _META_FILE)):
+        index = BookEmbeddingIndex.load(path)
+        if index.fingerprint == fingerprint and index.vectorizer.dim == dim:
+            return index
+    index = BookEmbeddingIndex.build(iter_books(), dim, fingerprint=fingerprint)
+    index.save(path)
+    return BookEmbeddingIndex.load(path)
@@ -0,0 +1,155 @@
+"""
+实体抽取自动机
+
+把目录中的作者、类型、书名编译为一个 Aho-Corasick 多模式自动机（不区分大小写），
+一次扫描文本即可找出全部命中，耗时与文本长度及命中数有关，与实体数量无关。
+命中之间重叠时按最长匹配保留（例如书名中包含的类型词不再单独计入）。
+目录变化时可增量加入、移除模式：移除只清空节点上的输出；新模式先放入一个小的增量自动机，
+只为增量部分计算链接，增量超过主自动机规模的平方根时才合并进主自动机并整体重新计算一次。
+"""
+from collections import deque
+from typing import Dict, List, Optional, Set, Tuple, Iterable, Iterator
+
+
+# 实体类型
+AUTHOR = "author"
+GENRE = "genre"
+TITLE = "title"
+
+
+class EntityMatcher:
+    """Aho-Corasick 多模式匹配自动机
+
+    节点以整数编号：goto 为字符转移表，fail 为失败链接，
+    outputs 为以该节点结尾的模式（实体类型与原始名称），
+    dict_link 指向沿失败链接最近的一个有输出的节点，用于列出全部命中。
+    _delta 为尚未合并的增量自动机，扫描时与主自动机的命中合并。
+    """
+
+    def __init__(self, entities: Iterable[Tuple[str, str]] = ()):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.depth: List[int] = [0]
+        self.outputs: List[Set[Tuple[str, str]]] = [set()]
+        self.dict_link: List[int] = [0]
+        self._delta: Optional["EntityMatcher"] = None
+        self._add(list(entities))
+
+    def __len__(self) -> int:
+        count = sum(len(items) for items in self.outputs)
+        return count + (len(self._delta) if self._delta is not None else 0)
+
+    def _insert(self, pattern: str) -> int:
+        node = 0
+        for char in pattern:
+            child = self.goto[node].get(char)
+            if child is None:
+                child = len(self.goto)
+                self.goto[node][char] = child
+                self.goto.append({})
+                self.fail.append(0)
+                self.depth.append(self.depth[node] + 1)
+                self.outputs.append(set())
+                self.dict_link.append(0)
+            node = child
+        return node
+
+    def _find(self, pattern: str) -> int:
+        node = 0
+        for char in pattern:
+            node = self.goto[node].get(char, -1)
+            if node < 0:
+                break
+        return node
+
+    def _link(self) -> None:
+        """按广度优先重新计算失败链接与输出链接"""
+        queue = deque()
+        for child in self.goto[0].values():
+            self.fail[child] = 0
+            self.dict_link[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                state = self.fail[node]
+                while state and char not in self.goto[state]:
+                    state = self.fail[state]
+                target = self.goto[state].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                fallback = self.fail[child]
+                self.dict_link[child] = fallback if self.outputs[fallback] else self.dict_link[fallback]
+                queue.append(child)
+
+    def _add(self, entities: List[Tuple[str, str]]) -> None:
+        """插入模式后整体重新计算链接"""
+        changed = False
+        for kind, name in entities:
+            if name:
+                self.outputs[self._insert(name.lower())].add((kind, name))
+                changed = True
+        if changed:
+            self._link()
+
+    def _contains(self, kind: str, name: str) -> bool:
+        node = self._find(name.lower()) if name else -1
+        return node > 0 and (kind, name) in self.outputs[node]
+
+    def update(self, added: Iterable[Tuple[str, str]] = (), removed: Iterable[Tuple[str, str]] = ()) -> None:
+        """增量加入、移除实体（实体类型, 名称）
+
+        移除只清空输出、不删节点，链接仍然有效（空输出的节点在扫描时直接跳过）；
+        加入的实体进入增量自动机，只重新计算增量部分的链接。
+        """
+        for kind, name in removed:
+            for matcher in (self, self._delta):
+                if matcher is not None and matcher._contains(kind, name):
+                    matcher.outputs[matcher._find(name.lower())].discard((kind, name))
+        added = [(kind, name) for kind, name in added if name and not self._contains(kind, name)]
+        if not added:
+            return
+        delta_size = (len(self._delta.goto) if self._delta is not None else 0) + sum(len(name) for _, name in added)
+        if delta_size * delta_size > len(self.goto):
+            # 增量已不小于主自动机规模的平方根：合并进主自动机，整体重新计算一次
+            if self._delta is not None:
+                added.extend(item for items in self._delta.outputs for item in items)
+                self._delta = None
+            self._add(added)
+            return
+        if self._delta is None:
+            self._delta = EntityMatcher()
+        self._delta._add(added)
+
+    def find_all(self, text: str) -> Iterator[Tuple[int, int, str, str]]:
+        """一次扫描列出全部命中 (起点, 终点, 实体类型, 名称)，位置基于小写后的文本"""
+        lowered = text.lower()
+        yield from self._scan(lowered)
+        if self._delta is not None:
+            yield from self._delta._scan(lowered)
+
+    def _scan(self, text: str) -> Iterator[Tuple[int, int, str, str]]:
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            match = node if self.outputs[node] else self.dict_link[node]
+            while match:
+                start = end - self.depth[match]
+                for kind, name in self.outputs[match]:
+                    yield start, end, kind, name
+                match = self.dict_link[match]
+
+    def extract(self, text: str) -> List[Tuple[str, str]]:
+        """按最长匹配抽取实体：重叠的命中中保留较长者，同一片段可同时属于多种实体"""
+        spans: Dict[Tuple[int, int], List[Tuple[str, str]]] = {}
+        for start, end, kind, name in self.find_all(text):
+            spans.setdefault((start, end), []).append((kind, name))
+        taken: List[Tuple[int, int]] = []
+        entities = []
+        for start, end in sorted(spans, key=lambda span: (span[0] - span[1], span[0])):
+            if any(start < other_end and other_start < end for other_start, other_end in taken):
+                continue
+            taken.append((start, end))
+            entities.extend(spans[(start, end)])
+        return entities
@@ -0,0 +1,248 @@
+"""
+知识图谱编译
+
+把 BookDatabase 的图书记录与 knowledge_graph 字典编译为整数节点 ID 的邻接结构：
+节点分为图书、作者、类型、风格四类，每种边类型一份 CSR（indptr/indices）邻接数组，
+多跳遍历只需数组切片，无需反复扫描列表或调用 get_books_by_genre。
+"""
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+import numpy as np
+
+
+# 节点类型
+BOOK = "book"
+AUTHOR = "author"
+GENRE = "genre"
+STYLE = "style"
+
+# 边类型（wrote、belongs_to、same_style 双向存储，similar_genre 按知识图谱方向存储）
+WROTE = "wrote"                  # 作者 <-> 图书
+BELONGS_TO = "belongs_to"        # 图书 <-> 类型
+SIMILAR_GENRE = "similar_genre"  # 类型 -> 相似类型
+SAME_STYLE = "same_style"        # 作者 <-> 风格节点（经风格节点两跳即同风格作者）
+
+EDGE_TYPES = (WROTE, BELONGS_TO, SIMILAR_GENRE, SAME_STYLE)
+
+# 随机游走时各类型边的默认权重：类型节点连接大量图书，权重较低以免稀释同作者关联
+DEFAULT_WALK_WEIGHTS = {WROTE: 1.0, BELONGS_TO: 0.5, SIMILAR_GENRE: 0.3, SAME_STYLE: 0.5}
+
+
+class CompiledKnowledgeGraph:
+    """CSR 邻接结构的知识图谱"""
+
+    def __init__(self):
+        self.node_ids: Dict[Tuple[str, str], int] = {}
+        self.node_kinds: List[str] = []
+        self.node_names: List[str] = []
+        self.csr: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._edges: Dict[str, List[Tuple[int, int]]] = {edge_type: [] for edge_type in EDGE_TYPES}
+        self._transitions: Dict[Tuple[Tuple[str, float], ...], Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self.node_kinds)
+
+    @property
+    def edge_count(self) -> int:
+        return sum(len(indices) for _, indices in self.csr.values())
+
+    def node(self, kind: str, name: Optional[str]) -> Optional[int]:
+        """按类型和名称查找节点 ID"""
+        if not name:
+            return None
+        return self.node_ids.get((kind, name))
+
+    def _add_node(self, kind: str, name: str) -> int:
+        key = (kind, name)
+        node_id = self.node_ids.get(key)
+        if node_id is None:
+            node_id = len(self.node_kinds)
+            self.node_ids[key] = node_id
+            self.node_kinds.append(kind)
+            self.node_names.append(name)
+        return node_id
+
+    def _add_edge(self, edge_type: str, source: int, target: int, bidirectional: bool = True) -> None:
+        self._edges[edge_type].append((source, target))
+        if bidirectional:
+            self._edges[edge_type].append((target, source))
+
+    def _finalize(self) -> None:
+        """把边列表压缩为 CSR：同一源节点的邻居按加入顺序排列，重复边去除"""
+        size = len(self.node_kinds)
+        for edge_type, edges in self._edges.items():
+            unique_edges = list(dict.fromkeys(edges))
+            if unique_edges:
+                pairs = np.array(unique_edges, dtype=np.int32)
+                order = np.argsort(pairs[:, 0], kind="stable")
+                sources = pairs[order, 0]
+                indices = pairs[order, 1].copy()
+            else:
+                sources = np.zeros(0, dtype=np.int32)
+                indices = np.zeros(0, dtype=np.int32)
+            indptr = np.zeros(size + 1, dtype=np.int64)
+            np.cumsum(np.bincount(sources, minlength=size), out=indptr[1:])
+            self.csr[edge_type] = (indptr, indices)
+        self._edges = {}
+
+    def neighbors(self, node_id: Optional[int], edge_type: str) -> np.ndarray:
+        """返回节点沿指定类型边的邻居 ID 数组"""
+        if node_id is None:
+            return np.zeros(0, dtype=np.int32)
+        indptr, indices = self.csr[edge_type]
+        return indices[indptr[node_id]:indptr[node_id + 1]]
+
+    def expand(self, node_ids: Iterable[int], path: Iterable[str]) -> np.ndarray:
+        """沿边类型序列做多跳扩展，返回去重后的终点（保持首次出现顺序）"""
+        frontier = np.asarray(list(node_ids), dtype=np.int32)
+        for edge_type in path:
+            indptr, indices = self.csr[edge_type]
+            if frontier.size == 0:
+                break
+            parts = [indices[indptr[node]:indptr[node + 1]] for node in frontier]
+            merged = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int32)
+            _, first = np.unique(merged, return_index=True)
+            frontier = merged[np.sort(first)]
+        return frontier
+
+    def names(self, node_ids: Iterable[int]) -> List[str]:
+        return [self.node_names[node_id] for node_id in node_ids]
+
+    def _transition(self, weights: Dict[str, float]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """按边类型权重构造行归一化的稀疏转移矩阵（COO 三元组）及悬挂节点掩码"""
+        key = tuple(sorted(weights.items()))
+        cached = self._transitions.get(key)
+        if cached is not None:
+            return cached
+        size = len(self.node_kinds)
+        sources, targets, values = [], [], []
+        for edge_type, weight in weights.items():
+            if weight <= 0 or edge_type not in self.csr:
+                continue
+            indptr, indices = self.csr[edge_type]
+            sources.append(np.repeat(np.arange(size, dtype=np.int32), np.diff(indptr)))
+            targets.append(indices)
+            values.append(np.full(len(indices), weight, dtype=np.float64))
+        if sources:
+            source = np.concatenate(sources)
+            target = np.concatenate(targets)
+            value = np.concatenate(values)
+        else:
+            source = target = np.zeros(0, dtype=np.int32)
+            value = np.zeros(0, dtype=np.float64)
+        out_weight = np.bincount(source, weights=value, minlength=size)
+        value = value / out_weight[source] if len(value) else value
+        dangling = out_weight == 0
+        cached = (source, target, value, dangling)
+        self._transitions[key] = cached
+        return cached
+
+    def personalized_pagerank(
+        self,
+        seeds: Iterable[int],
+        alpha: float = 0.85,
+        weights: Optional[Dict[str, float]] = None,
+        max_iter: int = 50,
+        tol: float = 1e-8
+    ) -> np.ndarray:
+        """从种子节点出发的个性化 PageRank（带重启随机游走）
+
+        每轮迭代是一次稀疏矩阵-向量乘（np.bincount 按目标节点累加），
+        悬挂节点的概率质量回到种子节点。返回所有节点的得分数组。
+        """
+        size = len(self.node_kinds)
+        seed_ids = [node_id for node_id in dict.fromkeys(seeds) if node_id is not None]
+        if not seed_ids or size == 0:
+            return np.zeros(size, dtype=np.float64)
+        source, target, value, dangling = self._transition(weights or DEFAULT_WALK_WEIGHTS)
+        restart = np.zeros(size, dtype=np.float64)
+        restart[seed_ids] = 1.0 / len(seed_ids)
+        scores = restart.copy()
+        for _ in range(max_iter):
+            walked = np.bincount(target, weights=scores[source] * value, minlength=size)
+            leaked = scores[dangling].sum()
+            updated = alpha * walked + (alpha * leaked + (1.0 - alpha)) * restart
+            converged = np.abs(updated - scores).sum() < tol
+            scores = updated
+            if converged:
+                break
+        return scores
+
+    def explain(self, seeds: Iterable[int], target: int) -> List[int]:
+        """找出种子图书到目标图书的一条典型关联路径（节点 ID 列表，种子在前）
+
+        依次尝试同作者、同类型、相似类型、同风格四种模式，
+        只查看两端图书的少量邻居，不在类型等大节点上展开；均不满足时返回空列表。
+        """
+        target_authors = self.neighbors(target, WROTE).tolist()
+        target_genres = self.neighbors(target, BELONGS_TO).tolist()
+        seeds = [seed for seed in seeds if seed is not None]
+        for seed in seeds:
+            for author in self.neighbors(seed, WROTE).tolist():
+                if author in target_authors:
+                    return [seed, author, target]
+        for seed in seeds:
+            for genre in self.neighbors(seed, BELONGS_TO).tolist():
+                if genre in target_genres:
+                    return [seed, genre, target]
+        for seed in seeds:
+            for genre in self.neighbors(seed, BELONGS_TO).tolist():
+                for similar in self.neighbors(genre, SIMILAR_GENRE).tolist():
+                    if similar in target_genres:
+                        return [seed, genre, similar, target]
+        target_styles = {
+            style: author
+            for author in target_authors
+            for style in self.neighbors(author, SAME_STYLE).tolist()
+        }
+        for seed in seeds:
+            for author in self.neighbors(seed, WROTE).tolist():
+                for style in self.neighbors(author, SAME_STYLE).tolist():
+                    if style in target_styles:
+                        return [seed, author, style, target_styles[style], target]
+        return []
+
+
+# 编译时用到的图书字段：只有这些字段变化（或增删图书、修改知识图谱）时才需要重新编译
+GRAPH_BOOK_FIELDS = ("title", "author", "genre")
+
+
+def graph_fields_changed(old: Dict[str, Any], new: Dict[str, Any]) -> bool:
+    """更新前后的图书记录是否改变了图结构"""
+    return any(old.get(field) != new.get(field) for field in GRAPH_BOOK_FIELDS)
+
+
+def compile_knowledge_graph(books: Iterable[Dict[str, Any]], knowledge_graph: Dict[str, Any]) -> CompiledKnowledgeGraph:
+    """由图书记录与知识图谱字典编译邻接结构
+
+    图书节点以书名为键；作者-图书、图书-类型边来自图书记录，
+    作者风格与相似类型来自知识图谱字典。
+    """
+    graph = CompiledKnowledgeGraph()
+    for book in books:
+        title = book.get("title")
+        if not title:
+            continue
+        book_node = graph._add_node(BOOK, title)
+        author = book.get("author")
+        genre = book.get("genre")
+        if author:
+            graph._add_edge(WROTE, graph._add_node(AUTHOR, author), book_node)
+        if genre:
+            graph._add_edge(BELONGS_TO, book_node, graph._add_node(GENRE, genre))
+
+    authors = knowledge_graph.get("authors", {})
+    for author in authors:
+        node = authors[author]
+        style = node.get("style")
+        if style:
+            graph._add_edge(SAME_STYLE, graph._add_node(AUTHOR, author), graph._add_node(STYLE, style))
+
+    genres = knowledge_graph.get("genres", {})
+    for genre in genres:
+        genre_node = graph._add_node(GENRE, genre)
+        for similar_genre in genres[genre].get("similar_genres", []):
+            graph._add_edge(SIMILAR_GENRE, genre_node, graph._add_node(GENRE, similar_genre), bidirectional=False)
+
+    graph._finalize()
+    return graph
@@ -0,0 +1,209 @@
+"""
+图书全文检索索引
+
+基于倒排索引的 BM25 检索，默认使用中文友好的字符 n-gram 分词，
+也可传入自定义分词器（例如 jieba.lcut）。
+"""
+import heapq
+import math
+import re
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+
+# 分词器：输入文本，输出词项列表
+Tokenizer = Callable[[str], List[str]]
+
+_CJK_RUN = re.compile(r"[㐀-鿿豈-﫿]+")
+_WORD_RUN = re.compile(r"[0-9a-z]+")
+
+
+def ngram_tokenize(text: str) -> List[str]:
+    """中文按单字与二元组切分，英文与数字按单词切分"""
+    if not text:
+        return []
+    text = text.casefold()
+    tokens = _WORD_RUN.findall(text)
+    for run in _CJK_RUN.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def ngram_query_terms(text: str) -> List[str]:
+    """查询端分词：中文片段只取二元组（单字片段取单字），避免单字匹配过宽"""
+    if not text:
+        return []
+    text = text.casefold()
+    terms = _WORD_RUN.findall(text)
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return list(dict.fromkeys(terms))
+
+
+def _length_bucket(length: float) -> int:
+    """文档长度分桶（每倍长度 8 档），用于估计分数上界"""
+    return int(math.log2(max(length, 1.0)) * 8)
+
+
+def _bucket_min_length(bucket: int) -> float:
+    return 2.0 ** (bucket / 8.0)
+
+
+class BookSearchIndex:
+    """图书倒排索引（BM25 排序）
+
+    各字段按权重累加词频（标题、作者、类型权重更高），
+    查询时优先要求命中全部词项，无结果时退化为命中任一词项。
+
+    每个词项的倒排表另按 (词频, 文档长度分桶) 分层，查询时按层的分数上界
+    从高到低处理，当第 limit 名的分数已超过剩余层的上界时提前结束，
+    常见词项无需对全部命中文档打分。
+    """
+
+    DEFAULT_FIELD_WEIGHTS = {"title": 3.0, "author": 2.0, "genre": 2.0, "description": 1.0}
+
+    def __init__(
+        self,
+        tokenizer: Optional[Tokenizer] = None,
+        query_tokenizer: Optional[Tokenizer] = None,
+        field_weights: Optional[Dict[str, float]] = None,
+        k1: float = 1.2,
+        b: float = 0.75
+    ):
+        self.tokenizer = tokenizer or ngram_tokenize
+        # 自定义分词器未指定查询分词时，查询与文档使用同一分词器
+        if query_tokenizer is not None:
+            self.query_tokenizer = query_tokenizer
+        elif tokenizer is None:
+            self.query_tokenizer = ngram_query_terms
+        else:
+            self.query_tokenizer = tokenizer
+        self.field_weights = field_weights or dict(self.DEFAULT_FIELD_WEIGHTS)
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._tiers: Dict[str, Dict[Tuple[float, int], Dict[int, None]]] = {}
+        self._doc_lengths: Dict[int, float] = {}
+        self._total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def _weighted_terms(self, book: Dict[str, Any]) -> Dict[str, float]:
+        weighted: Dict[str, float] = {}
+        for field, weight in self.field_weights.items():
+            value = book.get(field)
+            if not value:
+                continue
+            for term in self.tokenizer(str(value)):
+                weighted[term] = weighted.get(term, 0.0) + weight
+        return weighted
+
+    def add(self, doc_id: int, book: Dict[str, Any]) -> None:
+        """加入一本图书"""
+        weighted = self._weighted_terms(book)
+        length = sum(weighted.values())
+        bucket = _length_bucket(length)
+        for term, tf in weighted.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+            self._tiers.setdefault(term, {}).setdefault((tf, bucket), {})[doc_id] = None
+        self._doc_lengths[doc_id] = length
+        self._total_length += length
+
+    def remove(self, doc_id: int, book: Dict[str, Any]) -> None:
+        """移除一本图书（book 须为加入时的字段值）"""
+        length = self._doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        bucket = _length_bucket(length)
+        for term, tf in self._weighted_terms(book).items():
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            tiers = self._tiers[term]
+            tier = tiers.get((tf, bucket))
+            if tier is not None:
+                tier.pop(doc_id, None)
+                if not tier:
+                    del tiers[(tf, bucket)]
+            if not postings:
+                del self._postings[term]
+                del self._tiers[term]
+        self._total_length -= length
+
+    def _idf(self, doc_freq: int) -> float:
+        total = len(self._doc_lengths)
+        return math.log(1.0 + (total - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[int, float]]:
+        """返回按相关度排序的 (doc_id, score) 列表，最多 limit 条"""
+        if limit <= 0 or not self._doc_lengths:
+            return []
+        terms = self.query_tokenizer(query)
+        present = [term for term in terms if term in self._postings]
+        if not present:
+            return []
+        present.sort(key=lambda term: len(self._postings[term]))
+        if len(present) == len(terms):
+            # 全部词项命中时，只需遍历最稀有词项的倒排表
+            results = self._ranked(present, present[:1], True, limit)
+            if results or len(present) == 1:
+                return results
+        return self._ranked(present, present, False, limit)
+
+    def _ranked(self, terms: List[str], drivers: List[str], require_all: bool, limit: int) -> List[Tuple[int, float]]:
+        k1 = self.k1
+        b = self.b
+        avg_length = self._total_length / len(self._doc_lengths) or 1.0
+
+        def contribution(idf: float, tf: float, length: float) -> float:
+            return idf * tf * (k1 + 1.0) / (tf + k1 * (1.0 - b + b * length / avg_length))
+
+        idfs = {term: self._idf(len(self._postings[term])) for term in terms}
+        best = {
+            term: max(
+                contribution(idfs[term], tf, _bucket_min_length(bucket))
+                for tf, bucket in self._tiers[term]
+            )
+            for term in terms
+        }
+        best_total = sum(best.values())
+        tier_queue = sorted(
+            (
+                (best_total - best[term] + contribution(idfs[term], tf, _bucket_min_length(bucket)), docs)
+                for term in drivers
+                for (tf, bucket), docs in self._tiers[term].items()
+            ),
+            key=lambda item: item[0],
+            reverse=True
+        )
+        term_postings = [(self._postings[term], idfs[term]) for term in terms]
+
+        heap: List[Tuple[float, int]] = []
+        seen = set()
+        for bound, docs in tier_queue:
+            if len(heap) >= limit and heap[0][0] > bound:
+                break
+            for doc_id in docs:
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                if require_all and not all(doc_id in postings for postings, _ in term_postings):
+                    continue
+                length = self._doc_lengths[doc_id]
+                score = 0.0
+                for postings, idf in term_postings:
+                    tf = postings.get(doc_id)
+                    if tf:
+                        score += contribution(idf, tf, length)
+                # 分数相同时保持插入顺序
+                item = (score, -doc_id)
+                if len(heap) < limit:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+        return [(-neg_id, score) for score, neg_id in sorted(heap, reverse=True)]
@@ -0,0 +1,177 @@
+"""
+LLM 响应缓存
+
+call_model 以交给模型的完整输入为键缓存模型回复：系统提示、偏好提示、对话消息，
+以及模型名称、温度与绑定工具的定义。消息内容去掉首尾空白并合并连续空白，
+消息与工具调用的 ID 每次运行都不同，不参与计算，因此重复的提问（包括其后的工具步骤）可以命中。
+
+进程内按 LRU 保留最多 max_entries 条，每条在 ttl 秒后过期；
+配置 path 时另有一层 SQLite 缓存，进程重启或多个 worker 之间可以共享。
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.tools import BaseTool
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    message TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_llm_cache_expires ON llm_cache(expires_at);
+"""
+
+# SQLite 层每写入多少条清理一次过期记录
+_PRUNE_EVERY = 256
+
+
+def _normalize_text(text: Any) -> Any:
+    if isinstance(text, str):
+        return _WHITESPACE.sub(" ", text).strip()
+    return text
+
+
+def _message_key(message: BaseMessage) -> Dict[str, Any]:
+    """消息中参与缓存键计算的部分：类型、规范化后的内容与工具调用（不含 ID）"""
+    item: Dict[str, Any] = {"type": message.type, "content": _normalize_text(message.content)}
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        item["tool_calls"] = [{"name": call["name"], "args": call["args"]} for call in tool_calls]
+    if message.type == "tool":
+        item["name"] = message.name
+    return item
+
+
+def tools_fingerprint(tools: Sequence[BaseTool]) -> str:
+    """绑定工具的指纹：名称、描述与参数结构，工具定义变化后旧缓存自然失效"""
+    payload = [
+        {"name": tool.name, "description": tool.description, "args": tool.args}
+        for tool in tools
+    ]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def cache_key(messages: Sequence[BaseMessage], model: str, temperature: float, tools: str = "") -> str:
+    """由模型输入计算缓存键"""
+    payload = {
+        "model": model,
+        "temperature": temperature,
+        "tools": tools,
+        "messages": [_message_key(message) for message in messages],
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """LLM 响应缓存（线程安全）：进程内 LRU + 可选的 SQLite 层"""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0, path: str = ""):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "evictions": 0, "stores": 0}
+        if path:
+            conn = self._conn()
+            conn.executescript(_SCHEMA)
+            conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, key: str, expires_at: float, data: Dict[str, Any]) -> None:
+        """写入进程内 LRU，调用方需持有锁"""
+        self._entries[key] = (expires_at, data)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def get(self, key: str) -> Optional[BaseMessage]:
+        """命中时返回缓存消息的副本，未命中或已过期返回 None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return messages_from_dict([entry[1]])[0]
+                del self._entries[key]
+                self._stats["expired"] += 1
+        if self.path:
+            row = self._conn().execute(
+                "SELECT message, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is not None:
+                data = json.loads(row[0])
+                with self._lock:
+                    self._remember(key, row[1], data)
+                    self._stats["hits"] += 1
+                    self._stats["disk_hits"] += 1
+                return messages_from_dict([data])[0]
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, key: str, message: BaseMessage) -> None:
+        """缓存模型回复；消息 ID 不保存，命中时由图重新分配"""
+        if not isinstance(message, BaseMessage):
+            return
+        data = message_to_dict(message.model_copy(update={"id": None}))
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, data)
+            self._stats["stores"] += 1
+            self._writes += 1
+            prune = self._writes % _PRUNE_EVERY == 0
+        if self.path:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, message, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(data, ensure_ascii=False), expires_at)
+                )
+                if prune:
+                    conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计（含命中率与当前条目数）"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        """清空缓存与统计"""
+        with self._lock:
+            self._entries.clear()
+            for key in self._stats:
+                self._stats[key] = 0
+        if self.path:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM llm_cache")
@@ -0,0 +1,228 @@
+"""
+确定性快速路由
+
+在运行 LLM 图之前识别简单意图，直接调用工具并按模板生成回复，不调用模型：
+- 搜索图书："搜索《三体》"、"查找宇宙文明"
+- 图书详情："《三体》的详细信息"
+- 相似推荐："推荐《三体》的相似图书"、"看了三体，推荐类似的"
+- 类型推荐："给我推荐几本科幻"、"有什么好看的科幻小说"
+- 作者推荐："推荐刘慈欣的书"、"刘慈欣写过哪些书"
+
+识别基于实体自动机抽取的实体与语义缓存相同的问题规范化（book_semantic_cache.normalize_query）：
+规范化后的文本必须完整匹配某条规则，且实体恰好是该意图需要的一个，才视为高置信度；
+其余问题（比较、分析、个性化、多实体等）一律交给模型。
+可选的本地分类器以规则模板为样例做最近邻匹配，覆盖规则之外的少量变体。
+"""
+import re
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from book_embedding import HashedNgramVectorizer
+from book_entities import AUTHOR, GENRE, TITLE
+from book_semantic_cache import normalize_query
+
+
+# 意图
+SEARCH = "search"
+DETAILS = "details"
+SIMILAR_BOOKS = "similar_books"
+GENRE_RECOMMENDATION = "genre_recommendation"
+AUTHOR_RECOMMENDATION = "author_recommendation"
+
+# 耗时记录的类型（dispatch_metrics 中记为 fast_path:<意图>）
+FAST_PATH = "fast_path"
+
+# 推荐结果依赖用户偏好：有偏好提示时交给模型结合偏好排序
+PERSONALIZED_INTENTS = frozenset({SIMILAR_BOOKS, GENRE_RECOMMENDATION, AUTHOR_RECOMMENDATION})
+
+# 超过该长度的问题通常包含额外条件，不走快速路由
+MAX_QUERY_CHARS = 40
+
+# 模板中最多列出的图书数
+RESULT_LIMIT = 5
+
+# 规范化文本（实体替换为 A/G/T 占位符）的规则
+_RULES: Tuple[Tuple[str, "re.Pattern[str]"], ...] = (
+    (DETAILS, re.compile(r"搜?T(详情|详细信息|信息|简介|作者是谁|是谁写)|(详情|详细信息)T")),
+    (SIMILAR_BOOKS, re.compile(r"看?(和|与|跟)?T荐?似荐?|荐(和|与|跟)?T似|荐似T")),
+    (GENRE_RECOMMENDATION, re.compile(r"(荐|有什么)G(类型?)?|G(类型?)?荐")),
+    (AUTHOR_RECOMMENDATION, re.compile(r"荐?A(写过|写|有什么|还有什么)?荐?")),
+    (SEARCH, re.compile(r"搜([ATG]|[^ATG荐似看]{1,20})")),
+)
+
+# 搜索词取自原始问题：去掉开头的搜索动词与结尾的语气词、标点，书名号内的文字原样保留
+_SEARCH_PREFIX = re.compile(r"^\s*(请|帮我|给我)?\s*(搜索|查找|查询|查看|搜|查)(一下)?\s*")
+_SEARCH_SUFFIX = re.compile(r"[\s。！？!?,，~～]*(吧|呢|吗|啊)?[\s。！？!?,，~～]*$")
+
+
+def _search_term(text: str) -> str:
+    term = _SEARCH_SUFFIX.sub("", _SEARCH_PREFIX.sub("", text, count=1), count=1)
+    return term.replace("《", "").replace("》", "").strip()
+
+
+# 各意图需要的实体类型（搜索可以不含实体）
+_REQUIRED_KIND = {
+    DETAILS: TITLE,
+    SIMILAR_BOOKS: TITLE,
+    GENRE_RECOMMENDATION: GENRE,
+    AUTHOR_RECOMMENDATION: AUTHOR,
+    SEARCH: None,
+}
+
+# 本地分类器的样例（规范化文本）
+_EXAMPLES = {
+    DETAILS: ["T详情", "T详细信息", "T信息", "T简介", "T作者是谁"],
+    SIMILAR_BOOKS: ["荐T似", "看T荐似", "和T似", "T似"],
+    GENRE_RECOMMENDATION: ["荐G", "有什么G", "G荐", "荐G类型"],
+    AUTHOR_RECOMMENDATION: ["荐A", "A写过", "A有什么"],
+}
+
+
+class IntentClassifier:
+    """轻量本地分类器：规范化文本的字符 n-gram 向量与各意图样例做最近邻匹配"""
+
+    def __init__(self, threshold: float = 0.8, vectorizer: Optional[HashedNgramVectorizer] = None):
+        self.threshold = threshold
+        self.vectorizer = vectorizer or HashedNgramVectorizer()
+        self.intents: List[str] = []
+        vectors = []
+        for intent, examples in _EXAMPLES.items():
+            for example in examples:
+                self.intents.append(intent)
+                vectors.append(self.vectorizer.transform_text(example))
+        self.vectors = np.vstack(vectors)
+
+    def predict(self, normalized: str) -> Optional[Tuple[str, float]]:
+        """返回相似度最高且达到阈值的意图与相似度"""
+        if not normalized:
+            return None
+        scores = self.vectors @ self.vectorizer.transform_text(normalized)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return self.intents[best], float(scores[best])
+
+
+class IntentRouter:
+    """快速路由：识别高置信度的简单意图，返回意图、实体与检索词；无法确定时返回 None"""
+
+    def __init__(self, classifier: Optional[IntentClassifier] = None):
+        self.classifier = classifier
+
+    def classify(self, text: str, entities: Sequence[Tuple[str, str]]) -> Optional[Dict[str, Any]]:
+        if not text or len(text) > MAX_QUERY_CHARS:
+            return None
+        normalized = normalize_query(text, entities)
+        for intent, pattern in _RULES:
+            if pattern.fullmatch(normalized):
+                return self._decision(intent, text, entities, "rule", 1.0)
+        if self.classifier is not None:
+            predicted = self.classifier.predict(normalized)
+            if predicted is not None:
+                return self._decision(predicted[0], text, entities, "classifier", predicted[1])
+        return None
+
+    @staticmethod
+    def _decision(
+        intent: str,
+        text: str,
+        entities: Sequence[Tuple[str, str]],
+        source: str,
+        score: float
+    ) -> Optional[Dict[str, Any]]:
+        """检查实体是否恰好满足意图：只含一个实体（搜索可以不含），且类型符合"""
+        names = {name for _, name in entities}
+        if len(names) > 1:
+            return None
+        required = _REQUIRED_KIND[intent]
+        entity = next(iter(names), None)
+        if required is not None and (entity is None or (required, entity) not in entities):
+            return None
+        query = entity if entity is not None else _search_term(text)
+        if not query:
+            return None
+        return {"intent": intent, "entity": entity, "query": query, "source": source, "score": score}
+
+
+def _by_rating(books: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return sorted(books, key=lambda book: -(book.get("rating") or 0))[:RESULT_LIMIT]
+
+
+# 回复模板（与 OfflineBookAgent 共用）
+def format_search_results(result: Dict[str, Any]) -> str:
+    if not (result["success"] and result["results"]):
+        return "抱歉，没有找到相关图书。"
+    response = "找到以下图书：\n"
+    for i, book in enumerate(result["results"], 1):
+        response += f"{i}. 《{book['title']}》- {book['author']} ({book['genre']})\n"
+        response += f"   评分: {book['rating']}/10\n"
+        response += f"   描述: {book['description']}\n\n"
+    return response
+
+
+def format_book_details(result: Dict[str, Any], title: str) -> str:
+    if not result["success"]:
+        return f"抱歉，没有找到图书《{title}》。"
+    book = result["book"]
+    response = f"《{book['title']}》详细信息：\n"
+    response += f"作者: {book['author']}\n"
+    response += f"类型: {book['genre']}\n"
+    response += f"评分: {book['rating']}/10\n"
+    response += f"出版年份: {book['publication_year']}\n"
+    response += f"出版社: {book['publisher']}\n"
+    response += f"ISBN: {book['isbn']}\n"
+    response += f"描述: {book['description']}\n"
+    return response
+
+
+def format_similar_books(result: Dict[str, Any], title: str) -> str:
+    if not (result["success"] and result["recommendations"]):
+        return "抱歉，无法找到相似图书。"
+    response = f"基于《{title}》，我推荐以下图书：\n"
+    for i, book in enumerate(result["recommendations"], 1):
+        response += f"{i}. 《{book['title']}》- {book['author']} ({book['genre']})\n"
+        response += f"   评分: {book['rating']}/10\n"
+        response += f"   推荐理由: {result['reasons'][i-1] if i <= len(result['reasons']) else '相似类型'}\n\n"
+    return response
+
+
+def format_genre_recommendations(recommendations: List[Dict[str, Any]], genre: str) -> str:
+    if not recommendations:
+        return f"抱歉，没有找到{genre}类型的图书。"
+    response = f"推荐{genre}类型的图书：\n"
+    for i, book in enumerate(recommendations, 1):
+        response += f"{i}. 《{book['title']}》- {book['author']}\n"
+        response += f"   评分: {book['rating']}/10\n"
+        response += f"   描述: {book['description']}\n\n"
+    return response
+
+
+def format_author_recommendations(recommendations: List[Dict[str, Any]], author: str) -> str:
+    if not recommendations:
+        return f"抱歉，没有找到{author}的作品。"
+    response = f"推荐{author}的作品：\n"
+    for i, book in enumerate(recommendations, 1):
+        response += f"{i}. 《{book['title']}》({book['genre']})\n"
+        response += f"   评分: {book['rating']}/10\n"
+        response += f"   描述: {book['description']}\n\n"
+    return response
+
+
+def answer(decision: Dict[str, Any], search_tool: Any, recommendation_tool: Any) -> str:
+    """按路由结果调用工具并套用模板生成回复"""
+    intent, query = decision["intent"], decision["query"]
+    if intent == SEARCH:
+        return format_search_results(search_tool.search_books(query, RESULT_LIMIT))
+    if intent == DETAILS:
+        return format_book_details(search_tool.get_book_details(query), query)
+    if intent == SIMILAR_BOOKS:
+        details = search_tool.get_book_details(query)
+        if not details["success"]:
+            return f"抱歉，没有找到图书《{query}》。"
+        return format_similar_books(recommendation_tool.recommend_by_knowledge_graph(details["book"]), query)
+    if intent == GENRE_RECOMMENDATION:
+        result = recommendation_tool.recommend_by_genre(query)
+        return format_genre_recommendations(_by_rating(result["recommendations"]), query)
+    result = recommendation_tool.recommend_by_author(query)
+    return format_author_recommendations(_by_rating(result["recommendations"]), query)
@@ -0,0 +1,202 @@
+"""
+语义响应缓存
+
+精确匹配的 LLM 响应缓存（book_llm_cache）无法命中换了说法的同一问题，
+例如“给我推荐几本科幻”与“推荐科幻小说”。这里在 chat 层缓存最终回复：
+- 作用域：偏好提示 + 目录版本 + 问题中抽取出的实体（作者、类型、书名）+ 排序、数量等限定词，
+  实体或限定词不同的问题永不互相命中
+- 追问（“再推荐几本”“换一批”“还有其他的吗”等）要的是与之前不同的结果，不读也不写缓存
+- 相似度：去掉实体、标点与语气词并归并同义的意图词后，用 book_embedding 的字符 n-gram
+  哈希向量计算余弦相似度，达到阈值即命中
+全部在本地计算，不调用任何模型。
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from book_embedding import HashedNgramVectorizer
+
+
+# 实体在规范化文本中的占位符
+_PLACEHOLDERS = {"author": "A", "genre": "G", "title": "T"}
+
+# 同义的意图词归并为同一个字
+_SYNONYMS = {
+    "搜索": "搜", "查找": "搜", "查询": "搜", "查看": "搜", "查": "搜",
+    "推荐": "荐", "推介": "荐", "介绍": "荐",
+    "类似": "似", "相似": "似", "相近": "似", "像": "似",
+    "看完": "看", "看了": "看", "读完": "看", "读了": "看", "读过": "看",
+}
+
+# 不影响意图的填充词
+_FILLERS = (
+    "给我", "帮我", "一下", "几本", "一些", "一本", "有哪些", "哪些", "好看的",
+    "图书", "书籍", "小说", "作品", "请", "吧", "呢", "吗", "的", "了", "想", "找", "本", "我", "书",
+)
+
+_PUNCTUATION = re.compile(r"[^\w\x00]")
+
+# 追问词：出现时不使用缓存
+_FOLLOW_UPS = ("再", "换", "其他", "其它", "别的", "另外", "更多", "还")
+
+# 排序、数量、筛选等限定词（含数字）：只在限定词完全相同的问题之间命中
+_QUALIFIERS = (
+    "最", "前", "排名", "排行", "评分", "高分", "低分", "经典", "冷门", "热门", "新", "老", "短", "长",
+    "不要", "除了", "之外", "以外", "年", "一", "二", "两", "三", "四", "五", "六", "七", "八", "九", "十",
+)
+_DIGITS = re.compile(r"\d+")
+
+
+def _replace_all(text: str, replacements: Dict[str, str]) -> str:
+    for word in sorted(replacements, key=len, reverse=True):
+        text = text.replace(word, replacements[word])
+    return text
+
+
+def normalize_query(text: str, entities: Sequence[Tuple[str, str]]) -> str:
+    """规范化问题文本：实体替换为类型占位符，去掉标点与填充词，归并同义意图词"""
+    text = text.lower()
+    for kind, name in sorted(entities, key=lambda entity: -len(entity[1])):
+        text = text.replace(name.lower(), f"\x00{_PLACEHOLDERS.get(kind, '?')}\x00")
+    text = _PUNCTUATION.sub("", text)
+    text = _replace_all(text, _SYNONYMS)
+    text = _replace_all(text, {word: "" for word in _FILLERS})
+    return text.replace("\x00", "")
+
+
+def query_modifiers(normalized: str) -> Optional[Tuple[str, ...]]:
+    """规范化问题中的限定词；含追问词时返回 None（不可缓存）"""
+    if any(word in normalized for word in _FOLLOW_UPS):
+        return None
+    return tuple(word for word in _QUALIFIERS if word in normalized) + tuple(_DIGITS.findall(normalized))
+
+
+def _scope_key(
+    entities: Sequence[Tuple[str, str]],
+    hint: Optional[str],
+    version: Any,
+    modifiers: Tuple[str, ...]
+) -> str:
+    payload = "\n".join(
+        [hint or "", repr(version), "|".join(modifiers)]
+        + [f"{kind}:{name}" for kind, name in sorted(set(entities))]
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class SemanticResponseCache:
+    """语义响应缓存（线程安全）：按作用域分组，组内按向量相似度查找，全局 LRU + TTL"""
+
+    def __init__(
+        self,
+        threshold: float = 0.7,
+        max_entries: int = 2048,
+        ttl: float = 3600.0,
+        vectorizer: Optional[HashedNgramVectorizer] = None
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.vectorizer = vectorizer or HashedNgramVectorizer()
+        # 条目：(作用域, 规范化问题) -> (向量, 回复, 过期时间)，按最近使用排序
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[np.ndarray, str, float]]" = OrderedDict()
+        self._scopes: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "skipped": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    def _vector(self, normalized: str) -> np.ndarray:
+        return self.vectorizer.transform_text(normalized)
+
+    def _drop(self, key: Tuple[str, str]) -> None:
+        """移除条目，调用方需持有锁"""
+        del self._entries[key]
+        scope, normalized = key
+        queries = self._scopes[scope]
+        queries.remove(normalized)
+        if not queries:
+            del self._scopes[scope]
+
+    def lookup(
+        self,
+        text: str,
+        entities: Sequence[Tuple[str, str]],
+        hint: Optional[str] = None,
+        version: Any = None
+    ) -> Optional[str]:
+        """查找同一作用域内最相似的已缓存问题，相似度达到阈值时返回其回复；追问不查找"""
+        normalized = normalize_query(text, entities)
+        modifiers = query_modifiers(normalized)
+        if modifiers is None:
+            with self._lock:
+                self._stats["skipped"] += 1
+            return None
+        scope = _scope_key(entities, hint, version, modifiers)
+        query = self._vector(normalized)
+        now = time.time()
+        with self._lock:
+            best_key, best_score = None, self.threshold
+            for cached in list(self._scopes.get(scope, ())):
+                key = (scope, cached)
+                vector, _, expires_at = self._entries[key]
+                if expires_at <= now:
+                    self._drop(key)
+                    self._stats["expired"] += 1
+                    continue
+                score = 1.0 if cached == normalized else float(vector @ query)
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self._stats["hits"] += 1
+            return self._entries[best_key][1]
+
+    def store(
+        self,
+        text: str,
+        entities: Sequence[Tuple[str, str]],
+        hint: Optional[str],
+        response: str,
+        version: Any = None
+    ) -> None:
+        """缓存一个问题的最终回复；追问的回复不缓存"""
+        normalized = normalize_query(text, entities)
+        modifiers = query_modifiers(normalized)
+        if modifiers is None:
+            return
+        scope = _scope_key(entities, hint, version, modifiers)
+        vector = self._vector(normalized)
+        with self._lock:
+            key = (scope, normalized)
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (vector, response, time.time() + self.ttl)
+            self._scopes.setdefault(scope, []).append(normalized)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计（含命中率与当前条目数）"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        """清空缓存与统计"""
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+            for key in self._stats:
+                self._stats[key] = 0
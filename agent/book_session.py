@@ -0,0 +1,259 @@
+"""
+会话状态存储
+
+按用户保存对话历史与推荐反馈，供多个请求线程并发读写：
+- 锁分段：用户按 ID 哈希到固定数量的锁上，不同用户的请求基本互不阻塞，
+  同一用户的读写串行执行，不会丢失或交错写入
+- 环形缓冲：对话历史使用定长 deque，追加与淘汰最旧记录都是 O(1)，不再反复切片复制
+读取接口返回副本，调用方在锁外处理数据。
+
+指定持久化后端（book_user_store.UserStore）时，用户首次被访问时从后端载入历史与反馈，
+之后的写入同时交给后端（后台批量落盘），读取只访问内存。
+
+内存中最多保留 max_users 个用户的会话，超出时淘汰最久未访问的用户，再次访问时从后端重新载入
+（没有后端时被淘汰的用户从空会话开始）；后端中仍有未提交写入的用户暂不淘汰，
+否则重新载入时只能读到已提交的记录，会漏掉排队中的写入；每个用户只保留最近 max_feedback_entries 条反馈记录，
+偏好累计仍基于全部反馈。
+
+每个用户另有一份偏好累计（PreferenceAggregate），在写入用户消息与反馈时以 O(1) 更新，
+生成偏好提示时无需重新扫描历史与全部反馈；提示文本缓存到累计发生变化为止。
+"""
+import threading
+import zlib
+from itertools import islice
+from collections import Counter, OrderedDict, deque
+from typing import Dict, Any, List, Deque, Iterator, Optional, Callable
+
+from book_user_store import UserStore
+
+
+# 评分达到 POSITIVE_RATING 计为好评，不高于 NEGATIVE_RATING 计为差评
+POSITIVE_RATING = 7.0
+NEGATIVE_RATING = 4.0
+
+
+class PreferenceAggregate:
+    """单个用户的偏好累计
+
+    用户消息中提到的作者、类型按消息衰减计数：每条新消息的权重是上一条的 1/decay 倍，
+    相当于旧计数整体乘以 decay，但只需更新本条消息涉及的条目。
+    同时记录每个条目最后一次被提及的消息序号：只有最近 recent_window 条用户消息内提到过的条目
+    才视为“最近关注”，很久以前被反复提及的条目不会因为累计权重高而留在其中。
+    反馈按评分累计好评/差评的作者、类型次数。version 在每次变化时递增。
+    """
+
+    # 权重放大到该值时整体归一化一次，并清理已超出最近窗口的条目
+    RESCALE_LIMIT = 1e12
+
+    def __init__(self, decay: float = 0.7, recent_window: int = 5):
+        self.decay = decay
+        self.recent_window = recent_window
+        self.scale = 1.0
+        # 已记录的用户消息数，即最近一条消息的序号
+        self.messages = 0
+        self.authors: Dict[str, float] = {}
+        self.genres: Dict[str, float] = {}
+        # 条目最后一次被提及的消息序号
+        self.authors_seen: Dict[str, int] = {}
+        self.genres_seen: Dict[str, int] = {}
+        self.positive_authors: Counter = Counter()
+        self.positive_genres: Counter = Counter()
+        self.negative_authors: Counter = Counter()
+        self.negative_genres: Counter = Counter()
+        self.version = 0
+        self.hint: Optional[str] = None
+        self.hint_version = -1
+
+    def _seen(self, scores: Dict[str, float]) -> Dict[str, int]:
+        return self.authors_seen if scores is self.authors else self.genres_seen
+
+    def _in_window(self, sequence: int) -> bool:
+        return sequence > self.messages - self.recent_window
+
+    def add_mentions(self, authors: List[str], genres: List[str]) -> None:
+        """记录一条用户消息中的作者与类型"""
+        self.messages += 1
+        self.scale /= self.decay
+        for scores, names in ((self.authors, authors), (self.genres, genres)):
+            seen = self._seen(scores)
+            for name in names:
+                scores[name] = scores.get(name, 0.0) + self.scale
+                seen[name] = self.messages
+        if self.scale > self.RESCALE_LIMIT:
+            self._rescale()
+        self.version += 1
+
+    def _rescale(self) -> None:
+        for scores in (self.authors, self.genres):
+            seen = self._seen(scores)
+            for name in list(scores):
+                if not self._in_window(seen[name]):
+                    del scores[name]
+                    del seen[name]
+                else:
+                    scores[name] /= self.scale
+        self.scale = 1.0
+
+    def add_feedback(self, rating: Optional[float], author: Optional[str], genre: Optional[str]) -> None:
+        if rating is None:
+            return
+        if rating >= POSITIVE_RATING:
+            authors, genres = self.positive_authors, self.positive_genres
+        elif rating <= NEGATIVE_RATING:
+            authors, genres = self.negative_authors, self.negative_genres
+        else:
+            return
+        if author:
+            authors[author] += 1
+        if genre:
+            genres[genre] += 1
+        self.version += 1
+
+    def recent(self, scores: Dict[str, float], limit: int = 3) -> List[str]:
+        """最近关注度最高的条目：只取最近 recent_window 条消息内提到过的，按衰减后的权重排序"""
+        seen = self._seen(scores)
+        ranked = sorted(
+            (item for item in scores.items() if self._in_window(seen[item[0]])),
+            key=lambda item: -item[1]
+        )
+        return [name for name, _ in ranked[:limit]]
+
+
+class SessionStore:
+    """线程安全、按用户锁分段的会话存储"""
+
+    def __init__(
+        self,
+        max_history_entries: int = 50,
+        stripes: int = 64,
+        backend: Optional[UserStore] = None,
+        decay: float = 0.7,
+        recent_window: int = 5,
+        max_users: int = 10000,
+        max_feedback_entries: int = 200
+    ):
+        self.max_history_entries = max_history_entries
+        self.backend = backend
+        self.decay = decay
+        self.recent_window = recent_window
+        self.max_users = max_users
+        self.max_feedback_entries = max_feedback_entries
+        self._locks = [threading.RLock() for _ in range(stripes)]
+        self._histories: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._feedback: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._aggregates: Dict[str, PreferenceAggregate] = {}
+        # 已载入的用户按最近访问排序，由 _lru_lock 保护
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self._lru_lock = threading.Lock()
+
+    def lock(self, user_id: str) -> threading.RLock:
+        """用户所在分段的锁（可重入），需要把多次写入作为一个整体时使用"""
+        return self._locks[zlib.crc32(user_id.encode("utf-8")) % len(self._locks)]
+
+    def _session(self, user_id: str) -> Deque[Dict[str, Any]]:
+        """用户的历史缓冲，首次访问时从后端载入；调用方需持有用户锁"""
+        history = self._histories.get(user_id)
+        if history is None:
+            history = deque(maxlen=self.max_history_entries)
+            feedback: Deque[Dict[str, Any]] = deque(maxlen=self.max_feedback_entries)
+            aggregate = PreferenceAggregate(self.decay, self.recent_window)
+            if self.backend is not None:
+                history.extend(self.backend.load_history(user_id, self.max_history_entries))
+                # 载入时重放一次，之后增量更新；偏好累计基于全部反馈，内存中只保留最近的记录
+                for entry in history:
+                    self._accumulate(aggregate, entry)
+                for entry in self.backend.load_feedback(user_id):
+                    aggregate.add_feedback(entry.get("rating"), entry.get("author"), entry.get("genre"))
+                    feedback.append(entry)
+            self._feedback[user_id] = feedback
+            self._aggregates[user_id] = aggregate
+            self._histories[user_id] = history
+        self._touch(user_id)
+        return history
+
+    def _touch(self, user_id: str) -> None:
+        """记录用户最近一次访问，超出 max_users 时淘汰最久未访问的用户"""
+        with self._lru_lock:
+            self._recent[user_id] = None
+            self._recent.move_to_end(user_id)
+            excess = len(self._recent) - self.max_users
+            if excess <= 0:
+                return
+            victims = list(islice(
+                (victim for victim in self._recent if victim != user_id and not self._pending_writes(victim)), excess
+            ))
+        for victim in victims:
+            lock = self.lock(victim)
+            # 其他线程可能正持有该分段锁并等待当前分段，阻塞获取会死锁；拿不到锁时留到下次再淘汰
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                # 挑选后到取得分段锁之前可能又有写入入队，持锁后再确认一次
+                if self._pending_writes(victim):
+                    continue
+                with self._lru_lock:
+                    if len(self._recent) <= self.max_users:
+                        break
+                    self._recent.pop(victim, None)
+                self._histories.pop(victim, None)
+                self._feedback.pop(victim, None)
+                self._aggregates.pop(victim, None)
+            finally:
+                lock.release()
+
+    def _pending_writes(self, user_id: str) -> bool:
+        return self.backend is not None and self.backend.has_pending(user_id)
+
+    @staticmethod
+    def _accumulate(aggregate: PreferenceAggregate, entry: Dict[str, Any]) -> None:
+        if entry.get("role") == "user":
+            aggregate.add_mentions(entry.get("authors", []), entry.get("genres", []))
+
+    def append_history(self, user_id: str, entry: Dict[str, Any]) -> None:
+        """追加一条历史；用户消息（role 为 user）中的 authors、genres 计入偏好累计"""
+        with self.lock(user_id):
+            self._session(user_id).append(entry)
+            self._accumulate(self._aggregates[user_id], entry)
+            if self.backend is not None:
+                self.backend.append_history(user_id, entry)
+
+    def history(self, user_id: str, role: Optional[str] = None) -> List[Dict[str, Any]]:
+        """返回用户对话历史的副本（按时间顺序），可按角色过滤"""
+        with self.lock(user_id):
+            history = self._session(user_id)
+            if role is None:
+                return list(history)
+            return [entry for entry in history if entry.get("role") == role]
+
+    def append_feedback(self, user_id: str, entry: Dict[str, Any]) -> None:
+        with self.lock(user_id):
+            self._session(user_id)
+            self._feedback[user_id].append(entry)
+            self._aggregates[user_id].add_feedback(entry.get("rating"), entry.get("author"), entry.get("genre"))
+            if self.backend is not None:
+                self.backend.append_feedback(user_id, entry)
+
+    def feedback(self, user_id: str) -> List[Dict[str, Any]]:
+        """返回用户反馈记录的副本"""
+        with self.lock(user_id):
+            self._session(user_id)
+            return list(self._feedback.get(user_id, ()))
+
+    def preference_hint(
+        self,
+        user_id: str,
+        render: Callable[[PreferenceAggregate], Optional[str]]
+    ) -> Optional[str]:
+        """用户的偏好提示：累计变化后才调用 render 重新生成，否则返回缓存的文本"""
+        with self.lock(user_id):
+            self._session(user_id)
+            aggregate = self._aggregates[user_id]
+            if aggregate.hint_version != aggregate.version:
+                aggregate.hint = render(aggregate)
+                aggregate.hint_version = aggregate.version
+            return aggregate.hint
+
+    def users(self) -> Iterator[str]:
+        """已载入会话（未被淘汰）的用户 ID"""
+        with self._lru_lock:
+            return iter(list(self._recent))
@@ -1,6 +1,7 @@
 """
 图书推荐Agent状态定义
 """
+import operator
 from typing import List, Dict, Any, Optional, Annotated
 from pydantic import BaseModel, Field
 from langgraph.graph import add_messages
@@ -75,5 +76,15 @@ class BookRecommendationState(BaseModel):
     # 会话偏好提示
     preference_hint: Optional[str] = None
     
+    # 跳过 LLM 响应缓存（仍会写入缓存）
+    bypass_cache: bool = False
+    
+    # 本轮 LLM 与工具调用耗时明细（各节点追加）
+    timings: Annotated[List[Dict[str, Any]], operator.add] = Field(default_factory=list)
+    
+    # 本轮已完整发送给模型的书名与工具结果的估算 token 数（用于去重与预算）
+    sent_books: Annotated[List[str], operator.add] = Field(default_factory=list)
+    tool_tokens: Annotated[int, operator.add] = 0
+    
     class Config:
         arbitrary_types_allowed = True
\ No newline at end of file
@@ -0,0 +1,550 @@
+"""
+图书目录 SQLite 持久化存储
+
+SQLiteBookDatabase 与 BookDatabase 接口一致（search_books、get_book_by_* 等），
+目录与知识图谱保存在本地 SQLite 文件中，多个 Flask worker 可共享同一份目录，
+而无需各自在内存中持有。全文搜索使用 FTS5，文本预先按 book_index 的 n-gram 分词写入。
+"""
+import json
+import sqlite3
+import threading
+from collections.abc import Mapping
+from typing import Dict, Any, List, Optional, Iterable, Iterator
+
+from book_embedding import BookEmbeddingIndex, content_fields_changed, load_or_build_embedding_index
+from book_graph import CompiledKnowledgeGraph, compile_knowledge_graph, graph_fields_changed
+from book_index import ngram_tokenize, ngram_query_terms
+from book_tools import _normalize_key, _normalize_isbn, iter_catalog_chunks
+from config import CATALOG_CHUNK_SIZE, BOOK_EMBEDDING_PATH, BOOK_EMBEDDING_DIM
+
+
+_BOOK_FIELDS = ("title", "author", "isbn", "genre", "rating", "description", "publication_year", "publisher")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    isbn TEXT,
+    genre TEXT,
+    rating REAL,
+    description TEXT,
+    publication_year INTEGER,
+    publisher TEXT,
+    title_key TEXT NOT NULL,
+    author_key TEXT NOT NULL,
+    genre_key TEXT,
+    isbn_key TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_books_title ON books(title_key);
+CREATE INDEX IF NOT EXISTS idx_books_author ON books(author_key);
+CREATE INDEX IF NOT EXISTS idx_books_genre ON books(genre_key);
+CREATE INDEX IF NOT EXISTS idx_books_isbn ON books(isbn_key);
+CREATE INDEX IF NOT EXISTS idx_books_genre_rating ON books(genre_key, rating);
+CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(title, author, genre, description);
+CREATE TABLE IF NOT EXISTS kg_authors (
+    name TEXT PRIMARY KEY,
+    genres TEXT NOT NULL DEFAULT '[]',
+    books TEXT NOT NULL DEFAULT '[]',
+    style TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('graph_version', 0);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('content_version', 0);
+CREATE TABLE IF NOT EXISTS kg_genres (
+    name TEXT PRIMARY KEY,
+    authors TEXT NOT NULL DEFAULT '[]',
+    similar_genres TEXT NOT NULL DEFAULT '[]'
+);
+"""
+
+# 与 BookSearchIndex 默认字段权重一致：title, author, genre, description
+_FTS_WEIGHTS = "3.0, 2.0, 2.0, 1.0"
+
+
+def _fts_text(value: Optional[str]) -> str:
+    return " ".join(ngram_tokenize(value or ""))
+
+
+class _GraphNodes(Mapping):
+    """知识图谱节点表的只读映射视图，按需从 SQLite 读取"""
+
+    def __init__(self, store: "SQLiteBookDatabase", table: str, list_fields: List[str], text_fields: List[str]):
+        self._store = store
+        self._table = table
+        self._list_fields = list_fields
+        self._text_fields = text_fields
+
+    def __getitem__(self, name: str) -> Dict[str, Any]:
+        columns = ", ".join(self._list_fields + self._text_fields)
+        row = self._store._conn().execute(
+            f"SELECT {columns} FROM {self._table} WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(name)
+        node = {field: json.loads(row[field]) for field in self._list_fields}
+        node.update({field: row[field] for field in self._text_fields})
+        return node
+
+    def __contains__(self, name: object) -> bool:
+        return self._store._conn().execute(
+            f"SELECT 1 FROM {self._table} WHERE name = ?", (name,)
+        ).fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        rows = self._store._conn().execute(f"SELECT name FROM {self._table} ORDER BY rowid").fetchall()
+        return iter([row["name"] for row in rows])
+
+    def __len__(self) -> int:
+        return self._store._conn().execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+
+class SQLiteBookDatabase:
+    """基于 SQLite 的图书数据库，接口与 BookDatabase 保持一致"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+        self.knowledge_graph = {
+            "authors": _GraphNodes(self, "kg_authors", ["genres", "books"], ["style"]),
+            "genres": _GraphNodes(self, "kg_genres", ["authors", "similar_genres"], []),
+        }
+        self._compiled_graph: Optional[CompiledKnowledgeGraph] = None
+        self._compiled_version = -1
+        self._embedding_index: Optional[BookEmbeddingIndex] = None
+        self._embedding_version = -1
+
+    @property
+    def version(self) -> int:
+        """目录版本号，任何进程写入后都会递增"""
+        return self._conn().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    @property
+    def graph_version(self) -> int:
+        """图结构版本号，只在增删图书、修改书名/作者/类型或导入知识图谱时递增"""
+        return self._conn().execute("SELECT value FROM meta WHERE key = 'graph_version'").fetchone()[0]
+
+    @property
+    def content_version(self) -> int:
+        """内容版本号，只在增删图书或修改书名/类型/简介时递增"""
+        return self._conn().execute("SELECT value FROM meta WHERE key = 'content_version'").fetchone()[0]
+
+    @staticmethod
+    def _bump_version(conn: sqlite3.Connection, graph: bool = True, content: bool = True) -> None:
+        """递增目录版本号；graph、content 为 True 时同时递增图结构、内容版本号"""
+        keys = ("version",) + (("graph_version",) if graph else ()) + (("content_version",) if content else ())
+        conn.execute(f"UPDATE meta SET value = value + 1 WHERE key IN ({', '.join('?' * len(keys))})", keys)
+
+    @property
+    def compiled_graph(self) -> CompiledKnowledgeGraph:
+        """编译后的知识图谱邻接结构，图结构版本号变化后首次访问时重新编译（评分等字段变化不影响）"""
+        version = self.graph_version
+        if self._compiled_graph is None or self._compiled_version != version:
+            self._compiled_graph = compile_knowledge_graph(self.iter_books(), self.knowledge_graph)
+            self._compiled_version = version
+        return self._compiled_graph
+
+    @property
+    def embedding_index(self) -> BookEmbeddingIndex:
+        """图书内容向量索引，内容版本号变化后首次访问时重建（评分等字段变化不影响）；多个 worker 可共享同一保存目录"""
+        version = self.content_version
+        if self._embedding_index is None or self._embedding_version != version:
+            self._embedding_index = load_or_build_embedding_index(self.iter_books, BOOK_EMBEDDING_PATH, BOOK_EMBEDDING_DIM)
+            self._embedding_version = version
+        return self._embedding_index
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程使用独立连接；WAL 模式下读写互不阻塞"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            if self.path != ":memory:":
+                conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        """关闭当前线程的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @staticmethod
+    def _row_to_book(row: sqlite3.Row) -> Dict[str, Any]:
+        return {field: row[field] for field in _BOOK_FIELDS}
+
+    def _select(self, where: str, params: tuple, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        sql = f"SELECT {', '.join(_BOOK_FIELDS)} FROM books WHERE {where} ORDER BY id"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return [self._row_to_book(row) for row in self._conn().execute(sql, params)]
+
+    # ---- 与 BookDatabase 一致的读取接口 ----
+
+    @property
+    def books(self) -> List[Dict[str, Any]]:
+        """按插入顺序返回全部图书（会完整读取目录，大目录请使用 iter_books）"""
+        return list(self.iter_books())
+
+    def iter_books(self, batch_size: int = CATALOG_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+        """分批遍历全部图书"""
+        cursor = self._conn().execute(f"SELECT {', '.join(_BOOK_FIELDS)} FROM books ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield self._row_to_book(row)
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM books").fetchone()[0]
+
+    def search_books(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """搜索图书，书名完全匹配的排在最前，其余按 FTS5 bm25 相关度排序"""
+        if limit <= 0:
+            return []
+        conn = self._conn()
+        book_ids = [
+            row["id"] for row in conn.execute(
+                "SELECT id FROM books WHERE title_key = ? ORDER BY id LIMIT ?", (_normalize_key(query), limit)
+            )
+        ]
+        terms = ngram_query_terms(query)
+        if terms and len(book_ids) < limit:
+            quoted = [f'"{term}"' for term in terms]
+            expressions = [" AND ".join(quoted)]
+            if len(quoted) > 1:
+                # 无图书命中全部词项时退化为命中任一词项
+                expressions.append(" OR ".join(quoted))
+            for expression in expressions:
+                ranked = [
+                    row["rowid"] for row in conn.execute(
+                        f"SELECT rowid FROM books_fts WHERE books_fts MATCH ? "
+                        f"ORDER BY bm25(books_fts, {_FTS_WEIGHTS}), rowid LIMIT ?",
+                        (expression, limit + len(book_ids))
+                    )
+                ]
+                if ranked:
+                    book_ids = list(dict.fromkeys(book_ids + ranked))[:limit]
+                    break
+        if not book_ids:
+            return []
+        rows = conn.execute(
+            f"SELECT id, {', '.join(_BOOK_FIELDS)} FROM books WHERE id IN ({', '.join('?' * len(book_ids))})",
+            book_ids
+        ).fetchall()
+        by_id = {row["id"]: self._row_to_book(row) for row in rows}
+        return [by_id[book_id] for book_id in book_ids if book_id in by_id]
+
+    def get_book_by_title(self, title: str) -> Optional[Dict[str, Any]]:
+        """根据标题获取图书"""
+        books = self._select("title_key = ?", (_normalize_key(title),), 1)
+        return books[0] if books else None
+
+    def get_book_by_isbn(self, isbn: str) -> Optional[Dict[str, Any]]:
+        """根据ISBN获取图书"""
+        books = self._select("isbn_key = ?", (_normalize_isbn(isbn),), 1)
+        return books[0] if books else None
+
+    def get_books_by_author(self, author: str) -> List[Dict[str, Any]]:
+        """根据作者获取图书"""
+        return self._select("author_key = ?", (_normalize_key(author),))
+
+    def get_books_by_genre(self, genre: str) -> List[Dict[str, Any]]:
+        """根据类型获取图书"""
+        return self._select("genre_key = ?", (_normalize_key(genre),))
+
+    def query_books(
+        self,
+        genres: Optional[List[str]] = None,
+        authors: Optional[List[str]] = None,
+        match_any: bool = False,
+        min_rating: Optional[float] = None,
+        min_year: Optional[int] = None,
+        max_year: Optional[int] = None,
+        exclude_titles: Optional[List[str]] = None,
+        sort_by: str = "rating",
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """按类型/作者/评分/年份过滤并排序，语义与 BookDatabase.query_books 一致"""
+        if sort_by not in ("rating", "publication_year"):
+            raise ValueError(f"不支持的排序字段: {sort_by}")
+        if limit <= 0:
+            return []
+        clauses = []
+        params: List[Any] = []
+        selectors = []
+        if genres:
+            selectors.append(f"genre_key IN ({', '.join('?' * len(genres))})")
+            params.extend(_normalize_key(genre) for genre in genres)
+        if authors:
+            selectors.append(f"author_key IN ({', '.join('?' * len(authors))})")
+            params.extend(_normalize_key(author) for author in authors)
+        if selectors:
+            clauses.append("(" + (" OR " if match_any else " AND ").join(selectors) + ")")
+        if min_rating is not None:
+            clauses.append("rating >= ?")
+            params.append(min_rating)
+        if min_year is not None:
+            clauses.append("publication_year >= ?")
+            params.append(min_year)
+        if max_year is not None:
+            clauses.append("publication_year <= ?")
+            params.append(max_year)
+        if exclude_titles:
+            clauses.append(f"title_key NOT IN ({', '.join('?' * len(exclude_titles))})")
+            params.extend(_normalize_key(title) for title in exclude_titles)
+        where = " AND ".join(clauses) or "1"
+        rows = self._conn().execute(
+            f"SELECT {', '.join(_BOOK_FIELDS)} FROM books WHERE {where} "
+            f"ORDER BY {sort_by} IS NULL, {sort_by} DESC, id LIMIT ?",
+            params + [limit]
+        )
+        return [self._row_to_book(row) for row in rows]
+
+    # ---- 写入接口 ----
+
+    def load_from_file(self, path: str, chunk_size: int = CATALOG_CHUNK_SIZE) -> Dict[str, int]:
+        """流式载入 JSONL/CSV 目录文件，每块一个事务"""
+        stats = {"loaded": 0, "skipped": 0}
+        for chunk in iter_catalog_chunks(path, chunk_size):
+            self.load_books(chunk["books"])
+            stats["loaded"] += len(chunk["books"])
+            stats["skipped"] += chunk["skipped"]
+        return stats
+
+    def load_books(self, books: Iterable[Dict[str, Any]]) -> int:
+        """批量添加图书（单个事务）"""
+        count = 0
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                self._bump_version(conn)
+                for book in books:
+                    self._insert(conn, book)
+                    self._link_graph(conn, book)
+                    count += 1
+        return count
+
+    def add_book(self, book: Dict[str, Any]) -> Dict[str, Any]:
+        """添加一本图书，并同步更新知识图谱中的作者与类型节点"""
+        self.load_books([book])
+        return book
+
+    def update_book(self, title: str, updates: Dict[str, Any], isbn: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """更新图书字段；未找到时返回 None"""
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                book_id = self._find_id(conn, title, isbn)
+                if book_id is None:
+                    return None
+                row = conn.execute(f"SELECT {', '.join(_BOOK_FIELDS)} FROM books WHERE id = ?", (book_id,)).fetchone()
+                book = self._row_to_book(row)
+                old_book = dict(book)
+                self._delete(conn, book_id, book)
+                book.update(updates)
+                self._bump_version(
+                    conn, graph=graph_fields_changed(old_book, book), content=content_fields_changed(old_book, book)
+                )
+                self._insert(conn, book, book_id)
+                self._link_graph(conn, book)
+        return book
+
+    def delete_book(self, title: str, isbn: Optional[str] = None) -> bool:
+        """删除图书（同名时可用 ISBN 区分），返回是否删除成功"""
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                book_id = self._find_id(conn, title, isbn)
+                if book_id is None:
+                    return False
+                row = conn.execute(f"SELECT {', '.join(_BOOK_FIELDS)} FROM books WHERE id = ?", (book_id,)).fetchone()
+                self._delete(conn, book_id, self._row_to_book(row))
+                self._bump_version(conn)
+        return True
+
+    def import_knowledge_graph(self, knowledge_graph: Dict[str, Any]) -> None:
+        """导入知识图谱（覆盖同名节点）"""
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                self._bump_version(conn, content=False)
+                self._write_graph(conn, knowledge_graph)
+
+    @staticmethod
+    def _write_graph(conn: sqlite3.Connection, knowledge_graph: Dict[str, Any]) -> None:
+        for name, node in knowledge_graph.get("authors", {}).items():
+            conn.execute(
+                "INSERT OR REPLACE INTO kg_authors (name, genres, books, style) VALUES (?, ?, ?, ?)",
+                (name, json.dumps(node.get("genres", []), ensure_ascii=False),
+                 json.dumps(node.get("books", []), ensure_ascii=False), node.get("style", ""))
+            )
+        for name, node in knowledge_graph.get("genres", {}).items():
+            conn.execute(
+                "INSERT OR REPLACE INTO kg_genres (name, authors, similar_genres) VALUES (?, ?, ?)",
+                (name, json.dumps(node.get("authors", []), ensure_ascii=False),
+                 json.dumps(node.get("similar_genres", []), ensure_ascii=False))
+            )
+
+    def seed_once(
+        self,
+        knowledge_graph: Dict[str, Any],
+        books: Iterable[Dict[str, Any]],
+        link_graph: bool = False
+    ) -> int:
+        """目录为空时导入知识图谱与图书，返回导入数量；目录已有图书时返回 0
+
+        检查与写入在同一个 BEGIN IMMEDIATE 事务中完成：多个进程同时启动时，
+        后到的进程等待写锁，拿到锁后重新检查到目录已非空，不会重复导入。
+        link_graph 为 True 时按每本图书补全作者、类型节点（目录文件中的图书不一定在知识图谱里）。
+        """
+        count = 0
+        with self._write_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("SELECT COUNT(*) FROM books").fetchone()[0]:
+                    conn.rollback()
+                    return 0
+                self._bump_version(conn)
+                self._write_graph(conn, knowledge_graph)
+                for book in books:
+                    self._insert(conn, book)
+                    if link_graph:
+                        self._link_graph(conn, book)
+                    count += 1
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        return count
+
+    def seed_from(self, db: Any) -> int:
+        """目录为空时，从内存中的 BookDatabase 导入图书与知识图谱"""
+        return self.seed_once(
+            {"authors": dict(db.knowledge_graph["authors"]), "genres": dict(db.knowledge_graph["genres"])},
+            db.iter_books(),
+        )
+
+    def seed_from_file(self, path: str, knowledge_graph: Dict[str, Any], chunk_size: int = CATALOG_CHUNK_SIZE) -> int:
+        """目录为空时，导入知识图谱并流式载入 JSONL/CSV 目录文件（单个事务）"""
+        books = (book for chunk in iter_catalog_chunks(path, chunk_size) for book in chunk["books"])
+        return self.seed_once(knowledge_graph, books, link_graph=True)
+
+    def _find_id(self, conn: sqlite3.Connection, title: str, isbn: Optional[str]) -> Optional[int]:
+        if isbn:
+            row = conn.execute(
+                "SELECT id FROM books WHERE title_key = ? AND isbn_key = ? ORDER BY id LIMIT 1",
+                (_normalize_key(title), _normalize_isbn(isbn))
+            ).fetchone()
+        else:
+            row = conn.execute(
+                "SELECT id FROM books WHERE title_key = ? ORDER BY id LIMIT 1", (_normalize_key(title),)
+            ).fetchone()
+        return row["id"] if row else None
+
+    def _insert(self, conn: sqlite3.Connection, book: Dict[str, Any], book_id: Optional[int] = None) -> int:
+        values = [book.get(field) for field in _BOOK_FIELDS]
+        keys = [
+            _normalize_key(book.get("title")),
+            _normalize_key(book.get("author")),
+            _normalize_key(book.get("genre")),
+            _normalize_isbn(book.get("isbn")),
+        ]
+        cursor = conn.execute(
+            f"INSERT INTO books (id, {', '.join(_BOOK_FIELDS)}, title_key, author_key, genre_key, isbn_key) "
+            f"VALUES ({', '.join('?' * (len(_BOOK_FIELDS) + 5))})",
+            [book_id] + values + keys
+        )
+        new_id = cursor.lastrowid
+        conn.execute(
+            "INSERT INTO books_fts (rowid, title, author, genre, description) VALUES (?, ?, ?, ?, ?)",
+            (new_id, _fts_text(book.get("title")), _fts_text(book.get("author")),
+             _fts_text(book.get("genre")), _fts_text(book.get("description")))
+        )
+        return new_id
+
+    def _delete(self, conn: sqlite3.Connection, book_id: int, book: Dict[str, Any]) -> None:
+        conn.execute("DELETE FROM books WHERE id = ?", (book_id,))
+        conn.execute("DELETE FROM books_fts WHERE rowid = ?", (book_id,))
+        self._unlink_graph(conn, book)
+
+    def _link_graph(self, conn: sqlite3.Connection, book: Dict[str, Any]) -> None:
+        author = book.get("author")
+        genre = book.get("genre")
+        if author:
+            row = conn.execute("SELECT genres, books FROM kg_authors WHERE name = ?", (author,)).fetchone()
+            genres = json.loads(row["genres"]) if row else []
+            titles = json.loads(row["books"]) if row else []
+            if book["title"] not in titles:
+                titles.append(book["title"])
+            if genre and genre not in genres:
+                genres.append(genre)
+            conn.execute(
+                "INSERT INTO kg_authors (name, genres, books) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET genres = excluded.genres, books = excluded.books",
+                (author, json.dumps(genres, ensure_ascii=False), json.dumps(titles, ensure_ascii=False))
+            )
+        if genre:
+            row = conn.execute("SELECT authors FROM kg_genres WHERE name = ?", (genre,)).fetchone()
+            authors = json.loads(row["authors"]) if row else []
+            if author and author not in authors:
+                authors.append(author)
+                conn.execute(
+                    "INSERT INTO kg_genres (name, authors) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET authors = excluded.authors",
+                    (genre, json.dumps(authors, ensure_ascii=False))
+                )
+
+    def _unlink_graph(self, conn: sqlite3.Connection, book: Dict[str, Any]) -> None:
+        """图书移除后，若作者已无同名作品，则从作者节点中移除书名；
+        若作者已无该类型的其他图书，则同时移除作者与类型之间的双向关联"""
+        author = book.get("author")
+        genre = book.get("genre")
+        row = conn.execute("SELECT genres, books FROM kg_authors WHERE name = ?", (author,)).fetchone()
+        if row is not None:
+            remaining = conn.execute(
+                "SELECT 1 FROM books WHERE title_key = ? AND author = ? LIMIT 1",
+                (_normalize_key(book.get("title")), author)
+            ).fetchone()
+            titles = json.loads(row["books"])
+            if remaining is None and book.get("title") in titles:
+                titles.remove(book["title"])
+                conn.execute(
+                    "UPDATE kg_authors SET books = ? WHERE name = ?",
+                    (json.dumps(titles, ensure_ascii=False), author)
+                )
+        if not author or not genre:
+            return
+        if conn.execute(
+            "SELECT 1 FROM books WHERE author_key = ? AND author = ? AND genre = ? LIMIT 1",
+            (_normalize_key(author), author, genre)
+        ).fetchone() is not None:
+            return
+        genres = json.loads(row["genres"]) if row is not None else []
+        if genre in genres:
+            genres.remove(genre)
+            conn.execute(
+                "UPDATE kg_authors SET genres = ? WHERE name = ?",
+                (json.dumps(genres, ensure_ascii=False), author)
+            )
+        genre_row = conn.execute("SELECT authors FROM kg_genres WHERE name = ?", (genre,)).fetchone()
+        authors = json.loads(genre_row["authors"]) if genre_row is not None else []
+        if author in authors:
+            authors.remove(author)
+            conn.execute(
+                "UPDATE kg_genres SET authors = ? WHERE name = ?",
+                (json.dumps(authors, ensure_ascii=False), genre)
+            )
@@ -3,10 +3,41 @@
 """
 import unittest
 import json
+import os
+import tempfile
+import numpy as np
 from unittest.mock import patch, MagicMock
+
+# 测试默认使用进程内用户数据存储，不写入本地数据库文件；
+# 模拟的 LLM 回复因用例而异，默认关闭 LLM 响应缓存、语义响应缓存与快速路由（相关用例单独启用）
+os.environ.setdefault("USER_STORE_BACKEND", "memory")
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "false")
+os.environ.setdefault("FAST_PATH_ENABLED", "false")
+
 from book_agent import BookRecommendationAgent
-from book_tools import BookRecommendationTool, BookSearchTool, BookAnalysisTool
+from book_tools import (
+    tool_result_cache,
+    BookDatabase,
+    BookRecommendationTool,
+    BookSearchTool,
+    BookAnalysisTool,
+    CatalogRegistry,
+    ColumnarBookStore,
+    catalog_registry,
+)
+from book_graph import AUTHOR, BELONGS_TO, BOOK, GENRE, SAME_STYLE, SIMILAR_GENRE, WROTE
+from book_embedding import BookEmbeddingIndex, load_or_build_embedding_index
+from book_entities import EntityMatcher
+from book_index import BookSearchIndex, ngram_tokenize
+from book_llm_cache import LLMResponseCache, cache_key
+from book_tool_cache import ToolResultCache
+from book_router import AUTHOR_RECOMMENDATION, DETAILS, GENRE_RECOMMENDATION, SEARCH, SIMILAR_BOOKS, IntentRouter
+from book_semantic_cache import SemanticResponseCache, normalize_query
+from book_session import SessionStore
+from book_user_store import SQLiteUserStore, UserStore
 from book_state import BookInfo, UserPreference
+from book_storage import SQLiteBookDatabase
 
 
 class TestBookTools(unittest.TestCase):
@@ -68,6 +99,23 @@ class TestBookTools(unittest.TestCase):
         self.assertGreater(len(result["recommendations"]), 0)
         self.assertGreater(len(result["reasons"]), 0)
     
+    def test_recommend_by_preferences(self):
+        """测试基于偏好约束的推荐"""
+        result = self.recommendation_tool.recommend_by_preferences({
+            "favorite_genres": ["科幻"],
+            "preferred_rating": 8.5,
+            "preferred_years": [2005, 2010]
+        }, ["三体"])
+        self.assertTrue(result["success"])
+        self.assertGreater(result["count"], 0)
+        ratings = [book["rating"] for book in result["recommendations"]]
+        self.assertEqual(ratings, sorted(ratings, reverse=True))
+        for book in result["recommendations"]:
+            self.assertEqual(book["genre"], "科幻")
+            self.assertGreaterEqual(book["rating"], 8.5)
+            self.assertTrue(2005 <= book["publication_year"] <= 2010)
+            self.assertNotEqual(book["title"], "三体")
+    
     def test_analyze_reading_trends(self):
         """测试阅读趋势分析"""
         user_history = [
@@ -98,6 +146,849 @@ class TestBookTools(unittest.TestCase):
         for similar in result["similar_books"]:
             self.assertIn("similarity_score", similar)
             self.assertIn("similarity_reason", similar)
+    
+    def test_similar_books_ranking(self):
+        """测试相似度综合打分与 top-k 选择"""
+        result = self.analysis_tool.get_similar_books({"title": "三体"}, limit=8)
+        similar_books = result["similar_books"]
+        self.assertEqual(len(similar_books), 8)
+        self.assertGreaterEqual(result["count"], 8)
+        scores = [similar["similarity_score"] for similar in similar_books]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertNotIn("三体", [similar["book"]["title"] for similar in similar_books])
+        # 同作者同类型的作品排在只有相似类型关联的图书之前
+        self.assertEqual(similar_books[0]["book"]["author"], "刘慈欣")
+        self.assertIn("同作者", similar_books[0]["similarity_reason"])
+    
+    def test_similar_books_with_string_fields(self):
+        """测试模型传入字符串年份、评分时按数字处理，无法转换时跳过该项"""
+        numeric = self.analysis_tool.get_similar_books({"title": "新书", "genre": "科幻", "publication_year": 2006, "rating": 9.0})
+        as_text = self.analysis_tool.get_similar_books({"title": "新书", "genre": "科幻", "publication_year": "2006", "rating": "9.0"})
+        self.assertEqual(as_text["similar_books"], numeric["similar_books"])
+        invalid = self.analysis_tool.get_similar_books({"title": "新书", "genre": "科幻", "publication_year": "两千年"})
+        self.assertTrue(invalid["success"])
+        self.assertTrue(all("出版年代相近" not in similar["similarity_reason"] for similar in invalid["similar_books"]))
+
+
+class TestCatalogRegistry(unittest.TestCase):
+    """图书目录注册表测试类"""
+    
+    def test_tools_share_database(self):
+        """测试工具共享同一个图书数据库"""
+        recommendation_tool = BookRecommendationTool()
+        search_tool = BookSearchTool()
+        analysis_tool = BookAnalysisTool()
+        self.assertIs(recommendation_tool.db, search_tool.db)
+        self.assertIs(search_tool.db, analysis_tool.db)
+        self.assertIs(search_tool.db, catalog_registry.get())
+    
+    def test_swap_and_reload(self):
+        """测试替换与重载图书数据库"""
+        registry = CatalogRegistry()
+        first = registry.get()
+        self.assertIs(first, registry.get())
+        
+        replacement = BookDatabase()
+        old = registry.swap(replacement)
+        self.assertIs(old, first)
+        self.assertIs(registry.get(), replacement)
+        
+        reloaded = registry.reload()
+        self.assertIsNot(reloaded, replacement)
+        self.assertIs(registry.get(), reloaded)
+        self.assertEqual(registry.version, 3)
+
+
+class TestBookDatabaseIndexes(unittest.TestCase):
+    """图书数据库索引测试类"""
+    
+    def setUp(self):
+        self.db = BookDatabase(books=[
+            {"title": "三体", "author": "刘慈欣", "isbn": "978-7536692930", "genre": "科幻", "description": ""},
+            {"title": "流浪地球", "author": "刘慈欣", "isbn": "9787536692931", "genre": "科幻", "description": ""},
+            {"title": "活着", "author": "余华", "isbn": "9787506365437", "genre": "文学", "description": ""},
+        ])
+    
+    def test_normalized_lookup(self):
+        """测试归一化键查询"""
+        self.assertEqual(self.db.get_book_by_title(" 三体 ")["author"], "刘慈欣")
+        self.assertEqual(self.db.get_book_by_isbn("9787536692930")["title"], "三体")
+        self.assertEqual([book["title"] for book in self.db.get_books_by_author("刘慈欣")], ["三体", "流浪地球"])
+    
+    def test_update_keeps_indexes_consistent(self):
+        """测试更新后索引一致"""
+        self.db.update_book("活着", {"genre": "小说"})
+        self.assertEqual(self.db.get_books_by_genre("文学"), [])
+        self.assertEqual(self.db.get_books_by_genre("小说")[0]["title"], "活着")
+        self.assertIn("余华", self.db.knowledge_graph["genres"]["小说"]["authors"])
+    
+    def test_genre_change_moves_graph_links(self):
+        """测试修改类型后移除不再有图书支撑的作者—类型关联"""
+        self.db.update_book("三体", {"genre": "文学"})
+        self.assertEqual(self.db.knowledge_graph["authors"]["刘慈欣"]["genres"], ["科幻", "文学"])
+        self.db.update_book("流浪地球", {"genre": "文学"})
+        self.assertEqual(self.db.knowledge_graph["authors"]["刘慈欣"]["genres"], ["文学"])
+        self.assertNotIn("刘慈欣", self.db.knowledge_graph["genres"]["科幻"]["authors"])
+        self.assertEqual(self.db.knowledge_graph["genres"]["文学"]["authors"], ["余华", "刘慈欣"])
+        self.db.delete_book("活着")
+        self.assertNotIn("余华", self.db.knowledge_graph["genres"]["文学"]["authors"])
+    
+    def test_delete_keeps_indexes_consistent(self):
+        """测试删除后索引一致"""
+        self.assertTrue(self.db.delete_book("三体"))
+        self.assertFalse(self.db.delete_book("三体"))
+        self.assertIsNone(self.db.get_book_by_title("三体"))
+        self.assertIsNone(self.db.get_book_by_isbn("9787536692930"))
+        self.assertEqual(len(self.db.get_books_by_author("刘慈欣")), 1)
+        self.assertNotIn("三体", self.db.knowledge_graph["authors"]["刘慈欣"]["books"])
+        self.assertEqual(len(self.db), 2)
+    
+    def test_iter_books_matches_books(self):
+        """测试 iter_books 按插入顺序遍历，不复制列表"""
+        self.assertNotIsInstance(self.db.iter_books(), list)
+        self.assertEqual(list(self.db.iter_books()), self.db.books)
+        self.db.delete_book("三体")
+        self.assertEqual([book["title"] for book in self.db.iter_books()], ["流浪地球", "活着"])
+
+
+class TestColumnarBookStore(unittest.TestCase):
+    """列式图书存储测试类"""
+    
+    def test_same_results_as_dict_store(self):
+        """测试列式存储与字典存储结果一致"""
+        dict_db = BookDatabase()
+        columnar_db = BookDatabase(record_store=ColumnarBookStore())
+        self.assertEqual([dict(book) for book in columnar_db.books], dict_db.books)
+        self.assertEqual(
+            [book["title"] for book in columnar_db.search_books("刘慈欣", 5)],
+            [book["title"] for book in dict_db.search_books("刘慈欣", 5)]
+        )
+    
+    def test_missing_values_and_mutation(self):
+        """测试缺失字段、更新与删除"""
+        db = BookDatabase(books=[], record_store=ColumnarBookStore())
+        db.add_book({"title": "三体", "author": "刘慈欣", "genre": "科幻", "description": "", "rating": None})
+        db.add_book({"title": "活着", "author": "余华", "genre": "文学", "description": "", "rating": 9.2})
+        book = db.get_book_by_title("三体")
+        self.assertIsNone(book["rating"])
+        self.assertIsNone(book["publication_year"])
+        
+        db.update_book("活着", {"rating": 9.5})
+        self.assertEqual(db.get_book_by_title("活着")["rating"], 9.5)
+        self.assertTrue(db.delete_book("三体"))
+        self.assertEqual(len(db), 1)
+        self.assertEqual(db.get_books_by_author("刘慈欣"), [])
+    
+    def test_text_heap_reuses_slots_and_compacts(self):
+        """测试仅改评分时字节堆不增长，变长的值与删除留下的空洞会被压缩回收"""
+        store = ColumnarBookStore()
+        db = BookDatabase(books=[], record_store=store)
+        db.add_book({"title": "三体", "author": "刘慈欣", "genre": "科幻", "description": "地球往事" * 10, "isbn": "9787536692930"})
+        heap_size = sum(len(column._data) for column in store._text.values())
+        for i in range(100):
+            db.update_book("三体", {"rating": 8.0 + i / 100})
+        self.assertEqual(sum(len(column._data) for column in store._text.values()), heap_size)
+        
+        db.update_book("三体", {"description": "短简介"})
+        self.assertEqual(db.get_book_by_title("三体")["description"], "短简介")
+        for i in range(2000):
+            db.update_book("三体", {"description": f"简介{i}" * 5})
+        description = store._text["description"]
+        self.assertLess(len(description._data), 2 * description._COMPACT_MIN_BYTES + 100)
+        self.assertEqual(db.get_book_by_title("三体")["description"], "简介1999" * 5)
+        self.assertEqual(db.get_book_by_title("三体")["isbn"], "9787536692930")
+        
+        for i in range(300):
+            db.add_book({"title": f"书{i}", "author": "某作者", "genre": "文学", "description": "内容" * 20})
+        for i in range(300):
+            db.delete_book(f"书{i}")
+        self.assertLess(len(description._data), description._COMPACT_MIN_BYTES * 2)
+        self.assertEqual(db.get_book_by_title("三体")["title"], "三体")
+    
+    def test_query_books_matches_python_filter(self):
+        """测试向量化查询与逐本过滤结果一致"""
+        db = BookDatabase(record_store=ColumnarBookStore())
+        expected = sorted(
+            (book for book in db.books if book["genre"] == "文学" and book["publication_year"] >= 1900),
+            key=lambda book: -book["rating"]
+        )[:5]
+        result = db.query_books(genres=["文学"], min_year=1900, limit=5)
+        self.assertEqual([book["rating"] for book in result], [book["rating"] for book in expected])
+    
+    def test_tools_return_plain_dicts(self):
+        """测试工具边界返回普通字典"""
+        search_tool = BookSearchTool(db=BookDatabase(record_store=ColumnarBookStore()))
+        result = search_tool.get_book_details("三体")
+        self.assertIsInstance(result["book"], dict)
+        json.dumps(search_tool.search_books("科幻", 3), ensure_ascii=False)
+
+
+class TestCompiledKnowledgeGraph(unittest.TestCase):
+    """知识图谱邻接结构测试类"""
+    
+    def setUp(self):
+        self.db = BookDatabase()
+        self.graph = self.db.compiled_graph
+    
+    def test_typed_neighbors(self):
+        """测试各类型边的邻居"""
+        author = self.graph.node(AUTHOR, "刘慈欣")
+        titles = self.graph.names(self.graph.neighbors(author, WROTE))
+        self.assertEqual(set(titles), {book["title"] for book in self.db.get_books_by_author("刘慈欣")})
+        
+        book = self.graph.node(BOOK, "三体")
+        self.assertEqual(self.graph.names(self.graph.neighbors(book, BELONGS_TO)), ["科幻"])
+        genre = self.graph.node(GENRE, "科幻")
+        self.assertEqual(
+            self.graph.names(self.graph.neighbors(genre, SIMILAR_GENRE)),
+            self.db.knowledge_graph["genres"]["科幻"]["similar_genres"]
+        )
+        self.assertEqual(self.graph.names(self.graph.neighbors(author, SAME_STYLE)), ["硬科幻"])
+    
+    def test_multi_hop_expand(self):
+        """测试多跳扩展：图书 -> 类型 -> 相似类型"""
+        book = self.graph.node(BOOK, "三体")
+        similar = self.graph.names(self.graph.expand([book], [BELONGS_TO, SIMILAR_GENRE]))
+        self.assertIn("科普", similar)
+    
+    def test_recompiled_after_catalog_change(self):
+        """测试目录变化后重新编译"""
+        self.db.add_book({"title": "新书", "author": "刘慈欣", "genre": "科幻", "description": ""})
+        graph = self.db.compiled_graph
+        self.assertIsNot(graph, self.graph)
+        self.assertIsNotNone(graph.node(BOOK, "新书"))
+        self.assertIs(self.db.compiled_graph, graph)
+    
+    def test_non_structural_update_keeps_compiled_graph(self):
+        """测试只修改评分等字段时不重新编译，修改类型或知识图谱时重新编译"""
+        self.db.update_book("三体", {"rating": 9.9})
+        self.assertIs(self.db.compiled_graph, self.graph)
+        self.db.update_book("三体", {"genre": "科普"})
+        graph = self.db.compiled_graph
+        self.assertIsNot(graph, self.graph)
+        self.assertEqual(graph.names(graph.neighbors(graph.node(BOOK, "三体"), BELONGS_TO)), ["科普"])
+        self.db.knowledge_graph["authors"]["刘慈欣"]["style"] = "软科幻"
+        self.db.mark_changed()
+        self.assertIsNot(self.db.compiled_graph, graph)
+    
+    def test_personalized_pagerank(self):
+        """测试个性化 PageRank：得分归一，同作者图书排在前列"""
+        seed = self.graph.node(BOOK, "三体")
+        scores = self.graph.personalized_pagerank([seed])
+        self.assertAlmostEqual(float(scores.sum()), 1.0, places=6)
+        same_author = self.graph.node(BOOK, "球状闪电")
+        other = self.graph.node(BOOK, "活着")
+        self.assertGreater(scores[same_author], scores[other])
+        self.assertEqual(self.graph.personalized_pagerank([None]).sum(), 0.0)
+    
+    def test_explain_path(self):
+        """测试推荐路径解释"""
+        seed = self.graph.node(BOOK, "三体")
+        path = self.graph.explain([seed], self.graph.node(BOOK, "球状闪电"))
+        self.assertEqual(self.graph.names(path), ["三体", "刘慈欣", "球状闪电"])
+    
+    def test_recommend_by_graph_ranking(self):
+        """测试图谱排序推荐"""
+        tool = BookRecommendationTool(self.db)
+        result = tool.recommend_by_graph_ranking(["三体", "活着"], exclude_books=["球状闪电"], limit=6)
+        self.assertTrue(result["success"])
+        self.assertEqual(result["count"], 6)
+        titles = [item["book"]["title"] for item in result["recommendations"]]
+        self.assertNotIn("三体", titles)
+        self.assertNotIn("球状闪电", titles)
+        scores = [item["score"] for item in result["recommendations"]]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        for item in result["recommendations"]:
+            self.assertTrue(item["reason"])
+            self.assertIn(item["path"][0], ["三体", "活着"])
+        self.assertFalse(tool.recommend_by_graph_ranking(["不存在的书"])["success"])
+
+
+class TestEntityMatcher(unittest.TestCase):
+    """实体抽取自动机测试类"""
+    
+    def setUp(self):
+        self.matcher = EntityMatcher([
+            ("genre", "科幻"),
+            ("genre", "推理小说"),
+            ("genre", "推理"),
+            ("author", "东野圭吾"),
+            ("title", "三体"),
+            ("title", "三体II"),
+            ("title", "Harry Potter"),
+        ])
+    
+    def test_find_all_and_longest_match(self):
+        """测试一次扫描找出全部命中，重叠时保留最长匹配"""
+        text = "我喜欢东野圭吾的推理小说，也在读三体ii"
+        spans = {(kind, name) for _, _, kind, name in self.matcher.find_all(text)}
+        self.assertTrue({("genre", "推理"), ("genre", "推理小说"), ("title", "三体"), ("title", "三体II")} <= spans)
+        self.assertEqual(
+            sorted(self.matcher.extract(text)),
+            [("author", "东野圭吾"), ("genre", "推理小说"), ("title", "三体II")]
+        )
+        self.assertEqual(self.matcher.extract("love HARRY potter and 科幻"), [("title", "Harry Potter"), ("genre", "科幻")])
+    
+    def test_incremental_update(self):
+        """测试增量加入与移除实体"""
+        self.matcher.update(added=[("author", "刘慈欣")], removed=[("title", "三体II")])
+        self.assertEqual(sorted(self.matcher.extract("刘慈欣的三体II")), [("author", "刘慈欣"), ("title", "三体")])
+        self.assertEqual(len(self.matcher), 7)
+    
+    def test_incremental_additions_match_full_rebuild(self):
+        """测试少量新增实体只进入增量自动机，抽取结果与整体重建一致（含后缀与已有节点上的新模式）"""
+        entities = [("title", f"书名{i}号") for i in range(300)] + [("author", "东野圭吾"), ("genre", "推理小说")]
+        matcher = EntityMatcher(entities)
+        main_nodes = len(matcher.goto)
+        added = [("genre", "推理"), ("author", "圭吾"), ("title", "名1"), ("title", "新书")]
+        matcher.update(added=added, removed=[("title", "书名7号")])
+        self.assertEqual(len(matcher.goto), main_nodes)
+        
+        expected = EntityMatcher([entity for entity in entities if entity != ("title", "书名7号")] + added)
+        for text in ("东野圭吾的推理小说", "书名1号和书名7号", "新书与名1", "圭吾写推理"):
+            self.assertEqual(sorted(matcher.extract(text)), sorted(expected.extract(text)))
+        self.assertEqual(len(matcher), len(expected))
+        
+        matcher.update(added=[("title", f"续集{i}") for i in range(40)])
+        self.assertIsNone(matcher._delta)
+        self.assertEqual(matcher.extract("续集39"), [("title", "续集39")])
+    
+    def test_rating_change_does_not_rescan_metadata(self):
+        """测试只修改评分时 Agent 不重新扫描目录，修改类型后才刷新"""
+        db = BookDatabase()
+        catalog_registry.swap(db)
+        try:
+            agent = BookRecommendationAgent()
+            with patch.object(agent, "_prepare_metadata", wraps=agent._prepare_metadata) as prepare:
+                db.update_book("三体", {"rating": 9.9})
+                agent._extract_entities("三体")
+                prepare.assert_not_called()
+                db.update_book("三体", {"genre": "硬科幻"})
+                self.assertEqual(agent._extract_entities("三体")[1], ["硬科幻"])
+                self.assertEqual(prepare.call_count, 1)
+        finally:
+            catalog_registry.reload()
+    
+    def test_agent_refreshes_after_catalog_change(self):
+        """测试目录变化后 Agent 的实体抽取随之更新"""
+        db = BookDatabase()
+        catalog_registry.swap(db)
+        try:
+            agent = BookRecommendationAgent()
+            self.assertEqual(agent._extract_entities("想读《云边有个小卖部》"), ([], [], []))
+            db.add_book({"title": "云边有个小卖部", "author": "张嘉佳", "genre": "文学"})
+            self.assertEqual(
+                agent._extract_entities("想读《云边有个小卖部》"),
+                (["张嘉佳"], ["文学"], ["云边有个小卖部"])
+            )
+        finally:
+            catalog_registry.reload()
+
+
+class TestBookSearchIndex(unittest.TestCase):
+    """全文检索索引测试类"""
+    
+    def test_ngram_tokenize(self):
+        """测试中文n-gram分词"""
+        self.assertEqual(ngram_tokenize("三体 1Q84"), ["1q84", "三", "体", "三体"])
+    
+    def test_exact_title_ranks_first(self):
+        """测试书名完全匹配的图书排在最前"""
+        search_tool = BookSearchTool()
+        titles = [book["title"] for book in search_tool.search_books("三体", 3)["results"]]
+        self.assertEqual(titles[0], "三体")
+    
+    def test_ranking_and_removal(self):
+        """测试相关度排序与删除"""
+        index = BookSearchIndex()
+        index.add(0, {"title": "流浪地球", "author": "刘慈欣", "description": "人类带着地球去流浪"})
+        index.add(1, {"title": "三体", "author": "刘慈欣", "description": "外星文明"})
+        index.add(2, {"title": "活着", "author": "余华", "description": "人类的苦难"})
+        self.assertEqual([doc_id for doc_id, _ in index.search("地球", 5)], [0])
+        self.assertEqual([doc_id for doc_id, _ in index.search("刘慈欣", 1)], [1])
+        # 无文档同时命中全部词项时退化为命中任一词项
+        self.assertEqual({doc_id for doc_id, _ in index.search("外星苦难", 5)}, {1, 2})
+        
+        index.remove(1, {"title": "三体", "author": "刘慈欣", "description": "外星文明"})
+        self.assertEqual(index.search("外星", 5), [])
+        self.assertEqual(len(index), 2)
+
+
+class TestBookEmbeddingIndex(unittest.TestCase):
+    """内容向量索引测试类"""
+    
+    def setUp(self):
+        self.db = BookDatabase()
+    
+    def test_similar_content(self):
+        """测试按书名与按描述检索内容相近的图书"""
+        index = BookEmbeddingIndex.build(self.db.books)
+        titles = [title for title, _ in index.similar_to("三体", 3)]
+        self.assertIn("三体II：黑暗森林", titles)
+        self.assertNotIn("三体", titles)
+        self.assertIsNone(index.similar_to("不存在的书"))
+        self.assertEqual(index.search_text("宇宙文明", 1)[0][0], "三体II：黑暗森林")
+    
+    def test_ivf_matches_exact_search(self):
+        """测试 IVF 近似检索与精确检索结果基本一致"""
+        books = [
+            {"title": f"{book['title']}-{i}", "genre": book["genre"], "description": book["description"]}
+            for i in range(30)
+            for book in self.db.books
+        ]
+        exact = BookEmbeddingIndex.build(books)
+        approximate = BookEmbeddingIndex.build(books, exact_threshold=100)
+        self.assertTrue(exact.is_exact)
+        self.assertFalse(approximate.is_exact)
+        query = exact.vectorizer.transform_text("探讨了宇宙的起源")
+        expected = {position for position, _ in exact.search_vector(query, 10)}
+        found = {position for position, _ in approximate.search_vector(query, 10, nprobe=16)}
+        self.assertGreaterEqual(len(expected & found), 8)
+    
+    def test_save_and_mmap_load(self):
+        """测试保存后以 mmap 加载，目录变化后重建"""
+        with tempfile.TemporaryDirectory() as path:
+            index = load_or_build_embedding_index(lambda: self.db.books, path)
+            self.assertIsInstance(index.vectors, np.memmap)
+            reloaded = load_or_build_embedding_index(lambda: self.db.books, path)
+            self.assertEqual(reloaded.fingerprint, index.fingerprint)
+            self.assertEqual(reloaded.similar_to("三体", 3), index.similar_to("三体", 3))
+            self.db.add_book({"title": "新书", "author": "某人", "genre": "科幻", "description": "宇宙文明"})
+            rebuilt = load_or_build_embedding_index(lambda: self.db.books, path)
+            self.assertEqual(len(rebuilt), len(index) + 1)
+
+    def test_rating_change_keeps_embedding_index(self):
+        """测试只修改评分时不重建向量索引，修改简介后重建"""
+        index = self.db.embedding_index
+        self.db.update_book("三体", {"rating": 9.9})
+        self.assertIs(self.db.embedding_index, index)
+        self.db.update_book("三体", {"description": "黑暗森林法则"})
+        self.assertIsNot(self.db.embedding_index, index)
+
+    def test_resave_keeps_mapped_index_valid(self):
+        """测试重新保存不覆盖其他进程正在映射的数组文件"""
+        with tempfile.TemporaryDirectory() as path:
+            BookEmbeddingIndex.build(self.db.books).save(path)
+            mapped = BookEmbeddingIndex.load(path)
+            expected = mapped.similar_to("三体", 3)
+            old_vectors = np.array(mapped.vectors)
+
+            books = self.db.books + [{"title": "新书", "genre": "科幻", "description": "宇宙文明"}]
+            BookEmbeddingIndex.build(books).save(path)
+            np.testing.assert_array_equal(np.asarray(mapped.vectors), old_vectors)
+            self.assertEqual(mapped.similar_to("三体", 3), expected)
+            self.assertEqual(len(BookEmbeddingIndex.load(path)), len(books))
+            # 上一版本的数组文件已删除，只保留当前版本
+            self.assertEqual(len([name for name in os.listdir(path) if name.startswith("vectors.")]), 1)
+
+    def test_search_by_content_tool(self):
+        """测试内容检索工具"""
+        tool = BookSearchTool(self.db)
+        result = tool.search_by_content(title="三体", limit=3)
+        self.assertTrue(result["success"])
+        self.assertEqual(result["count"], 3)
+        self.assertNotIn("三体", [item["book"]["title"] for item in result["results"]])
+        self.assertTrue(tool.search_by_content(text="宇宙文明")["success"])
+        self.assertFalse(tool.search_by_content()["success"])
+        # 目录变化后索引随之更新
+        self.db.add_book({"title": "星海", "author": "某人", "genre": "科幻", "description": "宇宙文明的生存法则"})
+        titles = [item["book"]["title"] for item in tool.search_by_content(text="宇宙文明的生存法则")["results"]]
+        self.assertIn("星海", titles)
+
+
+class TestSQLiteBookDatabase(unittest.TestCase):
+    """SQLite目录存储测试类"""
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.store = SQLiteBookDatabase(os.path.join(self.tmpdir.name, "catalog.db"))
+        self.addCleanup(self.store.close)
+        self.store.seed_from(BookDatabase())
+    
+    def test_interface_matches_memory_database(self):
+        """测试与内存数据库接口一致"""
+        memory_db = BookDatabase()
+        self.assertEqual(len(self.store), len(memory_db))
+        self.assertEqual(self.store.get_book_by_title("活着"), memory_db.get_book_by_title("活着"))
+        self.assertEqual(len(self.store.get_books_by_genre("科幻")), len(memory_db.get_books_by_genre("科幻")))
+        self.assertEqual(self.store.search_books("三体", 1)[0]["title"], "三体")
+        self.assertIn("科幻", self.store.knowledge_graph["genres"])
+        self.assertEqual(self.store.knowledge_graph["authors"]["刘慈欣"]["style"], "硬科幻")
+    
+    def test_persists_across_connections(self):
+        """测试数据写入文件后可被重新打开"""
+        self.store.add_book({"title": "新书", "author": "新作者", "genre": "科幻", "description": "测试"})
+        reopened = SQLiteBookDatabase(self.store.path)
+        self.addCleanup(reopened.close)
+        self.assertEqual(reopened.get_book_by_title("新书")["author"], "新作者")
+        self.assertIn("新作者", reopened.knowledge_graph["genres"]["科幻"]["authors"])
+    
+    def test_rating_change_keeps_content_version(self):
+        """测试只修改评分时内容版本号不变，向量索引不重建"""
+        index = self.store.embedding_index
+        content_version = self.store.content_version
+        self.store.update_book("三体", {"rating": 9.9})
+        self.assertEqual(self.store.content_version, content_version)
+        self.assertIs(self.store.embedding_index, index)
+        self.store.update_book("三体", {"genre": "硬科幻"})
+        self.assertEqual(self.store.content_version, content_version + 1)
+        self.store.import_knowledge_graph({"authors": {}, "genres": {}})
+        self.assertEqual(self.store.content_version, content_version + 1)
+
+    def test_delete_missing_book_keeps_version(self):
+        """测试删除不存在的图书时不递增版本号"""
+        version, graph_version = self.store.version, self.store.graph_version
+        self.assertFalse(self.store.delete_book("不存在的书"))
+        self.assertEqual((self.store.version, self.store.graph_version), (version, graph_version))
+        self.assertTrue(self.store.delete_book("三体"))
+        self.assertEqual((self.store.version, self.store.graph_version), (version + 1, graph_version + 1))
+
+    def test_tools_work_on_sqlite_backend(self):
+        """测试工具可直接使用SQLite后端"""
+        self.assertTrue(self.store.delete_book("三体"))
+        search_tool = BookSearchTool(db=self.store)
+        self.assertFalse(search_tool.get_book_details("三体")["success"])
+        recommendation_tool = BookRecommendationTool(db=self.store)
+        result = recommendation_tool.recommend_by_knowledge_graph({"title": "流浪地球", "author": "刘慈欣", "genre": "科幻"})
+        self.assertGreater(result["count"], 0)
+
+    def test_genre_change_moves_graph_links(self):
+        """测试修改类型后移除不再有图书支撑的作者—类型关联"""
+        self.store.add_book({"title": "新书", "author": "新作者", "genre": "科幻", "description": ""})
+        self.store.update_book("新书", {"genre": "悬疑"})
+        self.assertEqual(self.store.knowledge_graph["authors"]["新作者"]["genres"], ["悬疑"])
+        self.assertNotIn("新作者", self.store.knowledge_graph["genres"]["科幻"]["authors"])
+        self.assertIn("新作者", self.store.knowledge_graph["genres"]["悬疑"]["authors"])
+        self.store.delete_book("新书")
+        self.assertEqual(self.store.knowledge_graph["authors"]["新作者"]["genres"], [])
+        self.assertNotIn("新作者", self.store.knowledge_graph["genres"]["悬疑"]["authors"])
+
+    def test_non_structural_update_keeps_compiled_graph(self):
+        """测试只修改评分时不重新编译知识图谱"""
+        graph = self.store.compiled_graph
+        self.store.update_book("三体", {"rating": 9.9})
+        self.assertIs(self.store.compiled_graph, graph)
+        self.store.update_book("三体", {"author": "某人"})
+        self.assertIsNot(self.store.compiled_graph, graph)
+    
+    def test_concurrent_seed_imports_once(self):
+        """测试多个 worker 同时对空目录导入时只导入一次"""
+        import threading
+        path = os.path.join(self.tmpdir.name, "shared.db")
+        stores = [SQLiteBookDatabase(path) for _ in range(4)]
+        counts = []
+
+        def seed(store):
+            counts.append(store.seed_from(BookDatabase()))
+            store.close()
+
+        threads = [threading.Thread(target=seed, args=(store,)) for store in stores]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        expected = len(BookDatabase())
+        self.assertEqual(sorted(counts), [0, 0, 0, expected])
+        reopened = SQLiteBookDatabase(path)
+        self.addCleanup(reopened.close)
+        self.assertEqual(len(reopened), expected)
+        self.assertEqual(reopened.seed_from(BookDatabase()), 0)
+
+
+class TestCatalogLoader(unittest.TestCase):
+    """外部目录载入测试类"""
+    
+    def _write_temp(self, suffix, content):
+        handle = tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False, encoding="utf-8")
+        handle.write(content)
+        handle.close()
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+    
+    def test_load_jsonl(self):
+        """测试从JSONL载入并跳过无效行"""
+        rows = [
+            {"title": "三体", "author": "刘慈欣", "genre": "科幻", "rating": 9.0},
+            {"title": "活着", "author": "余华", "genre": "文学", "publication_year": "1993"},
+            {"author": "缺少书名"},
+        ]
+        path = self._write_temp(".jsonl", "\n".join(json.dumps(row, ensure_ascii=False) for row in rows) + "\nnot json\n")
+        
+        db = BookDatabase(books=[])
+        stats = db.load_from_file(path, chunk_size=2)
+        self.assertEqual(stats, {"loaded": 2, "skipped": 2})
+        self.assertEqual(db.get_book_by_title("活着")["publication_year"], 1993)
+        self.assertIn("三体", db.knowledge_graph["authors"]["刘慈欣"]["books"])
+        self.assertIn("余华", db.knowledge_graph["genres"]["文学"]["authors"])
+    
+    def test_load_csv(self):
+        """测试从CSV载入"""
+        content = "title,author,genre,rating,publication_year\n三体,刘慈欣,科幻,9.0,\n流浪地球,刘慈欣,科幻,8.5,2008\n"
+        path = self._write_temp(".csv", content)
+        
+        db = BookDatabase.from_file(path)
+        self.assertEqual(len(db.books), 2)
+        self.assertIsNone(db.get_book_by_title("三体")["publication_year"])
+        self.assertEqual(db.get_book_by_title("流浪地球")["rating"], 8.5)
+        self.assertEqual(len(db.search_books("刘慈欣")), 2)
+    
+    def test_unsupported_format(self):
+        """测试不支持的文件格式"""
+        path = self._write_temp(".txt", "三体")
+        with self.assertRaises(ValueError):
+            BookDatabase.from_file(path)
+
+
+class TestSessionStore(unittest.TestCase):
+    """会话存储测试类"""
+    
+    def test_ring_buffer_keeps_latest_entries(self):
+        """测试历史超过上限时只保留最新记录"""
+        store = SessionStore(max_history_entries=3)
+        for i in range(5):
+            store.append_history("u1", {"role": "user", "content": str(i)})
+        store.append_history("u1", {"role": "assistant", "content": "reply"})
+        self.assertEqual([entry["content"] for entry in store.history("u1")], ["3", "4", "reply"])
+        self.assertEqual(len(store.history("u1", role="user")), 2)
+        self.assertEqual(store.history("missing"), [])
+    
+    def test_concurrent_writes_are_not_lost(self):
+        """测试多线程并发写入不丢失记录"""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        store = SessionStore(max_history_entries=1000, stripes=4, max_feedback_entries=1000)
+        
+        def write(i):
+            user_id = f"user{i % 8}"
+            store.append_history(user_id, {"role": "user", "content": str(i)})
+            store.append_feedback(user_id, {"book_title": str(i)})
+        
+        with ThreadPoolExecutor(16) as pool:
+            list(pool.map(write, range(4000)))
+        
+        self.assertEqual(sorted(store.users()), [f"user{i}" for i in range(8)])
+        self.assertTrue(all(len(store.history(f"user{i}")) == 500 for i in range(8)))
+        self.assertEqual(sum(len(store.feedback(f"user{i}")) for i in range(8)), 4000)
+    
+    def test_idle_users_are_evicted_and_reloaded(self):
+        """测试超出用户上限时淘汰最久未访问的用户，再次访问时从后端重新载入"""
+        backend = UserStore()
+        backend.load_history = MagicMock(return_value=[{"role": "user", "content": "旧消息"}])
+        backend.load_feedback = MagicMock(return_value=[
+            {"book_title": str(i), "rating": 9.0, "genre": "科幻"} for i in range(5)
+        ])
+        store = SessionStore(backend=backend, max_users=2, max_feedback_entries=3)
+        store.history("u1")
+        store.history("u2")
+        store.history("u1")
+        store.history("u3")
+        self.assertEqual(sorted(store.users()), ["u1", "u3"])
+        self.assertNotIn("u2", store._aggregates)
+        # 反馈只保留最近的记录，偏好累计仍基于全部反馈
+        self.assertEqual([entry["book_title"] for entry in store.feedback("u2")], ["2", "3", "4"])
+        self.assertEqual(store._aggregates["u2"].positive_genres["科幻"], 5)
+        self.assertEqual(backend.load_history.call_count, 4)
+        self.assertEqual(len(list(store.users())), 2)
+    
+    def test_users_with_pending_writes_are_not_evicted(self):
+        """测试后端仍有未提交写入的用户不被淘汰，写入提交后再淘汰并能完整载入"""
+        class QueuedBackend(UserStore):
+            def __init__(self):
+                super().__init__()
+                self.committed, self.queued = [], []
+            
+            def _has_pending(self, user_id):
+                return any(queued_id == user_id for queued_id, _ in self.queued)
+            
+            def append_history(self, user_id, entry):
+                self.queued.append((user_id, entry))
+            
+            def load_history(self, user_id, limit):
+                return [entry for committed_id, entry in self.committed if committed_id == user_id][-limit:]
+            
+            def commit(self):
+                self.committed.extend(self.queued)
+                self.queued.clear()
+        
+        backend = QueuedBackend()
+        store = SessionStore(backend=backend, max_users=1)
+        store.append_history("u1", {"role": "user", "content": "排队中", "authors": ["刘慈欣"], "genres": []})
+        store.history("u2")
+        self.assertIn("u1", store._histories)
+        
+        backend.commit()
+        store.history("u3")
+        self.assertNotIn("u1", store._histories)
+        self.assertEqual([entry["content"] for entry in store.history("u1")], ["排队中"])
+        self.assertEqual(store._aggregates["u1"].recent(store._aggregates["u1"].authors), ["刘慈欣"])
+    
+    def test_decayed_mentions_follow_recent_window(self):
+        """测试偏好累计按消息衰减：超出最近窗口的单次提及不再计入"""
+        store = SessionStore(recent_window=3)
+        store.append_history("u1", {"role": "user", "authors": ["余华"], "genres": ["文学"]})
+        for _ in range(2):
+            store.append_history("u1", {"role": "user", "authors": ["刘慈欣"], "genres": []})
+        store.append_history("u1", {"role": "assistant", "content": "好的"})
+        aggregate = store._aggregates["u1"]
+        self.assertEqual(aggregate.recent(aggregate.authors), ["刘慈欣", "余华"])
+        store.append_history("u1", {"role": "user", "authors": [], "genres": []})
+        self.assertEqual(aggregate.recent(aggregate.authors), ["刘慈欣"])
+        self.assertEqual(aggregate.recent(aggregate.genres), [])
+    
+    def test_repeated_old_mentions_leave_recent_window(self):
+        """测试很久以前被反复提及的作者在超出最近窗口后不再计入"""
+        from book_session import PreferenceAggregate
+        
+        aggregate = PreferenceAggregate(0.7, 5)
+        for _ in range(10):
+            aggregate.add_mentions(["刘慈欣"], ["科幻"])
+        aggregate.add_mentions(["余华"], [])
+        self.assertEqual(aggregate.recent(aggregate.authors), ["刘慈欣", "余华"])
+        for _ in range(5):
+            aggregate.add_mentions([], [])
+        self.assertEqual(aggregate.recent(aggregate.authors), [])
+        self.assertEqual(aggregate.recent(aggregate.genres), [])
+        # 归一化时清理超出窗口的条目
+        for _ in range(100):
+            aggregate.add_mentions(["莫言"], [])
+        self.assertEqual(set(aggregate.authors), {"莫言"})
+        self.assertEqual(aggregate.recent(aggregate.authors), ["莫言"])
+    
+    def test_preference_hint_is_cached_until_aggregates_change(self):
+        """测试偏好提示只在累计变化后重新生成"""
+        store = SessionStore()
+        rendered = []
+        
+        def render(aggregate):
+            rendered.append(aggregate.version)
+            return ",".join(aggregate.recent(aggregate.authors) + list(aggregate.positive_genres))
+        
+        store.append_history("u1", {"role": "user", "authors": ["刘慈欣"], "genres": ["科幻"]})
+        self.assertEqual(store.preference_hint("u1", render), "刘慈欣")
+        store.append_history("u1", {"role": "assistant", "content": "推荐《球状闪电》"})
+        self.assertEqual(store.preference_hint("u1", render), "刘慈欣")
+        self.assertEqual(len(rendered), 1)
+        store.append_feedback("u1", {"book_title": "三体", "rating": 9.0, "author": "刘慈欣", "genre": "科幻"})
+        store.append_feedback("u1", {"book_title": "某书", "rating": 5.0})
+        self.assertEqual(store.preference_hint("u1", render), "刘慈欣,科幻")
+        self.assertEqual(len(rendered), 2)
+    
+    def test_agent_feedback_from_many_threads(self):
+        """测试 Agent 并发记录反馈，偏好提示基于完整记录"""
+        from concurrent.futures import ThreadPoolExecutor
+        
+        agent = BookRecommendationAgent()
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda i: agent.submit_feedback("fb_user", "三体", 9.0), range(200)))
+        self.assertEqual(len(agent.sessions.feedback("fb_user")), 200)
+        self.assertEqual(len(agent.sessions.history("fb_user")), agent.max_history_entries)
+        agent._record_user_message("fb_user", "想看刘慈欣的科幻小说")
+        self.assertIn("刘慈欣", agent._build_preference_hint("fb_user"))
+
+
+class TestUserStore(unittest.TestCase):
+    """用户数据存储测试类"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "users.db")
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    def test_preferences_from_views_and_feedback(self):
+        """测试偏好由浏览与评分累计：好评加分，差评扣分"""
+        store = UserStore()
+        store.record_view("u1", {"title": "三体", "author": "刘慈欣", "genre": "科幻", "rating": 9.3})
+        store.append_feedback("u1", {"book_title": "活着", "rating": 9.0, "author": "余华", "genre": "文学"})
+        store.append_feedback("u1", {"book_title": "某书", "rating": 2.0, "author": "某作者", "genre": "悬疑"})
+        preferences = store.get_preferences("u1")
+        self.assertEqual(preferences["favorite_authors"], ["余华", "刘慈欣"])
+        self.assertNotIn("悬疑", preferences["favorite_genres"])
+        self.assertEqual([book["title"] for book in preferences["reading_history"]], ["三体", "活着"])
+        self.assertEqual(preferences["preferred_rating"], 9.3)
+        UserPreference.model_validate(preferences)
+        self.assertEqual(store.get_preferences("new_user")["favorite_genres"], [])
+    
+    def test_write_behind_persists_in_batches(self):
+        """测试写入经后台队列批量提交，重新打开后可读取"""
+        store = SQLiteUserStore(self.path, batch_size=50, flush_interval=0.05)
+        for i in range(120):
+            store.append_history("u1", {"role": "user", "content": str(i)})
+        store.record_view("u1", {"title": "三体", "author": "刘慈欣", "genre": "科幻"})
+        store.append_feedback("u1", {"book_title": "活着", "rating": 8.0, "author": "余华", "genre": "文学"})
+        store.close()
+        
+        reopened = SQLiteUserStore(self.path)
+        history = reopened.load_history("u1", 10)
+        self.assertEqual([entry["content"] for entry in history], [str(i) for i in range(110, 120)])
+        self.assertEqual(len(reopened.load_feedback("u1")), 1)
+        self.assertEqual(set(reopened.get_preferences("u1")["favorite_authors"]), {"刘慈欣", "余华"})
+        reopened.close()
+    
+    def test_workers_share_profile_updates(self):
+        """测试两个 worker 更新同一用户的偏好时不互相覆盖，缓存过期后看到对方的更新"""
+        first = SQLiteUserStore(self.path, flush_interval=0.01, cache_ttl=0)
+        second = SQLiteUserStore(self.path, flush_interval=0.01, cache_ttl=0)
+        first.get_preferences("u1")
+        second.get_preferences("u1")
+        first.record_view("u1", {"title": "三体", "author": "刘慈欣", "genre": "科幻", "rating": 9.0})
+        second.record_view("u1", {"title": "活着", "author": "余华", "genre": "文学", "rating": 9.0})
+        second.record_view("u1", {"title": "兄弟", "author": "余华", "genre": "文学"})
+        first.flush()
+        second.flush()
+        
+        for store in (first, second):
+            preferences = store.get_preferences("u1")
+            self.assertEqual(preferences["favorite_authors"], ["余华", "刘慈欣"])
+            self.assertEqual({book["title"] for book in preferences["reading_history"]}, {"三体", "活着", "兄弟"})
+            self.assertEqual(preferences["preferred_rating"], 9.0)
+        first.close()
+        second.close()
+    
+    def test_profile_reload_outside_lock_and_bounded(self):
+        """测试过期档案在锁外重新载入，缓存用户数有上限且不淘汰有未提交写入的用户"""
+        class CheckedStore(SQLiteUserStore):
+            def _load_profile(self, user_id):
+                assert not self._lock.locked(), "载入档案时不应持有锁"
+                return super()._load_profile(user_id)
+        
+        store = CheckedStore(self.path, flush_interval=0.01, cache_ttl=0, max_profiles=2)
+        store.record_view("u1", {"title": "三体", "author": "刘慈欣", "genre": "科幻"})
+        store.flush()
+        self.assertEqual(store.get_preferences("u1")["favorite_authors"], ["刘慈欣"])
+        
+        with store._lock:
+            # 模拟 u1 的写入尚未提交，此时新用户装入缓存也不淘汰 u1
+            store._pending["u1"] = 1
+        for user_id in ("u2", "u3", "u4"):
+            store.get_preferences(user_id)
+        self.assertIn("u1", store._profiles)
+        self.assertLessEqual(len(store._profiles), 3)
+        with store._lock:
+            del store._pending["u1"]
+        store.get_preferences("u5")
+        self.assertEqual(len(store._profiles), 2)
+        self.assertEqual(len(store._loaded_at), 2)
+        self.assertNotIn("u1", store._profiles)
+        self.assertEqual(store.get_preferences("u1")["favorite_authors"], ["刘慈欣"])
+        store.close()
+    
+    def test_agent_state_survives_restart(self):
+        """测试 Agent 的会话历史与反馈在重启后载入"""
+        store = SQLiteUserStore(self.path)
+        agent = BookRecommendationAgent(user_store=store)
+        agent._record_user_message("u1", "想看刘慈欣的科幻小说")
+        agent.submit_feedback("u1", "三体", 9.5)
+        store.close()
+        
+        store = SQLiteUserStore(self.path)
+        restarted = BookRecommendationAgent(user_store=store)
+        self.assertEqual([entry["role"] for entry in restarted.sessions.history("u1")], ["user", "feedback"])
+        self.assertEqual(restarted.sessions.feedback("u1")[0]["book_title"], "三体")
+        self.assertIn("刘慈欣", restarted._build_preference_hint("u1"))
+        store.close()
 
 
 class TestBookAgent(unittest.TestCase):
@@ -146,6 +1037,726 @@ class TestBookAgent(unittest.TestCase):
         self.assertEqual(preference.preferred_rating, 8.5)
 
 
+class TestToolDispatch(unittest.TestCase):
+    """工具调度测试类"""
+    
+    def _tool_call_message(self, *calls):
+        from langchain_core.messages import AIMessage
+        return AIMessage(content="", tool_calls=[
+            {"name": name, "args": args, "id": f"call_{i}"} for i, (name, args) in enumerate(calls)
+        ])
+    
+    def test_executor_runs_calls_with_timings(self):
+        """测试执行器逐个执行工具调用并记录耗时"""
+        from book_agent import book_tools
+        from book_dispatch import DispatchMetrics, ToolExecutor
+        from book_state import BookRecommendationState
+        
+        metrics = DispatchMetrics()
+        executor = ToolExecutor(book_tools, metrics)
+        state = BookRecommendationState(messages=[self._tool_call_message(
+            ("get_book_details", {"title": "三体"}),
+            ("no_such_tool", {}),
+        )])
+        result = executor(state)
+        
+        first, second = result["messages"]
+        self.assertEqual(first.tool_call_id, "call_0")
+        self.assertEqual(json.loads(first.content)["book"]["author"], "刘慈欣")
+        self.assertEqual(second.status, "error")
+        self.assertEqual([entry["name"] for entry in result["timings"]], ["get_book_details", "no_such_tool"])
+        self.assertEqual(metrics.snapshot()["tool:get_book_details"]["count"], 1)
+    
+    def test_structured_tool_arguments(self):
+        """测试工具直接接收 BookInfo / UserPreference 结构，结果在边界处序列化一次"""
+        from book_agent import book_tools
+        from book_dispatch import ToolExecutor
+        
+        executor = ToolExecutor(book_tools)
+        calls = [
+            ("recommend_by_knowledge_graph", {"book_info": {"title": "三体", "author": "刘慈欣", "genre": "科幻"}}),
+            ("analyze_reading_trends", {"user_history": [
+                {"title": "三体", "author": "刘慈欣", "genre": "科幻"},
+                {"title": "活着", "author": "余华", "genre": "文学"},
+            ]}),
+            ("recommend_by_preferences", {"preferences": {"favorite_genres": ["科幻"], "preferred_rating": 9.0}}),
+            ("update_user_preferences", {"user_id": "u1", "book_info": {"title": "三体", "author": "刘慈欣", "genre": "科幻"}}),
+            ("get_user_preferences", {"user_id": "u1"}),
+            ("get_similar_books", {"book_info": {"author": "刘慈欣"}}),
+        ]
+        results = executor.dispatch([
+            {"name": name, "args": args, "id": f"call_{i}"} for i, (name, args) in enumerate(calls)
+        ])
+        graph, trends, preferred, _, preferences, invalid = [message for message, _ in results]
+        self.assertTrue(json.loads(graph.content)["recommendations"])
+        self.assertEqual(json.loads(trends.content)["analysis"]["total_books"], 2)
+        self.assertTrue(all(book["rating"] >= 9.0 for book in json.loads(preferred.content)["recommendations"]))
+        self.assertIn("科幻", json.loads(preferences.content)["preferences"]["favorite_genres"])
+        self.assertNotIn(": ", graph.content)
+        # 缺少必填字段时由参数校验返回错误消息
+        self.assertEqual(invalid.status, "error")
+    
+    def test_executor_compacts_results_by_default(self):
+        """测试未指定压缩器时执行器仍通过 ResultCompactor 序列化：去掉空值、截断简介"""
+        from langchain_core.tools import tool
+        from book_compaction import CompactionMetrics, ResultCompactor
+        from book_dispatch import DispatchMetrics, ToolExecutor
+        
+        @tool
+        def details() -> dict:
+            """返回一本简介很长的图书"""
+            return {"success": True, "book": BookInfo(title="三体", author="刘慈欣", description="宇" * 500), "missing": None}
+        
+        executor = ToolExecutor([details], DispatchMetrics())
+        self.assertIsInstance(executor.compactor, ResultCompactor)
+        executor.compactor.metrics = CompactionMetrics()
+        message, _ = executor.execute({"name": "details", "args": {}, "id": "call_0"})
+        encoded = json.loads(message.content)
+        self.assertNotIn("missing", encoded)
+        self.assertNotIn("isbn", encoded["book"])
+        self.assertEqual(len(encoded["book"]["description"]), executor.compactor.description_chars + 1)
+    
+    def test_parallel_dispatch_keeps_order_and_times_out(self):
+        """测试并发调度：结果按原顺序返回，慢调用超时"""
+        import time
+        from langchain_core.tools import tool
+        from book_dispatch import DispatchMetrics, ToolExecutor
+        
+        @tool
+        def slow(seconds: float) -> str:
+            """等待指定秒数"""
+            time.sleep(seconds)
+            return f"slept {seconds}"
+        
+        executor = ToolExecutor([slow], DispatchMetrics(), max_workers=4, timeout=0.5)
+        calls = [{"name": "slow", "args": {"seconds": s}, "id": f"call_{i}"} for i, s in enumerate([0.2, 0.1, 0.2])]
+        start = time.perf_counter()
+        results = executor.dispatch(calls)
+        self.assertLess(time.perf_counter() - start, 0.45)
+        self.assertEqual([message.content for message, _ in results], ["slept 0.2", "slept 0.1", "slept 0.2"])
+        
+        message, timing = executor.dispatch([{"name": "slow", "args": {"seconds": 1.0}, "id": "call_slow"}])[0]
+        self.assertEqual(message.status, "error")
+        self.assertEqual(message.tool_call_id, "call_slow")
+        self.assertTrue(timing["timed_out"])
+    
+    def test_run_reports_llm_and_tool_time(self):
+        """测试一轮对话的耗时汇总"""
+        from langchain_core.messages import AIMessage
+        
+        with patch('book_agent.llm_with_tools') as mock_llm:
+            mock_llm.invoke.side_effect = [
+                self._tool_call_message(("recommend_by_author", {"author": "刘慈欣"})),
+                AIMessage(content="推荐《球状闪电》"),
+            ]
+            agent = BookRecommendationAgent()
+            result = agent.run("推荐刘慈欣的书")
+        
+        timings = result["timings"]
+        self.assertEqual([entry["kind"] for entry in timings["calls"]], ["llm", "tool", "llm"])
+        self.assertGreaterEqual(timings["tool_seconds"], 0.0)
+        self.assertIsInstance(result["final_messages"][2].content, str)
+
+
+class TestStreamChat(unittest.TestCase):
+    """流式聊天测试类"""
+    
+    def _mock_replies(self, mock_llm):
+        from langchain_core.messages import AIMessage
+        mock_llm.invoke.side_effect = [
+            AIMessage(content="", tool_calls=[{"name": "get_book_details", "args": {"title": "三体"}, "id": "call_1"}]),
+            AIMessage(content="推荐《球状闪电》"),
+        ]
+    
+    def test_stream_chat_events(self):
+        """测试流式事件：工具调用、文本片段与完整回复"""
+        with patch('book_agent.llm_with_tools') as mock_llm:
+            self._mock_replies(mock_llm)
+            agent = BookRecommendationAgent()
+            events = list(agent.stream_chat("推荐科幻小说", "stream_user"))
+        
+        self.assertEqual([event["type"] for event in events], ["tool", "token", "done"])
+        self.assertEqual(events[0]["name"], "get_book_details")
+        self.assertEqual(events[-1]["response"], "推荐《球状闪电》")
+        # 流式对话同样写入会话历史
+        self.assertEqual(len(agent.sessions.history("stream_user")), 2)
+    
+    def test_chat_stream_endpoint(self):
+        """测试 /chat/stream 返回 SSE 事件"""
+        with patch('book_agent.llm_with_tools') as mock_llm:
+            self._mock_replies(mock_llm)
+            import app
+            client = app.app.test_client()
+            response = client.post('/chat/stream', json={"message": "推荐科幻小说"})
+            body = response.get_data(as_text=True)
+        
+        self.assertEqual(response.mimetype, "text/event-stream")
+        data_lines = [line[5:] for line in body.splitlines() if line.startswith("data:")]
+        self.assertEqual(json.loads(data_lines[-1])["response"], "推荐《球状闪电》")
+        self.assertEqual(client.post('/chat/stream', json={}).status_code, 400)
+
+
+class TestAsyncServing(unittest.TestCase):
+    """异步服务测试类"""
+    
+    def _mock_replies(self, mock_llm):
+        from unittest.mock import AsyncMock
+        from langchain_core.messages import AIMessage
+        mock_llm.ainvoke = AsyncMock(side_effect=[
+            AIMessage(content="", tool_calls=[{"name": "get_book_details", "args": {"title": "三体"}, "id": "call_1"}]),
+            AIMessage(content="推荐《球状闪电》"),
+        ])
+    
+    def _request(self, app, method, path, payload=None):
+        """直接调用 ASGI 应用，返回状态码、响应头与响应体"""
+        import asyncio
+        
+        async def call():
+            body = json.dumps(payload or {}).encode("utf-8")
+            messages = []
+            
+            async def receive():
+                return {"type": "http.request", "body": body, "more_body": False}
+            
+            async def send(message):
+                messages.append(message)
+            
+            await app({"type": "http", "method": method, "path": path}, receive, send)
+            return messages
+        
+        messages = asyncio.run(call())
+        start = messages[0]
+        body = b"".join(message.get("body", b"") for message in messages[1:])
+        return start["status"], dict(start["headers"]), body.decode("utf-8")
+    
+    def test_async_dispatch_keeps_order_and_times_out(self):
+        """测试异步调度：并发执行、按原顺序返回，慢调用超时"""
+        import asyncio
+        import time
+        from langchain_core.tools import tool
+        from book_dispatch import DispatchMetrics, ToolExecutor
+        
+        @tool
+        def slow(seconds: float) -> str:
+            """等待指定秒数"""
+            time.sleep(seconds)
+            return f"slept {seconds}"
+        
+        executor = ToolExecutor([slow], DispatchMetrics(), max_workers=4, timeout=0.5)
+        calls = [{"name": "slow", "args": {"seconds": s}, "id": f"call_{i}"} for i, s in enumerate([0.2, 0.1, 1.0])]
+        start = time.perf_counter()
+        results = asyncio.run(executor.adispatch(calls))
+        self.assertLess(time.perf_counter() - start, 0.9)
+        self.assertEqual([message.content for message, _ in results[:2]], ["slept 0.2", "slept 0.1"])
+        self.assertEqual(results[2][0].status, "error")
+        self.assertTrue(results[2][1]["timed_out"])
+    
+    def test_sequential_dispatch_enforces_timeout(self):
+        """测试单线程模式逐个执行，每个调用同样受超时限制"""
+        import asyncio
+        import time
+        from langchain_core.tools import tool
+        from book_dispatch import DispatchMetrics, ToolExecutor
+        
+        @tool
+        def slow(seconds: float) -> str:
+            """等待指定秒数"""
+            time.sleep(seconds)
+            return f"slept {seconds}"
+        
+        executor = ToolExecutor([slow], DispatchMetrics(), max_workers=1, timeout=0.3)
+        calls = [{"name": "slow", "args": {"seconds": s}, "id": f"call_{i}"} for i, s in enumerate([0.1, 0.1, 1.0])]
+        start = time.perf_counter()
+        results = executor.dispatch(calls)
+        self.assertLess(time.perf_counter() - start, 0.9)
+        self.assertEqual([message.content for message, _ in results[:2]], ["slept 0.1", "slept 0.1"])
+        self.assertTrue(results[2][1]["timed_out"])
+        # 超时的调用仍在后台运行，不占用后续调用的线程
+        self.assertEqual(executor.dispatch(calls[:1])[0][0].content, "slept 0.1")
+        results = asyncio.run(executor.adispatch(calls[2:] + calls[:1]))
+        self.assertTrue(results[0][1]["timed_out"])
+        self.assertEqual(results[1][0].content, "slept 0.1")
+    
+    def test_concurrent_requests_do_not_share_deadline_queue(self):
+        """测试多个请求同时调度时互不排队，超时只计算工具实际执行的时间"""
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        from langchain_core.tools import tool
+        from book_dispatch import DispatchMetrics, ToolExecutor
+        
+        @tool
+        def slow(seconds: float) -> str:
+            """等待指定秒数"""
+            time.sleep(seconds)
+            return f"slept {seconds}"
+        
+        executor = ToolExecutor([slow], DispatchMetrics(), max_workers=2, timeout=0.5)
+        calls = [{"name": "slow", "args": {"seconds": 0.2}, "id": f"call_{i}"} for i in range(2)]
+        with ThreadPoolExecutor(16) as requests:
+            batches = list(requests.map(lambda _: executor.dispatch(calls), range(16)))
+        self.assertFalse(any(timing.get("timed_out") for results in batches for _, timing in results))
+    
+    def test_arun_uses_async_model(self):
+        """测试异步运行：模型通过 ainvoke 调用，结果与同步版本一致"""
+        import asyncio
+        
+        with patch('book_agent.llm_with_tools') as mock_llm:
+            self._mock_replies(mock_llm)
+            agent = BookRecommendationAgent()
+            response = asyncio.run(agent.achat("推荐科幻小说", "async_user"))
+        
+        self.assertEqual(response, "推荐《球状闪电》")
+        self.assertEqual(mock_llm.ainvoke.call_count, 2)
+        mock_llm.invoke.assert_not_called()
+        self.assertEqual(len(agent.sessions.history("async_user")), 2)
+
+    def test_async_paths_keep_blocking_work_off_loop(self):
+        """测试异步接口中的偏好读取、会话记录与反馈提交都不在事件循环线程上执行"""
+        import asyncio
+        import threading
+        from asgi import BookAgentASGI
+
+        with patch('book_agent.llm_with_tools') as mock_llm:
+            self._mock_replies(mock_llm)
+            agent = BookRecommendationAgent()
+            threads = {}
+            for name in ("_build_preference_hint", "_post_interaction", "_semantic_store", "submit_feedback"):
+                original = getattr(agent, name)
+
+                def wrapper(*args, _name=name, _original=original, **kwargs):
+                    threads[_name] = threading.get_ident()
+                    return _original(*args, **kwargs)
+                setattr(agent, name, wrapper)
+
+            async def main():
+                loop_thread = threading.get_ident()
+                await agent.achat("推荐科幻小说", "async_user")
+                app = BookAgentASGI(agent)
+                body = json.dumps({"user_id": "async_user", "book_title": "三体", "rating": 5}).encode("utf-8")
+
+                async def receive():
+                    return {"type": "http.request", "body": body}
+
+                async def send(message):
+                    pass
+
+                await app({"type": "http", "method": "POST", "path": "/feedback"}, receive, send)
+                return loop_thread
+
+            loop_thread = asyncio.run(main())
+
+        self.assertEqual(set(threads), {"_build_preference_hint", "_post_interaction", "_semantic_store", "submit_feedback"})
+        self.assertNotIn(loop_thread, threads.values())
+
+    def test_asgi_routes(self):
+        """测试 ASGI 应用的聊天、流式与静态文件路由"""
+        from asgi import BookAgentASGI
+        
+        with patch('book_agent.llm_with_tools') as mock_llm:
+            app = BookAgentASGI(BookRecommendationAgent())
+            self._mock_replies(mock_llm)
+            status, _, body = self._request(app, "POST", "/chat", {"message": "推荐科幻小说"})
+            self.assertEqual((status, json.loads(body)["response"]), (200, "推荐《球状闪电》"))
+            
+            self._mock_replies(mock_llm)
+            status, headers, body = self._request(app, "POST", "/chat/stream", {"message": "推荐科幻小说"})
+            self.assertTrue(headers[b"content-type"].startswith(b"text/event-stream"))
+            data_lines = [line[5:] for line in body.splitlines() if line.startswith("data:")]
+            self.assertEqual(json.loads(data_lines[-1])["response"], "推荐《球状闪电》")
+        
+        self.assertEqual(self._request(app, "POST", "/chat", {})[0], 400)
+        self.assertEqual(self._request(app, "GET", "/")[0], 200)
+        self.assertEqual(self._request(app, "GET", "/config.py")[0], 404)
+    
+    def test_asgi_errors_return_json(self):
+        """测试 Agent 抛出异常时返回 JSON 格式的 500 错误"""
+        from asgi import BookAgentASGI
+        
+        class FailingAgent:
+            async def achat(self, message, user_id=None, bypass_cache=False):
+                raise RuntimeError("模型不可用")
+            
+            async def arecommend_books(self, book_title, user_id=None):
+                raise RuntimeError("模型不可用")
+        
+        app = BookAgentASGI(FailingAgent())
+        for path, payload in (("/chat", {"message": "你好"}), ("/recommend", {"book_title": "三体"})):
+            status, headers, body = self._request(app, "POST", path, payload)
+            self.assertEqual(status, 500)
+            self.assertEqual(headers[b"content-type"], b"application/json")
+            self.assertEqual(json.loads(body), {"error": "模型不可用"})
+    
+    def test_asgi_bounded_concurrency(self):
+        """测试同时运行的对话数不超过上限，其余请求排队"""
+        import asyncio
+        from asgi import BookAgentASGI
+        
+        class SlowAgent:
+            running = 0
+            peak = 0
+            
+            async def achat(self, message, user_id=None, bypass_cache=False):
+                SlowAgent.running += 1
+                SlowAgent.peak = max(SlowAgent.peak, SlowAgent.running)
+                await asyncio.sleep(0.05)
+                SlowAgent.running -= 1
+                return message
+        
+        app = BookAgentASGI(SlowAgent(), max_concurrency=2)
+        
+        async def call(i):
+            body = json.dumps({"message": f"m{i}"}).encode("utf-8")
+            
+            async def receive():
+                return {"type": "http.request", "body": body}
+            
+            async def send(message):
+                pass
+            
+            await app({"type": "http", "method": "POST", "path": "/chat"}, receive, send)
+        
+        async def main():
+            await asyncio.gather(*(call(i) for i in range(6)))
+        
+        asyncio.run(main())
+        self.assertEqual(SlowAgent.peak, 2)
+
+
+class TestLLMResponseCache(unittest.TestCase):
+    """LLM 响应缓存测试类"""
+    
+    def _replies(self):
+        from langchain_core.messages import AIMessage
+        return [
+            AIMessage(content="", tool_calls=[{"name": "get_book_details", "args": {"title": "三体"}, "id": "call_1"}]),
+            AIMessage(content="推荐《球状闪电》"),
+        ]
+    
+    def test_key_ignores_ids_and_whitespace(self):
+        """测试缓存键忽略消息 ID 与多余空白，内容或工具变化时不同"""
+        from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+        
+        def conversation(call_id, text):
+            return [
+                HumanMessage(content=text),
+                AIMessage(content="", tool_calls=[{"name": "search_books", "args": {"query": "三体"}, "id": call_id}]),
+                ToolMessage(content="{}", name="search_books", tool_call_id=call_id),
+            ]
+        
+        key = cache_key(conversation("call_a", "搜索《三体》"), "m", 0.7, "tools")
+        self.assertEqual(key, cache_key(conversation("call_b", "  搜索《三体》\n"), "m", 0.7, "tools"))
+        self.assertNotEqual(key, cache_key(conversation("call_a", "搜索《活着》"), "m", 0.7, "tools"))
+        self.assertNotEqual(key, cache_key(conversation("call_a", "搜索《三体》"), "m", 0.7, "other"))
+    
+    def test_lru_ttl_and_sqlite_tier(self):
+        """测试 LRU 淘汰、过期与 SQLite 层"""
+        from langchain_core.messages import AIMessage
+        
+        cache = LLMResponseCache(max_entries=2, ttl=60)
+        for key in ("a", "b", "c"):
+            cache.put(key, AIMessage(content=key, id=f"id_{key}"))
+        self.assertIsNone(cache.get("a"))
+        cached = cache.get("c")
+        self.assertEqual(cached.content, "c")
+        self.assertIsNone(cached.id)
+        self.assertEqual(cache.stats()["evictions"], 1)
+        
+        expiring = LLMResponseCache(ttl=0)
+        expiring.put("a", AIMessage(content="a"))
+        self.assertIsNone(expiring.get("a"))
+        self.assertEqual(expiring.stats()["expired"], 1)
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "llm_cache.db")
+            LLMResponseCache(path=path).put("k", AIMessage(content="", tool_calls=[
+                {"name": "search_books", "args": {"query": "三体"}, "id": "call_1"}
+            ]))
+            restored = LLMResponseCache(path=path)
+            message = restored.get("k")
+            self.assertEqual(message.tool_calls[0]["name"], "search_books")
+            self.assertEqual(restored.stats()["disk_hits"], 1)
+    
+    def test_repeated_question_skips_llm(self):
+        """测试重复提问（含工具步骤）命中缓存，bypass_cache 时重新调用模型"""
+        with patch('book_agent.llm_with_tools') as mock_llm, \
+                patch('book_agent.llm_cache', LLMResponseCache()) as cache:
+            mock_llm.invoke.side_effect = self._replies() + self._replies()
+            agent = BookRecommendationAgent()
+            self.assertEqual(agent.chat("推荐科幻小说", "cache_user"), "推荐《球状闪电》")
+            result = agent.run("推荐科幻小说", "other_user")
+            self.assertEqual(mock_llm.invoke.call_count, 2)
+            self.assertTrue(all(entry.get("cached") for entry in result["timings"]["calls"] if entry["kind"] == "llm"))
+            self.assertEqual(result["final_messages"][-1].content, "推荐《球状闪电》")
+            self.assertEqual(cache.stats()["hits"], 2)
+            
+            agent.run("推荐科幻小说", "other_user", bypass_cache=True)
+            self.assertEqual(mock_llm.invoke.call_count, 4)
+
+
+class TestToolResultCache(unittest.TestCase):
+    """工具结果缓存测试类"""
+    
+    def setUp(self):
+        self.db = BookDatabase(books=[
+            {"title": "三体", "author": "刘慈欣", "genre": "科幻", "rating": 9.0},
+            {"title": "球状闪电", "author": "刘慈欣", "genre": "科幻", "rating": 8.5},
+        ])
+        self.search_tool = BookSearchTool(self.db)
+        self.recommendation_tool = BookRecommendationTool(self.db)
+        tool_result_cache.clear()
+    
+    def test_repeated_calls_hit(self):
+        """测试相同参数（位置参数与关键字参数、省略默认值）命中缓存"""
+        first = self.recommendation_tool.recommend_by_genre("科幻")
+        self.assertEqual(self.recommendation_tool.recommend_by_genre(genre="科幻", exclude_books=None), first)
+        self.search_tool.search_books("三体")
+        self.search_tool.search_books("三体", 10)
+        self.search_tool.search_books("三体", 5)
+        stats = tool_result_cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 3))
+    
+    def test_mutating_result_does_not_affect_cache(self):
+        """测试修改返回的结果（首次计算与命中）不影响之后的调用"""
+        first = self.search_tool.get_book_details("三体")
+        first["book"]["rating"] = 0
+        second = self.search_tool.get_book_details("三体")
+        self.assertEqual(second["book"]["rating"], 9.0)
+        second["book"]["rating"] = 0
+        second["book"].clear()
+        self.assertEqual(self.search_tool.get_book_details("三体")["book"]["rating"], 9.0)
+        self.assertEqual(tool_result_cache.stats()["hits"], 2)
+    
+    def test_catalog_changes_invalidate(self):
+        """测试增加图书、修改知识图谱与替换目录后不再返回旧结果"""
+        self.assertEqual(self.recommendation_tool.recommend_by_genre("科幻")["count"], 2)
+        self.db.add_book({"title": "流浪地球", "author": "刘慈欣", "genre": "科幻", "rating": 8.0})
+        self.assertEqual(self.recommendation_tool.recommend_by_genre("科幻")["count"], 3)
+        self.assertEqual(tool_result_cache.stats()["invalidations"], 1)
+        
+        self.search_tool.get_book_details("三体")
+        self.db.mark_changed()
+        self.search_tool.get_book_details("三体")
+        self.assertEqual(tool_result_cache.stats()["hits"], 0)
+        
+        other = BookSearchTool(BookDatabase(books=[{"title": "活着", "author": "余华", "genre": "文学"}]))
+        self.assertFalse(other.get_book_details("三体")["success"])
+    
+    def test_bounded_entries(self):
+        """测试条数上限"""
+        cache = ToolResultCache(max_entries=2)
+        for title in ("三体", "球状闪电", "流浪地球"):
+            cache.get_or_compute(self.db, "details", {"title": title}, lambda: title)
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertEqual(cache.get_or_compute(self.db, "details", {"title": "三体"}, lambda: "recomputed"), "recomputed")
+
+
+class TestSemanticCache(unittest.TestCase):
+    """语义响应缓存测试类"""
+    
+    def test_paraphrase_hits_within_scope(self):
+        """测试换了说法的问题命中，意图、实体或偏好提示不同时不命中"""
+        genre = [("genre", "科幻")]
+        self.assertEqual(normalize_query("给我推荐几本科幻！", genre), normalize_query("推荐科幻小说", genre))
+        
+        cache = SemanticResponseCache(threshold=0.7)
+        cache.store("给我推荐几本科幻", genre, None, "推荐《三体》")
+        self.assertEqual(cache.lookup("推荐科幻小说", genre), "推荐《三体》")
+        self.assertIsNone(cache.lookup("搜索科幻", genre))
+        self.assertIsNone(cache.lookup("推荐悬疑小说", [("genre", "悬疑")]))
+        self.assertIsNone(cache.lookup("推荐科幻小说", genre, hint="- 最近关注的作者：刘慈欣"))
+        self.assertIsNone(cache.lookup("推荐科幻小说", genre, version=(1, 1)))
+        self.assertEqual(cache.stats()["hits"], 1)
+    
+    def test_follow_ups_and_qualifiers_miss(self):
+        """测试追问（再、换、其他、更多）不命中也不写入，排序与数量限定词不同时不命中"""
+        genre = [("genre", "科幻")]
+        cache = SemanticResponseCache(threshold=0.7)
+        cache.store("推荐科幻小说", genre, None, "推荐《三体》")
+        for text in ("再推荐几本科幻", "换几本科幻", "还有其他科幻小说吗", "推荐更多科幻", "别的科幻呢"):
+            self.assertIsNone(cache.lookup(text, genre), text)
+        for text in ("推荐评分最高的科幻", "推荐3本科幻", "推荐五本科幻", "推荐经典科幻", "推荐最新的科幻"):
+            self.assertIsNone(cache.lookup(text, genre), text)
+        
+        cache.store("再推荐几本科幻", genre, None, "推荐《球状闪电》")
+        self.assertEqual(cache.stats()["stores"], 1)
+        self.assertEqual(cache.lookup("推荐科幻", genre), "推荐《三体》")
+        cache.store("推荐评分最高的科幻", genre, None, "推荐《三体》（9.0 分）")
+        self.assertEqual(cache.lookup("评分最高的科幻推荐", genre), "推荐《三体》（9.0 分）")
+    
+    def test_lru_and_ttl(self):
+        """测试条数上限与过期"""
+        cache = SemanticResponseCache(max_entries=1)
+        cache.store("推荐科幻", [("genre", "科幻")], None, "a")
+        cache.store("推荐悬疑", [("genre", "悬疑")], None, "b")
+        self.assertIsNone(cache.lookup("推荐科幻", [("genre", "科幻")]))
+        self.assertEqual(cache.stats()["evictions"], 1)
+        
+        expiring = SemanticResponseCache(ttl=0)
+        expiring.store("推荐科幻", [("genre", "科幻")], None, "a")
+        self.assertIsNone(expiring.lookup("推荐科幻", [("genre", "科幻")]))
+        self.assertEqual(expiring.stats()["expired"], 1)
+    
+    def test_chat_reuses_answer_for_paraphrase(self):
+        """测试 chat 对换了说法的问题直接返回缓存回复并记录历史，bypass_cache 时重新运行"""
+        from langchain_core.messages import AIMessage
+        with patch('book_agent.llm_with_tools') as mock_llm:
+            mock_llm.invoke.side_effect = [AIMessage(content="推荐《三体》"), AIMessage(content="推荐《球状闪电》")]
+            agent = BookRecommendationAgent()
+            agent.semantic_cache = SemanticResponseCache()
+            self.assertEqual(agent.chat("给我推荐几本科幻", "semantic_user"), "推荐《三体》")
+            self.assertEqual(agent.chat("推荐科幻小说", "semantic_other"), "推荐《三体》")
+            self.assertEqual(mock_llm.invoke.call_count, 1)
+            history = agent.sessions.history("semantic_other")
+            self.assertEqual([entry["role"] for entry in history], ["user", "assistant"])
+            
+            self.assertEqual(agent.chat("推荐科幻小说", "semantic_other", bypass_cache=True), "推荐《球状闪电》")
+            self.assertEqual(mock_llm.invoke.call_count, 2)
+    
+    def test_user_specific_answers_not_cached(self):
+        """测试调用过用户相关工具的回答不进入缓存"""
+        from langchain_core.messages import AIMessage
+        
+        def replies():
+            return [
+                AIMessage(content="", tool_calls=[
+                    {"name": "get_user_preferences", "args": {"user_id": "semantic_user"}, "id": "call_1"}
+                ]),
+                AIMessage(content="根据你的偏好推荐《三体》"),
+            ]
+        
+        with patch('book_agent.llm_with_tools') as mock_llm:
+            mock_llm.invoke.side_effect = replies() + replies()
+            agent = BookRecommendationAgent()
+            agent.semantic_cache = SemanticResponseCache()
+            agent.chat("根据我的偏好推荐科幻", "semantic_user")
+            agent.chat("根据我的偏好推荐科幻", "semantic_user")
+            self.assertEqual(mock_llm.invoke.call_count, 4)
+            self.assertEqual(agent.semantic_cache.stats()["stores"], 0)
+
+
+class TestFastPathRouter(unittest.TestCase):
+    """快速路由测试类"""
+    
+    def setUp(self):
+        self.agent = BookRecommendationAgent()
+        self.agent.router = IntentRouter()
+    
+    def _intent(self, text):
+        decision = self.agent.router.classify(text, self.agent.entity_matcher.extract(text))
+        return decision and (decision["intent"], decision["query"])
+    
+    def test_simple_intents(self):
+        """测试简单意图识别为对应的意图与检索词"""
+        self.assertEqual(self._intent("搜索《三体》"), (SEARCH, "三体"))
+        self.assertEqual(self._intent("查找宇宙文明"), (SEARCH, "宇宙文明"))
+        self.assertEqual(self._intent("《三体》的详细信息"), (DETAILS, "三体"))
+        self.assertEqual(self._intent("我看了三体，推荐类似的"), (SIMILAR_BOOKS, "三体"))
+        self.assertEqual(self._intent("给我推荐几本科幻"), (GENRE_RECOMMENDATION, "科幻"))
+        self.assertEqual(self._intent("刘慈欣写过哪些书"), (AUTHOR_RECOMMENDATION, "刘慈欣"))
+    
+    def test_search_term_keeps_original_text(self):
+        """测试搜索词取自原始问题，书名中的的、了、本、我、书不被去掉"""
+        self.assertEqual(self._intent("搜索本杰明"), (SEARCH, "本杰明"))
+        self.assertEqual(self._intent("查询的确良"), (SEARCH, "的确良"))
+        self.assertEqual(self._intent("查找了不起的小书虫"), (SEARCH, "了不起的小书虫"))
+        self.assertEqual(self._intent("搜索我本善良？"), (SEARCH, "我本善良"))
+        self.assertEqual(self._intent("帮我搜索一下《书剑恩仇录》吧"), (SEARCH, "书剑恩仇录"))
+    
+    def test_complex_questions_escalate(self):
+        """测试比较、个性化、多实体等问题不走快速路由"""
+        for text in ("比较三体和球状闪电", "根据我的偏好推荐科幻", "推荐刘慈欣的科幻", "为什么推荐三体", "帮我分析阅读趋势"):
+            self.assertIsNone(self._intent(text), text)
+    
+    def test_chat_answers_without_llm(self):
+        """测试简单意图不调用模型并记录历史，有偏好提示的推荐仍交给模型"""
+        from langchain_core.messages import AIMessage
+        with patch('book_agent.llm_with_tools') as mock_llm:
+            mock_llm.invoke.return_value = AIMessage(content="结合偏好推荐《球状闪电》")
+            response = self.agent.chat("推荐科幻小说", "fast_user")
+            self.assertIn("推荐科幻类型的图书", response)
+            self.assertIn("《三体》", response)
+            self.assertIn("作者: 刘慈欣", self.agent.chat("《三体》的详细信息", "fast_user"))
+            mock_llm.invoke.assert_not_called()
+            self.assertEqual(len(self.agent.sessions.history("fast_user")), 4)
+            
+            self.assertEqual(self.agent.chat("推荐科幻小说", "fast_user"), "结合偏好推荐《球状闪电》")
+            self.assertEqual(mock_llm.invoke.call_count, 1)
+
+
+class TestResultCompaction(unittest.TestCase):
+    """工具结果压缩测试类"""
+    
+    def setUp(self):
+        from book_compaction import CompactionMetrics, ResultCompactor
+        self.metrics = CompactionMetrics()
+        self.compactor = ResultCompactor(description_chars=10, metrics=self.metrics)
+        self.books = BookSearchTool().search_books("刘慈欣", 10)
+    
+    def test_projection_and_dedupe(self):
+        """测试字段投影、简介截断与已发送图书去重"""
+        from book_compaction import CompactionContext
+        
+        context = CompactionContext()
+        first = json.loads(self.compactor.compact("search_books", self.books, context))
+        book = first["results"][0]
+        self.assertNotIn("isbn", book)
+        self.assertNotIn("publisher", book)
+        self.assertLessEqual(len(book["description"]), 11)
+        self.assertEqual(len(context.new_titles), first["count"])
+        
+        second = json.loads(self.compactor.compact(
+            "recommend_by_author",
+            BookRecommendationTool().recommend_by_author("刘慈欣"),
+            context
+        ))
+        self.assertTrue(all(item.get("seen") for item in second["recommendations"]))
+        
+        # 查询详细信息的工具保留完整字段
+        details = json.loads(self.compactor.compact("get_book_details", BookSearchTool().get_book_details("三体"), context))
+        self.assertIn("isbn", details["book"])
+        
+        stats = self.metrics.snapshot()
+        self.assertEqual(stats["results"], 3)
+        self.assertGreater(stats["saved_tokens"], 0)
+        self.assertGreater(stats["deduped_books"], 0)
+    
+    def test_token_budget(self):
+        """测试超出预算时去掉简介并缩短列表"""
+        from book_compaction import CompactionContext, estimate_tokens
+        
+        context = CompactionContext(budget=120)
+        encoded = self.compactor.compact("search_books", self.books, context)
+        self.assertLessEqual(estimate_tokens(encoded), 120)
+        result = json.loads(encoded)
+        self.assertTrue(result["truncated"])
+        self.assertNotIn("description", result["results"][0])
+        self.assertEqual(len(context.new_titles), len(result["results"]))
+        
+        # 预算用尽后返回提示
+        exhausted = json.loads(self.compactor.compact("search_books", self.books, CompactionContext(budget=5)))
+        self.assertFalse(exhausted["success"])
+    
+    def test_dedupe_across_tool_steps(self):
+        """测试同一轮对话中后续工具步骤不重复发送图书"""
+        from langchain_core.messages import AIMessage
+        
+        def tool_call(name, args, call_id):
+            return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": call_id}])
+        
+        with patch('book_agent.llm_with_tools') as mock_llm:
+            mock_llm.invoke.side_effect = [
+                tool_call("search_books", {"query": "刘慈欣"}, "call_1"),
+                tool_call("recommend_by_author", {"author": "刘慈欣"}, "call_2"),
+                AIMessage(content="推荐完成"),
+            ]
+            result = BookRecommendationAgent().run("推荐刘慈欣的书")
+        
+        second = json.loads(result["final_messages"][4].content)
+        self.assertTrue(all(item.get("seen") for item in second["recommendations"]))
+        self.assertGreater(result["tool_tokens"], 0)
+
+
 class TestBookAgentIntegration(unittest.TestCase):
     """图书推荐Agent集成测试"""
     
@@ -189,7 +1800,26 @@ def run_book_tests():
     
     # 添加测试用例
     test_suite.addTest(unittest.makeSuite(TestBookTools))
+    test_suite.addTest(unittest.makeSuite(TestCatalogRegistry))
+    test_suite.addTest(unittest.makeSuite(TestBookDatabaseIndexes))
+    test_suite.addTest(unittest.makeSuite(TestColumnarBookStore))
+    test_suite.addTest(unittest.makeSuite(TestCompiledKnowledgeGraph))
+    test_suite.addTest(unittest.makeSuite(TestBookSearchIndex))
+    test_suite.addTest(unittest.makeSuite(TestEntityMatcher))
+    test_suite.addTest(unittest.makeSuite(TestBookEmbeddingIndex))
+    test_suite.addTest(unittest.makeSuite(TestSQLiteBookDatabase))
+    test_suite.addTest(unittest.makeSuite(TestCatalogLoader))
+    test_suite.addTest(unittest.makeSuite(TestSessionStore))
+    test_suite.addTest(unittest.makeSuite(TestUserStore))
     test_suite.addTest(unittest.makeSuite(TestBookAgent))
+    test_suite.addTest(unittest.makeSuite(TestToolDispatch))
+    test_suite.addTest(unittest.makeSuite(TestStreamChat))
+    test_suite.addTest(unittest.makeSuite(TestAsyncServing))
+    test_suite.addTest(unittest.makeSuite(TestLLMResponseCache))
+    test_suite.addTest(unittest.makeSuite(TestToolResultCache))
+    test_suite.addTest(unittest.makeSuite(TestSemanticCache))
+    test_suite.addTest(unittest.makeSuite(TestFastPathRouter))
+    test_suite.addTest(unittest.makeSuite(TestResultCompaction))
     test_suite.addTest(unittest.makeSuite(TestBookAgentIntegration))
     
     # 运行测试
@@ -0,0 +1,110 @@
+"""
+工具结果缓存
+
+推荐、搜索、相似图书等工具的结果只取决于参数与当前目录，同一目录下对所有用户都相同。
+被 ToolResultCache.memoize 装饰的工具方法按 (目录, 目录版本, 方法, 参数) 缓存结果：
+- 目录版本即 BookDatabase.version，增删改图书或修改知识图谱（mark_changed）时递增，
+  旧版本的结果不再命中，并在首次发现版本变化时整体清除
+- 目录通过注册表替换后是另一个数据库对象，键随之不同
+- 进程内按 LRU 保留最多 max_entries 条
+缓存中保存结果的深拷贝，命中时也返回深拷贝，调用方修改返回值不会影响缓存与其他调用方。
+"""
+import copy
+import functools
+import inspect
+import json
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Tuple
+
+
+_MISSING = object()
+
+class ToolResultCache:
+    """工具结果缓存（线程安全）"""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        # (目录 ID, 目录版本, 方法, 参数) -> (目录弱引用, 结果)，按最近使用排序
+        self._entries: "OrderedDict[Tuple[int, Any, str, str], Tuple[weakref.ref, Any]]" = OrderedDict()
+        # 目录 ID -> (目录弱引用, 最近一次见到的版本)
+        self._versions: Dict[int, Tuple[weakref.ref, Any]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "invalidations": 0}
+
+    def _check_version(self, db: Any, version: Any) -> None:
+        """目录版本变化（或 ID 被新对象复用）时清除该目录的全部结果，调用方需持有锁"""
+        known = self._versions.get(id(db))
+        if known is not None and known[0]() is db and known[1] == version:
+            return
+        if known is not None:
+            stale = [key for key in self._entries if key[0] == id(db)]
+            for key in stale:
+                del self._entries[key]
+            self._stats["invalidations"] += len(stale)
+            # 顺便清理已被回收的目录
+            for db_id in [db_id for db_id, (ref, _) in self._versions.items() if ref() is None]:
+                del self._versions[db_id]
+        self._versions[id(db)] = (weakref.ref(db), version)
+
+    def get_or_compute(self, db: Any, name: str, arguments: Dict[str, Any], compute: Callable[[], Any]) -> Any:
+        """命中时返回缓存结果的深拷贝，否则调用 compute 计算并缓存其深拷贝（计算在锁外进行）"""
+        version = db.version
+        key = (id(db), version, name, json.dumps(arguments, ensure_ascii=False, sort_keys=True, default=str))
+        with self._lock:
+            self._check_version(db, version)
+            entry = self._entries.get(key)
+            cached = _MISSING
+            if entry is not None and entry[0]() is db:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                cached = entry[1]
+            else:
+                self._stats["misses"] += 1
+        # 拷贝在锁外进行
+        if cached is not _MISSING:
+            return copy.deepcopy(cached)
+        result = compute()
+        stored = copy.deepcopy(result)
+        with self._lock:
+            self._entries[key] = (weakref.ref(db), stored)
+            self._entries.move_to_end(key)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return result
+
+    def memoize(self, method: Callable[..., Any]) -> Callable[..., Any]:
+        """装饰工具方法：按方法所属工具的 db 与绑定后的参数（含默认值）缓存结果"""
+        signature = inspect.signature(method)
+        name = method.__qualname__
+
+        @functools.wraps(method)
+        def wrapper(tool: Any, *args: Any, **kwargs: Any) -> Any:
+            bound = signature.bind(tool, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            arguments.pop("self", None)
+            return self.get_or_compute(tool.db, name, arguments, lambda: method(tool, *args, **kwargs))
+
+        return wrapper
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计（含命中率与当前条目数）"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        """清空缓存与统计"""
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            for key in self._stats:
+                self._stats[key] = 0
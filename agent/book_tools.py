@@ -1,19 +1,745 @@
 """
 图书推荐相关工具
 """
+import csv
+import heapq
 import json
+import math
+import os
+import sys
+import threading
+from array import array
+from collections.abc import Mapping
 import requests
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable, Iterable, Iterator, Union
 from datetime import datetime
 import random
 
+import numpy as np
+from pydantic import ValidationError
 
-class BookDatabase:
-    """模拟图书数据库"""
+from book_graph import (
+    AUTHOR,
+    BELONGS_TO,
+    BOOK,
+    GENRE,
+    SAME_STYLE,
+    SIMILAR_GENRE,
+    STYLE,
+    WROTE,
+    CompiledKnowledgeGraph,
+    compile_knowledge_graph,
+    graph_fields_changed,
+)
+from book_embedding import BookEmbeddingIndex, content_fields_changed, load_or_build_embedding_index
+from book_index import BookSearchIndex
+from book_state import BookInfo
+from book_tool_cache import ToolResultCache
+from book_user_store import get_user_store
+from config import (
+    BOOK_CATALOG_PATH,
+    CATALOG_CHUNK_SIZE,
+    BOOK_STORAGE_BACKEND,
+    BOOK_SQLITE_PATH,
+    BOOK_EMBEDDING_PATH,
+    BOOK_EMBEDDING_DIM,
+    TOOL_CACHE_ENABLED,
+    TOOL_CACHE_MAX_ENTRIES,
+)
+
+
+# 外部目录中空字符串按缺失处理的字段
+_OPTIONAL_BOOK_FIELDS = ("isbn", "genre", "rating", "description", "publication_year", "publisher")
+
+
+def _normalize_catalog_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """使用 BookInfo 校验一行目录数据，并转换为工具使用的图书字典"""
+    cleaned = {}
+    for key, value in row.items():
+        if isinstance(value, str):
+            value = value.strip()
+            if value == "" and key in _OPTIONAL_BOOK_FIELDS:
+                value = None
+        cleaned[key] = value
+    book = BookInfo.model_validate(cleaned).model_dump()
+    # 工具层按字符串处理类型和简介，缺失时使用空串
+    book["genre"] = book["genre"] or ""
+    book["description"] = book["description"] or ""
+    return book
+
+
+def _coerce_number(value: Any, cast: Callable[[Any], Any]) -> Optional[Any]:
+    """把模型传入的年份、评分（可能是字符串）转换为数字；无法转换时返回 None"""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _iter_catalog_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """逐行读取 JSONL 或 CSV 目录文件，不一次性载入整个文件"""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8", newline="") as handle:
+        if extension in (".jsonl", ".ndjson"):
+            for line in handle:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    yield {}
+        elif extension == ".csv":
+            for row in csv.DictReader(handle):
+                yield row
+        else:
+            raise ValueError(f"不支持的目录文件格式: {path}")
+
+
+def iter_catalog_chunks(path: str, chunk_size: int = CATALOG_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """按块流式读取并校验目录文件
+
+    每次产出 {"books": [...], "skipped": n}，books 为通过 BookInfo 校验的图书，
+    skipped 为该块中校验失败被跳过的行数。
+    """
+    books: List[Dict[str, Any]] = []
+    skipped = 0
+    for row in _iter_catalog_rows(path):
+        try:
+            books.append(_normalize_catalog_row(row))
+        except (ValidationError, AttributeError):
+            skipped += 1
+        if len(books) + skipped >= chunk_size:
+            yield {"books": books, "skipped": skipped}
+            books = []
+            skipped = 0
+    if books or skipped:
+        yield {"books": books, "skipped": skipped}
+
+
+def _normalize_key(value: Optional[str]) -> str:
+    """索引键归一化：去除首尾空白并统一大小写"""
+    return value.strip().casefold() if value else ""
+
+
+def _normalize_isbn(value: Optional[str]) -> str:
+    """ISBN 归一化：去除连字符与空白"""
+    return value.replace("-", "").replace(" ", "").strip() if value else ""
+
+
+class _StringColumn:
+    """字节堆存储的字符串列：每个值只占 (起始偏移, 长度) 两个数组槽位，避免逐个 str 对象开销
+
+    纯 ASCII 值按 ASCII 存储（1 字节/字符），其余按 UTF-16-LE 存储（中文 2 字节/字符），
+    长度最高位标记编码方式。更新时新值不超过原占用就原地覆盖，否则追加到堆尾；
+    被替换或删除的值留下的空洞超过堆大小一半时整体压缩一次。
+    """
+    
+    _NONE = 0xFFFFFFFF
+    _UTF16_FLAG = 0x80000000
+    # 堆小于该字节数时不压缩
+    _COMPACT_MIN_BYTES = 4096
+    
+    def __init__(self):
+        self._data = bytearray()
+        self._starts = array("Q")
+        self._lengths = array("I")
+        self._garbage = 0
+    
+    def _size(self, row: int) -> int:
+        """该行值在堆中占用的字节数"""
+        length = self._lengths[row]
+        return 0 if length == self._NONE else length & ~self._UTF16_FLAG
+    
+    def append(self, value: Optional[str]) -> None:
+        self._starts.append(0)
+        self._lengths.append(self._NONE)
+        self.set(len(self._starts) - 1, value)
+    
+    def set(self, row: int, value: Optional[str]) -> None:
+        old_size = self._size(row)
+        if value is None:
+            self._starts[row] = 0
+            self._lengths[row] = self._NONE
+            self._release(old_size)
+            return
+        value = str(value)
+        if value.isascii():
+            encoded = value.encode("ascii")
+            length = len(encoded)
+        else:
+            encoded = value.encode("utf-16-le")
+            length = len(encoded) | self._UTF16_FLAG
+        size = len(encoded)
+        if size <= old_size:
+            # 原位置放得下（包括值未变化）时直接覆盖，剩余字节记为空洞
+            start = self._starts[row]
+            self._data[start:start + size] = encoded
+            self._lengths[row] = length
+            self._release(old_size - size)
+            return
+        self._starts[row] = len(self._data)
+        self._lengths[row] = length
+        self._data.extend(encoded)
+        self._release(old_size)
+    
+    def _release(self, size: int) -> None:
+        self._garbage += size
+        if self._garbage > self._COMPACT_MIN_BYTES and self._garbage * 2 > len(self._data):
+            self._compact()
+    
+    def _compact(self) -> None:
+        """按行重新排布堆，丢弃空洞"""
+        data = bytearray()
+        for row in range(len(self._starts)):
+            size = self._size(row)
+            start = self._starts[row]
+            self._starts[row] = len(data)
+            data += self._data[start:start + size]
+        self._data = data
+        self._garbage = 0
+    
+    def get(self, row: int) -> Optional[str]:
+        length = self._lengths[row]
+        if length == self._NONE:
+            return None
+        start = self._starts[row]
+        if length & self._UTF16_FLAG:
+            length &= ~self._UTF16_FLAG
+            return self._data[start:start + length].decode("utf-16-le")
+        return self._data[start:start + length].decode("ascii")
+
+
+class _InternedColumn:
+    """低基数字符串列（作者、类型、出版社）：驻留字符串池 + 整型编码数组"""
+    
+    def __init__(self):
+        self._pool: List[Optional[str]] = [None]
+        self._codes_by_value: Dict[str, int] = {}
+        self._codes = array("I")
+    
+    def _code(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        code = self._codes_by_value.get(value)
+        if code is None:
+            code = len(self._pool)
+            value = sys.intern(str(value))
+            self._pool.append(value)
+            self._codes_by_value[value] = code
+        return code
+    
+    def append(self, value: Optional[str]) -> None:
+        self._codes.append(self._code(value))
+    
+    def set(self, row: int, value: Optional[str]) -> None:
+        self._codes[row] = self._code(value)
+    
+    def get(self, row: int) -> Optional[str]:
+        return self._pool[self._codes[row]]
+
+
+class BookView(Mapping):
+    """列式存储中一本图书的只读视图，按需读取字段"""
+    
+    __slots__ = ("_store", "_row")
+    
+    def __init__(self, store: "ColumnarBookStore", row: int):
+        self._store = store
+        self._row = row
+    
+    def __getitem__(self, field: str) -> Any:
+        return self._store.get_field(self._row, field)
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(ColumnarBookStore.FIELDS)
+    
+    def __len__(self) -> int:
+        return len(ColumnarBookStore.FIELDS)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: self._store.get_field(self._row, field) for field in ColumnarBookStore.FIELDS}
+    
+    def __repr__(self) -> str:
+        return f"BookView({self.to_dict()!r})"
+
+
+class ColumnarBookStore:
+    """列式图书存储
+
+    书名/ISBN/简介存入字节堆（ASCII 或 UTF-16-LE 编码），作者/类型/出版社为驻留字符串编码，
+    评分与出版年份为 array 数值列，删除采用墓碑标记。与 dict 相同的
+    按 ID 存取接口可直接作为 BookDatabase 的记录存储，读取时返回 BookView，
+    由工具层在返回结果前转换为字典。
+    """
+    
+    FIELDS = ("title", "author", "isbn", "genre", "rating", "description", "publication_year", "publisher")
+    _YEAR_NONE = -2 ** 31
     
     def __init__(self):
-        self.books = self._initialize_books()
-        self.knowledge_graph = self._build_knowledge_graph()
+        self._text = {field: _StringColumn() for field in ("title", "isbn", "description")}
+        self._interned = {field: _InternedColumn() for field in ("author", "genre", "publisher")}
+        self._ratings = array("f")
+        self._years = array("i")
+        self._alive = bytearray()
+        self._count = 0
+    
+    def get_field(self, row: int, field: str) -> Any:
+        if field in self._text:
+            return self._text[field].get(row)
+        if field in self._interned:
+            return self._interned[field].get(row)
+        if field == "rating":
+            rating = self._ratings[row]
+            # float32 存储，读取时还原为常见的小数精度
+            return None if math.isnan(rating) else round(rating, 4)
+        if field == "publication_year":
+            year = self._years[row]
+            return None if year == self._YEAR_NONE else year
+        raise KeyError(field)
+    
+    def _write(self, row: int, book: Mapping) -> None:
+        for field, column in self._text.items():
+            column.set(row, book.get(field))
+        for field, column in self._interned.items():
+            column.set(row, book.get(field))
+        rating = book.get("rating")
+        year = book.get("publication_year")
+        self._ratings[row] = float("nan") if rating is None else float(rating)
+        self._years[row] = self._YEAR_NONE if year is None else int(year)
+    
+    def __setitem__(self, row: int, book: Mapping) -> None:
+        if row < len(self._alive):
+            if not self._alive[row]:
+                self._alive[row] = 1
+                self._count += 1
+            self._write(row, book)
+            return
+        # 新行必须按顺序追加（BookDatabase 的 ID 单调递增），中间空缺记为已删除
+        while len(self._alive) <= row:
+            for column in self._text.values():
+                column.append(None)
+            for column in self._interned.values():
+                column.append(None)
+            self._ratings.append(float("nan"))
+            self._years.append(self._YEAR_NONE)
+            self._alive.append(0)
+        self[row] = book
+    
+    def __getitem__(self, row: int) -> BookView:
+        if row >= len(self._alive) or not self._alive[row]:
+            raise KeyError(row)
+        return BookView(self, row)
+    
+    def __contains__(self, row: object) -> bool:
+        return isinstance(row, int) and 0 <= row < len(self._alive) and bool(self._alive[row])
+    
+    def pop(self, row: int) -> Dict[str, Any]:
+        """删除并返回该行的字典副本"""
+        book = self[row].to_dict()
+        self._alive[row] = 0
+        self._count -= 1
+        # 释放字节堆中的文本，空洞累积后由压缩回收
+        for column in self._text.values():
+            column.set(row, None)
+        return book
+    
+    def __iter__(self) -> Iterator[int]:
+        return (row for row, alive in enumerate(self._alive) if alive)
+    
+    def values(self) -> Iterator[BookView]:
+        return (BookView(self, row) for row in self)
+    
+    def __len__(self) -> int:
+        return self._count
+
+
+def _to_dict(book: Union[Dict[str, Any], Mapping]) -> Dict[str, Any]:
+    """在工具边界把记录（字典或 BookView）转换为普通字典"""
+    if isinstance(book, dict):
+        return book
+    return dict(book)
+
+
+def _bucket_ids(bucket: Union[int, Dict[int, None], None]) -> Iterable[int]:
+    """哈希索引的桶：单个 ID 直接存 int，多个 ID 才使用有序字典"""
+    if bucket is None:
+        return ()
+    if isinstance(bucket, int):
+        return (bucket,)
+    return bucket
+
+
+class _QueryColumns:
+    """面向过滤与排序查询的 NumPy 列（按图书 ID 对齐）
+
+    评分、出版年份、类型编码、作者编码四列随增删改同步维护，
+    query_books 的谓词与 top-k 排序全部在数组上向量化完成。
+    """
+    
+    _YEAR_NONE = np.iinfo(np.int32).min
+    
+    def __init__(self, capacity: int = 1024):
+        self.ratings = np.full(capacity, np.nan, dtype=np.float32)
+        self.years = np.full(capacity, self._YEAR_NONE, dtype=np.int32)
+        self.genres = np.full(capacity, -1, dtype=np.int32)
+        self.authors = np.full(capacity, -1, dtype=np.int32)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.genre_codes: Dict[str, int] = {}
+        self.author_codes: Dict[str, int] = {}
+        self.size = 0
+    
+    def _grow(self, size: int) -> None:
+        capacity = len(self.alive)
+        if size <= capacity:
+            return
+        new_capacity = max(size, capacity * 2)
+        
+        def extend(column: np.ndarray, fill: Any) -> np.ndarray:
+            grown = np.full(new_capacity, fill, dtype=column.dtype)
+            grown[:capacity] = column
+            return grown
+        
+        self.ratings = extend(self.ratings, np.nan)
+        self.years = extend(self.years, self._YEAR_NONE)
+        self.genres = extend(self.genres, -1)
+        self.authors = extend(self.authors, -1)
+        self.alive = extend(self.alive, False)
+    
+    @staticmethod
+    def _code(codes: Dict[str, int], value: Optional[str]) -> int:
+        key = _normalize_key(value)
+        if not key:
+            return -1
+        return codes.setdefault(key, len(codes))
+    
+    def set(self, book_id: int, book: Mapping) -> None:
+        self._grow(book_id + 1)
+        self.size = max(self.size, book_id + 1)
+        rating = book.get("rating")
+        year = book.get("publication_year")
+        self.ratings[book_id] = np.nan if rating is None else rating
+        self.years[book_id] = self._YEAR_NONE if year is None else year
+        self.genres[book_id] = self._code(self.genre_codes, book.get("genre"))
+        self.authors[book_id] = self._code(self.author_codes, book.get("author"))
+        self.alive[book_id] = True
+    
+    def clear(self, book_id: int) -> None:
+        if book_id < self.size:
+            self.alive[book_id] = False
+    
+    @staticmethod
+    def _lookup_codes(codes: Dict[str, int], values: Iterable[str]) -> List[int]:
+        return [codes[key] for key in (_normalize_key(value) for value in values) if key in codes]
+    
+    def query(
+        self,
+        genres: Optional[List[str]] = None,
+        authors: Optional[List[str]] = None,
+        match_any: bool = False,
+        min_rating: Optional[float] = None,
+        min_year: Optional[int] = None,
+        max_year: Optional[int] = None,
+        exclude_ids: Iterable[int] = (),
+        sort_by: str = "rating",
+        limit: int = 10
+    ) -> List[int]:
+        """返回满足条件的图书 ID，按 sort_by 降序（缺失值排最后），同分按 ID 升序"""
+        size = self.size
+        if limit <= 0 or size == 0:
+            return []
+        mask = self.alive[:size].copy()
+        selectors = []
+        if genres:
+            selectors.append(np.isin(self.genres[:size], self._lookup_codes(self.genre_codes, genres)))
+        if authors:
+            selectors.append(np.isin(self.authors[:size], self._lookup_codes(self.author_codes, authors)))
+        if selectors:
+            combined = selectors[0]
+            for selector in selectors[1:]:
+                combined = combined | selector if match_any else combined & selector
+            mask &= combined
+        if min_rating is not None:
+            mask &= self.ratings[:size] >= np.float32(min_rating)
+        years = self.years[:size]
+        if min_year is not None:
+            mask &= (years >= min_year) & (years != self._YEAR_NONE)
+        if max_year is not None:
+            mask &= (years <= max_year) & (years != self._YEAR_NONE)
+        exclude_ids = [book_id for book_id in exclude_ids if book_id < size]
+        if exclude_ids:
+            mask[exclude_ids] = False
+        
+        candidates = np.flatnonzero(mask)
+        if candidates.size == 0:
+            return []
+        if sort_by == "publication_year":
+            keys = years[candidates].astype(np.float64)
+            keys[years[candidates] == self._YEAR_NONE] = -np.inf
+        elif sort_by == "rating":
+            keys = np.nan_to_num(self.ratings[candidates].astype(np.float64), nan=-np.inf)
+        else:
+            raise ValueError(f"不支持的排序字段: {sort_by}")
+        # 先用 argpartition 选出前 limit 名，再只对这部分排序
+        if candidates.size > limit:
+            threshold = np.partition(-keys, limit - 1)[limit - 1]
+            selected = np.flatnonzero(-keys <= threshold)
+            candidates = candidates[selected]
+            keys = keys[selected]
+        order = np.lexsort((candidates, -keys))[:limit]
+        return candidates[order].tolist()
+
+
+class BookDatabase:
+    """模拟图书数据库
+
+    图书按自增 ID 存放，并为书名、作者、类型和 ISBN 维护哈希索引，
+    索引值为单个 ID 或按插入顺序排列的 ID 集合（dict 充当有序集合），
+    增删改时同步维护，查询为 O(1)。全文搜索由倒排索引 BookSearchIndex 提供。
+    记录存储默认为字典，大目录可传入 ColumnarBookStore 以降低内存占用。
+    """
+    
+    # 索引名 -> (图书字段, 归一化函数)
+    _INDEXED_FIELDS = {
+        "title": ("title", _normalize_key),
+        "author": ("author", _normalize_key),
+        "genre": ("genre", _normalize_key),
+        "isbn": ("isbn", _normalize_isbn),
+    }
+    
+    def __init__(
+        self,
+        books: Optional[Iterable[Dict[str, Any]]] = None,
+        search_index: Optional[BookSearchIndex] = None,
+        record_store: Optional[ColumnarBookStore] = None
+    ):
+        self._records = record_store if record_store is not None else {}
+        self._indexes: Dict[str, Dict[str, Union[int, Dict[int, None]]]] = {name: {} for name in self._INDEXED_FIELDS}
+        self._search_index = search_index or BookSearchIndex()
+        self._columns = _QueryColumns()
+        self._next_id = 0
+        # 每次增删改递增，用于判断派生结构与工具结果缓存是否过期
+        self.version = 0
+        # 只在图结构变化时递增（增删图书、修改书名/作者/类型、修改知识图谱），用于判断编译后的知识图谱是否过期
+        self.graph_version = 0
+        # 只在向量索引依赖的内容变化时递增（增删图书、修改书名/类型/简介），用于判断向量索引是否过期
+        self.content_version = 0
+        self._compiled_graph: Optional[CompiledKnowledgeGraph] = None
+        self._compiled_version = -1
+        self._embedding_index: Optional[BookEmbeddingIndex] = None
+        self._embedding_version = -1
+        if books is None:
+            self.knowledge_graph = self._build_knowledge_graph()
+            for book in self._initialize_books():
+                self._insert(book)
+        else:
+            self.knowledge_graph = {"authors": {}, "genres": {}}
+            self.load_books(books)
+    
+    @property
+    def books(self) -> List[Dict[str, Any]]:
+        """按插入顺序返回全部图书的列表副本（每次访问都会复制，内部遍历请使用 iter_books）"""
+        return list(self._records.values())
+    
+    def iter_books(self) -> Iterator[Dict[str, Any]]:
+        """按插入顺序遍历全部图书，不复制列表；遍历期间不要修改目录"""
+        return iter(self._records.values())
+    
+    def __len__(self) -> int:
+        return len(self._records)
+    
+    @property
+    def compiled_graph(self) -> CompiledKnowledgeGraph:
+        """编译后的知识图谱邻接结构，图结构变化后首次访问时重新编译（评分等字段变化不影响）"""
+        if self._compiled_graph is None or self._compiled_version != self.graph_version:
+            version = self.graph_version
+            self._compiled_graph = compile_knowledge_graph(self.iter_books(), self.knowledge_graph)
+            self._compiled_version = version
+        return self._compiled_graph
+    
+    @property
+    def embedding_index(self) -> BookEmbeddingIndex:
+        """图书内容向量索引，书名/类型/简介变化后首次访问时重建（评分等字段变化不影响；配置了保存目录时优先加载未过期的索引）"""
+        if self._embedding_index is None or self._embedding_version != self.content_version:
+            version = self.content_version
+            self._embedding_index = load_or_build_embedding_index(
+                self.iter_books, BOOK_EMBEDDING_PATH, BOOK_EMBEDDING_DIM
+            )
+            self._embedding_version = version
+        return self._embedding_index
+    
+    def mark_changed(self) -> None:
+        """直接修改 knowledge_graph 字典后调用，使派生结构失效"""
+        self.version += 1
+        self.graph_version += 1
+    
+    @classmethod
+    def from_file(cls, path: str, chunk_size: int = CATALOG_CHUNK_SIZE, **kwargs: Any) -> "BookDatabase":
+        """从 JSONL/CSV 目录文件构建图书数据库"""
+        db = cls(books=[], **kwargs)
+        db.load_from_file(path, chunk_size)
+        return db
+    
+    def load_from_file(self, path: str, chunk_size: int = CATALOG_CHUNK_SIZE) -> Dict[str, int]:
+        """流式载入目录文件，逐块写入内存存储"""
+        stats = {"loaded": 0, "skipped": 0}
+        for chunk in iter_catalog_chunks(path, chunk_size):
+            self.load_books(chunk["books"])
+            stats["loaded"] += len(chunk["books"])
+            stats["skipped"] += chunk["skipped"]
+        return stats
+    
+    def load_books(self, books: Iterable[Dict[str, Any]]) -> int:
+        """批量添加已校验的图书"""
+        count = 0
+        for book in books:
+            self.add_book(book)
+            count += 1
+        return count
+    
+    def add_book(self, book: Dict[str, Any]) -> Dict[str, Any]:
+        """添加一本图书，并同步更新索引和知识图谱中的作者与类型节点"""
+        self._insert(book)
+        self._link_graph(book)
+        return book
+    
+    def update_book(self, title: str, updates: Dict[str, Any], isbn: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """更新图书字段，索引与知识图谱随之更新；未找到时返回 None"""
+        book_id = self._find_id(title, isbn)
+        if book_id is None:
+            return None
+        old_book = self._records[book_id]
+        self._unindex(book_id, old_book)
+        self._unlink_graph(old_book)
+        book = dict(old_book)
+        book.update(updates)
+        if graph_fields_changed(old_book, book):
+            self.graph_version += 1
+        if content_fields_changed(old_book, book):
+            self.content_version += 1
+        self._records[book_id] = book
+        book = self._records[book_id]
+        self._index(book_id, book)
+        self._link_graph(book)
+        return book
+    
+    def delete_book(self, title: str, isbn: Optional[str] = None) -> bool:
+        """删除图书（同名时可用 ISBN 区分），返回是否删除成功"""
+        book_id = self._find_id(title, isbn)
+        if book_id is None:
+            return False
+        book = self._records.pop(book_id)
+        self._unindex(book_id, book)
+        self._unlink_graph(book)
+        self.graph_version += 1
+        self.content_version += 1
+        return True
+    
+    def _insert(self, book: Dict[str, Any]) -> int:
+        book_id = self._next_id
+        self._next_id += 1
+        self._records[book_id] = book
+        self._index(book_id, self._records[book_id])
+        self.graph_version += 1
+        self.content_version += 1
+        return book_id
+    
+    def _index(self, book_id: int, book: Dict[str, Any]) -> None:
+        for name, (field, normalize) in self._INDEXED_FIELDS.items():
+            key = normalize(book.get(field))
+            if not key:
+                continue
+            index = self._indexes[name]
+            bucket = index.get(key)
+            if bucket is None:
+                index[key] = book_id
+            elif isinstance(bucket, int):
+                index[key] = {bucket: None, book_id: None}
+            else:
+                bucket[book_id] = None
+        self._search_index.add(book_id, book)
+        self._columns.set(book_id, book)
+        self.version += 1
+    
+    def _unindex(self, book_id: int, book: Dict[str, Any]) -> None:
+        self._search_index.remove(book_id, book)
+        self._columns.clear(book_id)
+        self.version += 1
+        for name, (field, normalize) in self._INDEXED_FIELDS.items():
+            key = normalize(book.get(field))
+            index = self._indexes[name]
+            bucket = index.get(key)
+            if bucket is None:
+                continue
+            if isinstance(bucket, int):
+                if bucket == book_id:
+                    del index[key]
+                continue
+            bucket.pop(book_id, None)
+            if len(bucket) == 1:
+                index[key] = next(iter(bucket))
+            elif not bucket:
+                del index[key]
+    
+    def _lookup(self, name: str, value: Optional[str]) -> List[Dict[str, Any]]:
+        normalize = self._INDEXED_FIELDS[name][1]
+        bucket = self._indexes[name].get(normalize(value))
+        return [self._records[book_id] for book_id in _bucket_ids(bucket)]
+    
+    def _find_id(self, title: str, isbn: Optional[str] = None) -> Optional[int]:
+        candidates = _bucket_ids(self._indexes["title"].get(_normalize_key(title)))
+        if isbn:
+            isbn_ids = set(_bucket_ids(self._indexes["isbn"].get(_normalize_isbn(isbn))))
+            candidates = [book_id for book_id in candidates if book_id in isbn_ids]
+        return next(iter(candidates), None)
+    
+    def _link_graph(self, book: Dict[str, Any]) -> None:
+        author = book.get("author")
+        genre = book.get("genre")
+        if author:
+            author_node = self.knowledge_graph["authors"].setdefault(
+                author, {"genres": [], "books": [], "style": ""}
+            )
+            # 通过书名索引判断作者节点是否已记录该书名（本书已入索引），避免扫描作品列表
+            same_title_count = sum(
+                1 for other in self._lookup("title", book.get("title"))
+                if other.get("author") == author
+            )
+            if same_title_count <= 1:
+                author_node["books"].append(book["title"])
+            if genre and genre not in author_node["genres"]:
+                author_node["genres"].append(genre)
+        if genre:
+            genre_node = self.knowledge_graph["genres"].setdefault(
+                genre, {"authors": [], "similar_genres": []}
+            )
+            if author and author not in genre_node["authors"]:
+                genre_node["authors"].append(author)
+    
+    def _unlink_graph(self, book: Dict[str, Any]) -> None:
+        """图书移出索引后，若作者已无同名作品，则从作者节点中移除书名；
+        若作者已无该类型的其他图书，则同时移除作者与类型之间的双向关联"""
+        author = book.get("author")
+        genre = book.get("genre")
+        author_node = self.knowledge_graph["authors"].get(author)
+        if author_node:
+            remaining = any(
+                other.get("author") == author
+                for other in self._lookup("title", book.get("title"))
+            )
+            if not remaining and book.get("title") in author_node["books"]:
+                author_node["books"].remove(book["title"])
+        if not author or not genre:
+            return
+        if any(other.get("author") == author and other.get("genre") == genre for other in self._lookup("author", author)):
+            return
+        if author_node and genre in author_node["genres"]:
+            author_node["genres"].remove(genre)
+        genre_node = self.knowledge_graph["genres"].get(genre)
+        if genre_node and author in genre_node["authors"]:
+            genre_node["authors"].remove(author)
     
     def _initialize_books(self) -> List[Dict[str, Any]]:
         """初始化图书数据"""
@@ -1516,48 +2242,166 @@ class BookDatabase:
         }
     
     def search_books(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """搜索图书"""
-        results = []
-        query_lower = query.lower()
-        
-        for book in self.books:
-            if (query_lower in book["title"].lower() or 
-                query_lower in book["author"].lower() or 
-                query_lower in book["genre"].lower() or
-                query_lower in book["description"].lower()):
-                results.append(book)
-        
-        return results[:limit]
+        """搜索图书，书名完全匹配的排在最前，其余按相关度排序"""
+        if limit <= 0:
+            return []
+        exact_ids = list(_bucket_ids(self._indexes["title"].get(_normalize_key(query))))[:limit]
+        ranked_ids = [book_id for book_id, _ in self._search_index.search(query, limit + len(exact_ids))]
+        result_ids = list(dict.fromkeys(exact_ids + ranked_ids))[:limit]
+        return [self._records[book_id] for book_id in result_ids]
     
     def get_book_by_title(self, title: str) -> Optional[Dict[str, Any]]:
         """根据标题获取图书"""
-        for book in self.books:
-            if book["title"] == title:
-                return book
-        return None
+        books = self._lookup("title", title)
+        return books[0] if books else None
+    
+    def get_book_by_isbn(self, isbn: str) -> Optional[Dict[str, Any]]:
+        """根据ISBN获取图书"""
+        books = self._lookup("isbn", isbn)
+        return books[0] if books else None
     
     def get_books_by_author(self, author: str) -> List[Dict[str, Any]]:
         """根据作者获取图书"""
-        return [book for book in self.books if book["author"] == author]
+        return self._lookup("author", author)
     
     def get_books_by_genre(self, genre: str) -> List[Dict[str, Any]]:
         """根据类型获取图书"""
-        return [book for book in self.books if book["genre"] == genre]
+        return self._lookup("genre", genre)
+    
+    def query_books(
+        self,
+        genres: Optional[List[str]] = None,
+        authors: Optional[List[str]] = None,
+        match_any: bool = False,
+        min_rating: Optional[float] = None,
+        min_year: Optional[int] = None,
+        max_year: Optional[int] = None,
+        exclude_titles: Optional[List[str]] = None,
+        sort_by: str = "rating",
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """按类型/作者/评分/年份过滤并按评分或年份降序返回前 limit 本
+
+        genres 与 authors 默认需同时满足，match_any=True 时满足其一即可。
+        """
+        exclude_ids = [
+            book_id
+            for title in exclude_titles or []
+            for book_id in _bucket_ids(self._indexes["title"].get(_normalize_key(title)))
+        ]
+        book_ids = self._columns.query(
+            genres=genres,
+            authors=authors,
+            match_any=match_any,
+            min_rating=min_rating,
+            min_year=min_year,
+            max_year=max_year,
+            exclude_ids=exclude_ids,
+            sort_by=sort_by,
+            limit=limit
+        )
+        return [self._records[book_id] for book_id in book_ids]
+
+
+def _default_catalog_factory() -> BookDatabase:
+    """按配置构建图书数据库
+
+    sqlite 后端：打开 BOOK_SQLITE_PATH，首次使用时从外部文件或内置目录导入；
+    memory/columnar 后端：配置了 BOOK_CATALOG_PATH 时从外部文件载入，否则使用内置目录，
+    columnar 使用 ColumnarBookStore 存放记录。
+    """
+    if BOOK_STORAGE_BACKEND == "sqlite":
+        from book_storage import SQLiteBookDatabase
+
+        store = SQLiteBookDatabase(BOOK_SQLITE_PATH)
+        # 检查与导入在同一事务中完成，多个 worker 同时启动也只导入一次
+        if not len(store):
+            if BOOK_CATALOG_PATH:
+                store.seed_from_file(BOOK_CATALOG_PATH, BookDatabase()._build_knowledge_graph())
+            else:
+                store.seed_from(BookDatabase())
+        return store
+    record_store = ColumnarBookStore() if BOOK_STORAGE_BACKEND == "columnar" else None
+    if BOOK_CATALOG_PATH:
+        return BookDatabase.from_file(BOOK_CATALOG_PATH, record_store=record_store)
+    return BookDatabase(record_store=record_store)
+
+
+class CatalogRegistry:
+    """进程级图书目录注册表
+
+    所有工具通过注册表共享同一个 BookDatabase 实例（按引用共享），
+    避免每个工具各自构建一份目录和知识图谱。支持显式重载与替换。
+    """
+    
+    def __init__(self, factory: Callable[[], BookDatabase] = _default_catalog_factory):
+        self._factory = factory
+        self._db: Optional[BookDatabase] = None
+        self._lock = threading.Lock()
+        self.version = 0
+    
+    def get(self) -> BookDatabase:
+        """获取当前共享的图书数据库，首次访问时才构建"""
+        db = self._db
+        if db is None:
+            with self._lock:
+                if self._db is None:
+                    self._db = self._factory()
+                    self.version += 1
+                db = self._db
+        return db
+    
+    def swap(self, db: BookDatabase) -> Optional[BookDatabase]:
+        """原子替换共享的图书数据库，返回旧实例"""
+        with self._lock:
+            old_db = self._db
+            self._db = db
+            self.version += 1
+        return old_db
+    
+    def reload(self, factory: Optional[Callable[[], BookDatabase]] = None) -> BookDatabase:
+        """重新构建图书数据库并替换当前实例"""
+        if factory is not None:
+            self._factory = factory
+        db = self._factory()
+        self.swap(db)
+        return db
+
+
+# 全局目录注册表
+catalog_registry = CatalogRegistry()
+
+
+def get_book_database() -> BookDatabase:
+    """获取进程内共享的图书数据库"""
+    return catalog_registry.get()
+
+
+# 工具结果缓存：只取决于参数与目录的工具方法按目录版本缓存结果，所有用户共享；
+# 读写用户数据的方法（偏好、阅读趋势）不缓存
+tool_result_cache = ToolResultCache(TOOL_CACHE_MAX_ENTRIES)
+_memoize = tool_result_cache.memoize if TOOL_CACHE_ENABLED else (lambda method: method)
 
 
 class BookRecommendationTool:
     """图书推荐工具"""
     
-    def __init__(self):
-        self.db = BookDatabase()
+    def __init__(self, db: Optional[BookDatabase] = None):
+        self._db = db
+    
+    @property
+    def db(self) -> BookDatabase:
+        """未显式指定数据库时使用注册表中的共享实例"""
+        return self._db if self._db is not None else catalog_registry.get()
     
+    @_memoize
     def recommend_by_author(self, author: str, exclude_books: List[str] = None) -> Dict[str, Any]:
         """根据作者推荐图书"""
         if exclude_books is None:
             exclude_books = []
         
         books = self.db.get_books_by_author(author)
-        recommendations = [book for book in books if book["title"] not in exclude_books]
+        recommendations = [_to_dict(book) for book in books if book["title"] not in exclude_books]
         
         return {
             "success": True,
@@ -1566,13 +2410,14 @@ class BookRecommendationTool:
             "count": len(recommendations)
         }
     
+    @_memoize
     def recommend_by_genre(self, genre: str, exclude_books: List[str] = None) -> Dict[str, Any]:
         """根据类型推荐图书"""
         if exclude_books is None:
             exclude_books = []
         
         books = self.db.get_books_by_genre(genre)
-        recommendations = [book for book in books if book["title"] not in exclude_books]
+        recommendations = [_to_dict(book) for book in books if book["title"] not in exclude_books]
         
         return {
             "success": True,
@@ -1581,72 +2426,183 @@ class BookRecommendationTool:
             "count": len(recommendations)
         }
     
+    @_memoize
     def recommend_by_knowledge_graph(self, current_book: Dict[str, Any]) -> Dict[str, Any]:
-        """基于知识图谱推荐图书"""
-        recommendations = []
+        """基于知识图谱推荐图书（在编译后的邻接结构上做多跳扩展）"""
+        graph = self.db.compiled_graph
+        recommended: List[int] = []
         reasons = []
         
-        # 获取当前图书信息
+        # 获取当前图书信息，缺失的作者/类型从图谱中补全
         title = current_book["title"]
-        author = current_book["author"]
-        genre = current_book["genre"]
+        book_node = graph.node(BOOK, title)
+        author = current_book.get("author")
+        genre = current_book.get("genre")
+        if not author and book_node is not None:
+            author = next(iter(graph.names(graph.neighbors(book_node, WROTE))), None)
+        if not genre and book_node is not None:
+            genre = next(iter(graph.names(graph.neighbors(book_node, BELONGS_TO))), None)
+        author_node = graph.node(AUTHOR, author)
+        genre_node = graph.node(GENRE, genre)
         
-        # 1. 推荐同作者其他作品
-        author_books = self.db.get_books_by_author(author)
-        author_recommendations = [book for book in author_books if book["title"] != title]
-        if author_recommendations:
-            recommendations.extend(author_recommendations[:2])
+        def others(node_ids) -> List[int]:
+            return [int(node_id) for node_id in node_ids if node_id != book_node]
+        
+        # 1. 推荐同作者其他作品：作者 -wrote-> 图书
+        author_books = others(graph.neighbors(author_node, WROTE))
+        if author_books:
+            recommended.extend(author_books[:2])
             reasons.append(f"同作者 {author} 的其他作品")
         
-        # 2. 推荐同类型其他图书
-        genre_books = self.db.get_books_by_genre(genre)
-        genre_recommendations = [book for book in genre_books if book["title"] != title]
-        if genre_recommendations:
-            recommendations.extend(genre_recommendations[:2])
+        # 2. 推荐同类型其他图书：类型 -belongs_to-> 图书
+        genre_books = others(graph.neighbors(genre_node, BELONGS_TO))
+        if genre_books:
+            recommended.extend(genre_books[:2])
             reasons.append(f"同类型 {genre} 的其他图书")
         
-        # 3. 基于知识图谱推荐相似类型
-        kg = self.db.knowledge_graph
-        if genre in kg["genres"]:
-            similar_genres = kg["genres"][genre].get("similar_genres", [])
-            for similar_genre in similar_genres:
-                similar_books = self.db.get_books_by_genre(similar_genre)
-                if similar_books:
-                    recommendations.extend(similar_books[:1])
-                    reasons.append(f"相似类型 {similar_genre} 的图书")
+        # 3. 基于知识图谱推荐相似类型：类型 -similar_genre-> 类型 -belongs_to-> 图书
+        for similar_node in graph.neighbors(genre_node, SIMILAR_GENRE):
+            similar_books = others(graph.neighbors(similar_node, BELONGS_TO))
+            if similar_books:
+                recommended.append(similar_books[0])
+                reasons.append(f"相似类型 {graph.node_names[similar_node]} 的图书")
         
-        # 去重
-        seen_titles = set()
+        # 去重（按书名节点）
+        unique_nodes = list(dict.fromkeys(recommended))
         unique_recommendations = []
-        for book in recommendations:
-            if book["title"] not in seen_titles:
-                unique_recommendations.append(book)
-                seen_titles.add(book["title"])
+        for node_id in unique_nodes[:5]:
+            book = self.db.get_book_by_title(graph.node_names[node_id])
+            if book is not None:
+                unique_recommendations.append(_to_dict(book))
         
         return {
             "success": True,
-            "recommendations": unique_recommendations[:5],
+            "recommendations": unique_recommendations,
             "reasons": reasons,
-            "count": len(unique_recommendations)
+            "count": len(unique_nodes)
+        }
+    
+    @_memoize
+    def recommend_by_graph_ranking(
+        self,
+        seed_titles: List[str],
+        exclude_books: List[str] = None,
+        limit: int = 5
+    ) -> Dict[str, Any]:
+        """以已读/浏览图书为种子，在作者-类型-风格图上运行个性化 PageRank 推荐
+
+        得分为带重启随机游走的稳态概率，每本推荐附带图谱中的关联路径作为理由。
+        """
+        if exclude_books is None:
+            exclude_books = []
+        graph = self.db.compiled_graph
+        seeds = [graph.node(BOOK, title) for title in seed_titles]
+        seeds = [seed for seed in seeds if seed is not None]
+        if not seeds:
+            return {
+                "success": False,
+                "error": f"图谱中未找到图书：{', '.join(seed_titles)}"
+            }
+        
+        scores = graph.personalized_pagerank(seeds)
+        is_book = np.fromiter((kind == BOOK for kind in graph.node_kinds), dtype=bool, count=len(graph))
+        scores = np.where(is_book, scores, 0.0)
+        excluded = seeds + [graph.node(BOOK, title) for title in exclude_books]
+        scores[[node_id for node_id in excluded if node_id is not None]] = 0.0
+        candidates = np.flatnonzero(scores > 0)
+        if candidates.size > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        
+        recommendations = []
+        for node_id in ranked.tolist():
+            book = self.db.get_book_by_title(graph.node_names[node_id])
+            if book is None:
+                continue
+            path = graph.explain(seeds, node_id)
+            recommendations.append({
+                "book": _to_dict(book),
+                "score": round(float(scores[node_id]), 6),
+                "path": graph.names(path),
+                "reason": self._describe_graph_path(graph, path)
+            })
+        
+        return {
+            "success": True,
+            "recommendations": recommendations,
+            "count": len(recommendations)
+        }
+    
+    @staticmethod
+    def _describe_graph_path(graph: CompiledKnowledgeGraph, path: List[int]) -> str:
+        """把关联路径转换为推荐理由"""
+        if not path:
+            return "知识图谱中的多跳关联"
+        names = graph.names(path)
+        kinds = [graph.node_kinds[node_id] for node_id in path]
+        if kinds == [BOOK, AUTHOR, BOOK]:
+            return f"与《{names[0]}》同为 {names[1]} 的作品"
+        if kinds == [BOOK, GENRE, BOOK]:
+            return f"与《{names[0]}》同属 {names[1]} 类型"
+        if kinds == [BOOK, GENRE, GENRE, BOOK]:
+            return f"《{names[0]}》的类型 {names[1]} 与 {names[2]} 相似"
+        if kinds == [BOOK, AUTHOR, STYLE, AUTHOR, BOOK]:
+            return f"{names[3]} 与《{names[0]}》的作者 {names[1]} 同属{names[2]}风格"
+        return "知识图谱关联：" + " → ".join(names)
+    
+    @_memoize
+    def recommend_by_preferences(
+        self,
+        preferences: Dict[str, Any],
+        exclude_books: List[str] = None,
+        limit: int = 5
+    ) -> Dict[str, Any]:
+        """根据用户偏好（UserPreference 字段）推荐高分图书
+
+        喜欢的类型或作者满足其一即可，preferred_rating 为最低评分，
+        preferred_years 取其最小值与最大值作为出版年份区间。
+        """
+        genres = preferences.get("favorite_genres") or []
+        authors = preferences.get("favorite_authors") or []
+        min_rating = preferences.get("preferred_rating")
+        years = preferences.get("preferred_years") or []
+        books = self.db.query_books(
+            genres=genres,
+            authors=authors,
+            match_any=True,
+            min_rating=min_rating,
+            min_year=min(years) if years else None,
+            max_year=max(years) if years else None,
+            exclude_titles=exclude_books,
+            limit=limit
+        )
+        reasons = []
+        if genres:
+            reasons.append(f"偏好类型 {', '.join(genres)}")
+        if authors:
+            reasons.append(f"偏好作者 {', '.join(authors)}")
+        if min_rating is not None:
+            reasons.append(f"评分不低于 {min_rating}")
+        if years:
+            reasons.append(f"出版于 {min(years)}-{max(years)} 年")
+        
+        return {
+            "success": True,
+            "recommendations": [_to_dict(book) for book in books],
+            "reason": "按用户偏好推荐：" + ("，".join(reasons) if reasons else "综合评分最高"),
+            "count": len(books)
         }
     
     def get_user_preferences(self, user_id: str) -> Dict[str, Any]:
-        """获取用户偏好（模拟）"""
-        # 这里应该从数据库获取真实用户偏好
-        # 现在返回模拟数据
+        """获取用户偏好（由浏览记录与评分反馈累计，读取进程内缓存）"""
         return {
             "success": True,
-            "preferences": {
-                "favorite_genres": ["科幻", "文学"],
-                "favorite_authors": ["刘慈欣", "余华"],
-                "reading_history": [],
-                "preferred_rating": 8.5
-            }
+            "preferences": get_user_store().get_preferences(user_id)
         }
     
     def update_user_preferences(self, user_id: str, book_info: Dict[str, Any]) -> Dict[str, Any]:
-        """更新用户偏好"""
-        # 这里应该更新数据库中的用户偏好
+        """更新用户偏好：记录用户浏览的图书，作者与类型计入偏好"""
+        get_user_store().record_view(user_id, book_info)
         return {
             "success": True,
             "message": f"已记录用户对图书《{book_info['title']}》的浏览"
@@ -1656,26 +2612,33 @@ class BookRecommendationTool:
 class BookSearchTool:
     """图书搜索工具"""
     
-    def __init__(self):
-        self.db = BookDatabase()
+    def __init__(self, db: Optional[BookDatabase] = None):
+        self._db = db
+    
+    @property
+    def db(self) -> BookDatabase:
+        """未显式指定数据库时使用注册表中的共享实例"""
+        return self._db if self._db is not None else catalog_registry.get()
     
+    @_memoize
     def search_books(self, query: str, limit: int = 10) -> Dict[str, Any]:
         """搜索图书"""
         results = self.db.search_books(query, limit)
         return {
             "success": True,
             "query": query,
-            "results": results,
+            "results": [_to_dict(book) for book in results],
             "count": len(results)
         }
     
+    @_memoize
     def get_book_details(self, title: str) -> Dict[str, Any]:
         """获取图书详细信息"""
         book = self.db.get_book_by_title(title)
         if book:
             return {
                 "success": True,
-                "book": book
+                "book": _to_dict(book)
             }
         else:
             return {
@@ -1683,12 +2646,51 @@ class BookSearchTool:
                 "error": f"未找到图书《{title}》"
             }
 
+    @_memoize
+    def search_by_content(self, text: str = "", title: str = "", limit: int = 5) -> Dict[str, Any]:
+        """按内容相似度检索图书：给出书名时查找与该书简介相近的图书，否则按描述文本检索"""
+        index = self.db.embedding_index
+        if title:
+            hits = index.similar_to(title, limit + 1)
+            if hits is None:
+                return {
+                    "success": False,
+                    "error": f"未找到图书《{title}》"
+                }
+        elif text:
+            hits = index.search_text(text, limit + 1)
+        else:
+            return {
+                "success": False,
+                "error": "请提供描述文本或书名"
+            }
+
+        results = []
+        seen = {title}
+        for hit_title, score in hits:
+            book = self.db.get_book_by_title(hit_title)
+            if book is None or hit_title in seen:
+                continue
+            seen.add(hit_title)
+            results.append({"book": _to_dict(book), "score": round(score, 4)})
+        return {
+            "success": True,
+            "query": title or text,
+            "results": results[:limit],
+            "count": len(results[:limit])
+        }
+
 
 class BookAnalysisTool:
     """图书分析工具"""
     
-    def __init__(self):
-        self.db = BookDatabase()
+    def __init__(self, db: Optional[BookDatabase] = None):
+        self._db = db
+    
+    @property
+    def db(self) -> BookDatabase:
+        """未显式指定数据库时使用注册表中的共享实例"""
+        return self._db if self._db is not None else catalog_registry.get()
     
     def analyze_reading_trends(self, user_history: List[Dict[str, Any]]) -> Dict[str, Any]:
         """分析用户阅读趋势"""
@@ -1723,47 +2725,105 @@ class BookAnalysisTool:
             }
         }
     
-    def get_similar_books(self, book_info: Dict[str, Any]) -> Dict[str, Any]:
-        """获取相似图书"""
+    # 相似度各因素的权重（合计 1.0）；相似类型按同类型权重的一半计分
+    SIMILARITY_WEIGHTS = {"author": 0.35, "genre": 0.25, "style": 0.15, "era": 0.15, "rating": 0.10}
+    # 出版年份相差 ERA_SCALE 年时年代得分衰减为 1/e；评分相差 RATING_SCALE 分时评分得分为 0
+    ERA_SCALE = 15.0
+    RATING_SCALE = 2.0
+    
+    @_memoize
+    def get_similar_books(self, book_info: Dict[str, Any], limit: int = 5) -> Dict[str, Any]:
+        """获取相似图书
+        
+        候选集取自图谱邻接：同作者、同类型、相似类型以及同风格作者的图书；
+        每个候选按作者、类型、风格、出版年代与评分接近程度加权打分，
+        用大小为 limit 的堆选出前 limit 名，开销为 O(候选数 · log limit)。
+        """
+        graph = self.db.compiled_graph
         title = book_info["title"]
-        author = book_info["author"]
-        genre = book_info["genre"]
+        book_node = graph.node(BOOK, title)
+        source = self.db.get_book_by_title(title)
+        source = _to_dict(source) if source is not None else {}
+        source.update({key: value for key, value in book_info.items() if value is not None})
+        
+        author_node = graph.node(AUTHOR, source.get("author"))
+        genre_node = graph.node(GENRE, source.get("genre"))
+        if author_node is None and book_node is not None:
+            author_node = next(iter(graph.neighbors(book_node, WROTE).tolist()), None)
+        if genre_node is None and book_node is not None:
+            genre_node = next(iter(graph.neighbors(book_node, BELONGS_TO).tolist()), None)
+        similar_genres = set(graph.neighbors(genre_node, SIMILAR_GENRE).tolist())
+        styles = set(graph.neighbors(author_node, SAME_STYLE).tolist())
         
-        # 基于多种因素计算相似度
-        similar_books = []
+        # 候选集：同作者、同类型、相似类型、同风格作者的图书
+        candidates: Dict[int, None] = dict.fromkeys(graph.neighbors(author_node, WROTE).tolist())
+        candidates.update(dict.fromkeys(graph.neighbors(genre_node, BELONGS_TO).tolist()))
+        for similar_node in similar_genres:
+            candidates.update(dict.fromkeys(graph.neighbors(similar_node, BELONGS_TO).tolist()))
+        for style_node in styles:
+            for other_author in graph.neighbors(style_node, SAME_STYLE).tolist():
+                candidates.update(dict.fromkeys(graph.neighbors(other_author, WROTE).tolist()))
+        candidates.pop(book_node, None)
         
-        # 同作者其他作品
-        author_books = self.db.get_books_by_author(author)
-        for book in author_books:
-            if book["title"] != title:
-                similar_books.append({
-                    "book": book,
-                    "similarity_reason": "同作者",
-                    "similarity_score": 0.9
-                })
+        weights = self.SIMILARITY_WEIGHTS
+        # 年份或评分无法转换为数字时跳过对应的打分项
+        year = _coerce_number(source.get("publication_year"), int)
+        rating = _coerce_number(source.get("rating"), float)
         
-        # 同类型其他图书
-        genre_books = self.db.get_books_by_genre(genre)
-        for book in genre_books:
-            if book["title"] != title:
-                similar_books.append({
-                    "book": book,
-                    "similarity_reason": "同类型",
-                    "similarity_score": 0.8
-                })
+        def scored() -> Iterator[tuple]:
+            for order, node_id in enumerate(candidates):
+                book = self.db.get_book_by_title(graph.node_names[node_id])
+                if book is None:
+                    continue
+                score = 0.0
+                reasons = []
+                authors = graph.neighbors(node_id, WROTE).tolist()
+                genres = graph.neighbors(node_id, BELONGS_TO).tolist()
+                if author_node is not None and author_node in authors:
+                    score += weights["author"]
+                    reasons.append("同作者")
+                elif styles and any(
+                    style in styles for other in authors for style in graph.neighbors(other, SAME_STYLE).tolist()
+                ):
+                    score += weights["style"]
+                    reasons.append("同风格作者")
+                if genre_node is not None and genre_node in genres:
+                    score += weights["genre"]
+                    reasons.append("同类型")
+                elif similar_genres.intersection(genres):
+                    score += weights["genre"] / 2
+                    reasons.append("相似类型")
+                other_year = _coerce_number(book.get("publication_year"), int)
+                if year and other_year:
+                    score += weights["era"] * math.exp(-abs(year - other_year) / self.ERA_SCALE)
+                    if abs(year - other_year) <= 10:
+                        reasons.append("出版年代相近")
+                other_rating = _coerce_number(book.get("rating"), float)
+                if rating is not None and other_rating is not None:
+                    closeness = max(0.0, 1.0 - abs(rating - other_rating) / self.RATING_SCALE)
+                    score += weights["rating"] * closeness
+                # 分数相同时保持候选顺序（同作者、同类型在前）
+                yield score, -order, book, reasons
         
-        # 按相似度排序
-        similar_books.sort(key=lambda x: x["similarity_score"], reverse=True)
+        top = heapq.nlargest(limit, scored(), key=lambda item: item[:2])
+        similar_books = [
+            {
+                "book": _to_dict(book),
+                "similarity_reason": "、".join(reasons) or "图谱关联",
+                "similarity_score": round(score, 4)
+            }
+            for score, _, book, reasons in top
+        ]
         
         return {
             "success": True,
-            "similar_books": similar_books[:5],
-            "count": len(similar_books)
+            "similar_books": similar_books,
+            "count": len(candidates)
         }
 
 
-# 工具实例
-book_db = BookDatabase()
+# 工具实例（通过目录注册表共享同一个图书数据库；需要数据库时调用 get_book_database()，
+# 不要在模块级保存引用，否则注册表替换目录后引用会过期）
 book_recommendation_tool = BookRecommendationTool()
 book_search_tool = BookSearchTool()
 book_analysis_tool = BookAnalysisTool()
\ No newline at end of file
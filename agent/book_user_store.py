@@ -0,0 +1,449 @@
+"""
+用户数据持久化存储
+
+保存每个用户的对话历史、推荐反馈与派生的阅读偏好，进程重启后仍然保留，
+多个 worker 可共享同一个 SQLite 文件：
+- 写入走后台队列（write-behind），由单独的写线程按批提交，请求线程只负责入队
+- 偏好按增量落盘：作者、类型得分与评分合计各占一行，以 UPDATE ... SET x = x + ? 累加，
+  最近的图书按书名逐行写入，多个 worker 更新同一用户时不会互相覆盖
+- 偏好读取走进程内缓存：每个用户的偏好在首次访问时载入，之后的更新同时写缓存与队列，
+  请求路径不等待磁盘；缓存超过 cache_ttl 秒且本进程没有该用户未提交的写入时重新载入，
+  从而看到其他 worker 的更新。载入在锁外进行，不阻塞其他用户的入队与写线程的记账；
+  缓存最多保留 max_profiles 个用户，超出时淘汰最久未访问且没有未提交写入的用户
+后端通过 USER_STORE_BACKEND 选择："sqlite"（默认）或 "memory"（仅进程内，不落盘）。
+"""
+import atexit
+import json
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from config import (
+    USER_STORE_BACKEND,
+    USER_STORE_PATH,
+    USER_STORE_BATCH_SIZE,
+    USER_STORE_FLUSH_INTERVAL,
+    USER_STORE_CACHE_TTL,
+    USER_STORE_MAX_PROFILES,
+)
+
+
+# 偏好中保留的最近浏览/评价图书数与展示的偏好作者、类型数
+PROFILE_HISTORY_LIMIT = 20
+PROFILE_TOP_K = 3
+
+# 评分达到 POSITIVE_RATING 视为喜欢，不高于 NEGATIVE_RATING 视为不喜欢
+POSITIVE_RATING = 7.0
+NEGATIVE_RATING = 4.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_user_history_user ON user_history(user_id, id);
+CREATE TABLE IF NOT EXISTS user_feedback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_user_feedback_user ON user_feedback(user_id, id);
+CREATE TABLE IF NOT EXISTS user_profile_scores (
+    user_id TEXT NOT NULL,
+    field TEXT NOT NULL,
+    name TEXT NOT NULL,
+    score REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, field, name)
+);
+CREATE TABLE IF NOT EXISTS user_profile_books (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    book TEXT NOT NULL,
+    UNIQUE (user_id, title)
+);
+CREATE INDEX IF NOT EXISTS idx_user_profile_books_user ON user_profile_books(user_id, id);
+CREATE TABLE IF NOT EXISTS user_profile_ratings (
+    user_id TEXT PRIMARY KEY,
+    rating_sum REAL NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def _empty_profile() -> Dict[str, Any]:
+    return {"authors": {}, "genres": {}, "books": [], "rating_sum": 0.0, "rating_count": 0}
+
+
+def _top(scores: Dict[str, float]) -> List[str]:
+    ranked = sorted((item for item in scores.items() if item[1] > 0), key=lambda item: -item[1])
+    return [name for name, _ in ranked[:PROFILE_TOP_K]]
+
+
+class UserStore:
+    """用户数据存储（仅进程内），SQLiteUserStore 在此基础上增加持久化
+
+    偏好档案记录作者、类型得分与最近的图书：浏览记 1 分，好评记 2 分，差评扣 2 分。
+    """
+
+    def __init__(self, max_profiles: int = 10000):
+        self.max_profiles = max(max_profiles, 1)
+        # 按最近访问排序的档案缓存、载入时间与本进程的更新次数（均在 self._lock 下访问）
+        self._profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._loaded_at: Dict[str, float] = {}
+        self._updates: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    # 持久化钩子，内存后端不做任何事；_load_profile 在锁外调用，_save_delta 在持有锁时调用，按更新顺序入队
+    def _load_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return None
+
+    def _profile_stale(self, user_id: str) -> bool:
+        """进程内缓存的档案是否需要重新载入，调用方需持有 self._lock"""
+        return False
+
+    def _has_pending(self, user_id: str) -> bool:
+        """该用户是否有已入队、尚未提交的写入，调用方需持有 self._lock"""
+        return False
+
+    def has_pending(self, user_id: str) -> bool:
+        """该用户是否有尚未提交的写入：此时从存储重新载入会漏掉这些写入"""
+        with self._lock:
+            return self._has_pending(user_id)
+
+    def _save_delta(
+        self,
+        user_id: str,
+        scores: List[Tuple[str, str, float]],
+        book: Optional[Dict[str, Any]],
+        rating: Optional[float]
+    ) -> None:
+        pass
+
+    def append_history(self, user_id: str, entry: Dict[str, Any]) -> None:
+        pass
+
+    def load_history(self, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        """最近 limit 条对话历史（按时间顺序）"""
+        return []
+
+    def load_feedback(self, user_id: str) -> List[Dict[str, Any]]:
+        return []
+
+    def flush(self) -> None:
+        """等待已入队的写入全部提交"""
+
+    def close(self) -> None:
+        pass
+
+    def _cache_profile(self, user_id: str, profile: Dict[str, Any], loaded_at: float) -> None:
+        """装入缓存并淘汰最久未访问的用户（有未提交写入的用户保留），调用方需持有 self._lock"""
+        self._profiles[user_id] = profile
+        self._profiles.move_to_end(user_id)
+        self._loaded_at[user_id] = loaded_at
+        for stale_id in list(self._profiles):
+            if len(self._profiles) <= self.max_profiles:
+                break
+            if stale_id == user_id or self._has_pending(stale_id):
+                continue
+            del self._profiles[stale_id]
+            self._loaded_at.pop(stale_id, None)
+            self._updates.pop(stale_id, None)
+
+    def _fetch_profile(self, user_id: str) -> Dict[str, Any]:
+        """缓存缺失或过期时在锁外载入档案，载入期间本进程又更新了该用户则保留缓存"""
+        with self._lock:
+            profile = self._profiles.get(user_id)
+            if profile is not None and not self._profile_stale(user_id):
+                return profile
+            updates = self._updates.get(user_id, 0)
+        started = time.monotonic()
+        loaded = self._load_profile(user_id) or _empty_profile()
+        with self._lock:
+            profile = self._profiles.get(user_id)
+            if profile is not None and self._updates.get(user_id, 0) != updates:
+                return profile
+            self._cache_profile(user_id, loaded, started)
+            return loaded
+
+    def _cached_profile(self, user_id: str, fetched: Dict[str, Any]) -> Dict[str, Any]:
+        """缓存中的档案；取得后又被淘汰时重新装入取得的档案（下次访问时刷新），调用方需持有 self._lock"""
+        profile = self._profiles.get(user_id)
+        if profile is None:
+            profile = fetched
+            self._cache_profile(user_id, profile, float("-inf"))
+        else:
+            self._profiles.move_to_end(user_id)
+        return profile
+
+    def _update_profile(self, user_id: str, book: Dict[str, Any], weight: float) -> None:
+        fetched = self._fetch_profile(user_id)
+        with self._lock:
+            profile = self._cached_profile(user_id, fetched)
+            self._updates[user_id] = self._updates.get(user_id, 0) + 1
+            scores = []
+            for key, field in (("authors", "author"), ("genres", "genre")):
+                name = book.get(field)
+                if name:
+                    profile[key][name] = profile[key].get(name, 0.0) + weight
+                    scores.append((key, name, weight))
+            summary, rating = None, None
+            if book.get("title") and book.get("author"):
+                summary = {field: book[field] for field in ("title", "author", "genre", "rating") if book.get(field) is not None}
+                books = [item for item in profile["books"] if item["title"] != summary["title"]]
+                books.append(summary)
+                profile["books"] = books[-PROFILE_HISTORY_LIMIT:]
+                if weight > 0 and isinstance(summary.get("rating"), (int, float)):
+                    rating = summary["rating"]
+                    profile["rating_sum"] += rating
+                    profile["rating_count"] += 1
+            # 在锁内入队，同一用户的增量按更新顺序写入
+            self._save_delta(user_id, scores, summary, rating)
+
+    def record_view(self, user_id: str, book: Dict[str, Any]) -> None:
+        """记录用户浏览的图书"""
+        self._update_profile(user_id, book, 1.0)
+
+    def append_feedback(self, user_id: str, entry: Dict[str, Any]) -> None:
+        """记录反馈并按评分更新偏好（entry 含 book_title、rating、author、genre）"""
+        rating = entry.get("rating")
+        if rating is None:
+            return
+        weight = 2.0 if rating >= POSITIVE_RATING else -2.0 if rating <= NEGATIVE_RATING else 0.0
+        if weight:
+            book = {"title": entry.get("book_title"), "author": entry.get("author"), "genre": entry.get("genre")}
+            if weight < 0:
+                # 差评的图书不计入阅读记录
+                book.pop("title")
+            self._update_profile(user_id, book, weight)
+
+    def get_preferences(self, user_id: str) -> Dict[str, Any]:
+        """用户偏好（UserPreference 字段），读取进程内缓存"""
+        fetched = self._fetch_profile(user_id)
+        with self._lock:
+            profile = self._cached_profile(user_id, fetched)
+            count = profile["rating_count"]
+            return {
+                "favorite_genres": _top(profile["genres"]),
+                "favorite_authors": _top(profile["authors"]),
+                "reading_history": [dict(book) for book in profile["books"]],
+                "preferred_rating": round(profile["rating_sum"] / count, 1) if count else None
+            }
+
+
+_STOP = object()
+
+
+class SQLiteUserStore(UserStore):
+    """SQLite 持久化的用户数据存储，写入由后台线程批量提交"""
+
+    def __init__(
+        self,
+        path: str,
+        batch_size: int = 200,
+        flush_interval: float = 0.2,
+        cache_ttl: float = 5.0,
+        max_profiles: int = 10000
+    ):
+        super().__init__(max_profiles)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self._local = threading.local()
+        # 每个用户已入队、尚未提交的写入数（在 self._lock 下访问）
+        self._pending: Dict[str, int] = {}
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        conn.commit()
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._writer = threading.Thread(target=self._drain, name="user-store-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _conn(self) -> sqlite3.Connection:
+        """每个线程使用独立连接；WAL 模式下写线程提交时读取不被阻塞"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _enqueue(self, user_id: str, sql: str, params: Tuple[Any, ...]) -> None:
+        """写入入队并计入该用户未提交的写入数，调用方需持有 self._lock"""
+        self._pending[user_id] = self._pending.get(user_id, 0) + 1
+        self._queue.put((user_id, sql, params))
+
+    def _next_batch(self) -> Tuple[List[Tuple[str, str, Tuple[Any, ...]]], bool]:
+        """阻塞取到第一条写入后，在 flush_interval 内继续凑满一批"""
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _drain(self) -> None:
+        conn = self._conn()
+        stopped = False
+        while not stopped:
+            batch, stopped = self._next_batch()
+            if batch:
+                try:
+                    with conn:
+                        for _, sql, params in batch:
+                            conn.execute(sql, params)
+                except sqlite3.Error as e:
+                    # 写入失败不影响请求，整批回滚后继续处理后续写入
+                    print(f"⚠️ 用户数据写入失败（{len(batch)} 条）: {e}")
+                finally:
+                    with self._lock:
+                        for user_id, _, _ in batch:
+                            self._pending[user_id] -= 1
+                            if not self._pending[user_id]:
+                                del self._pending[user_id]
+                    for _ in batch:
+                        self._queue.task_done()
+            if stopped:
+                self._queue.task_done()
+        conn.close()
+
+    def _has_pending(self, user_id: str) -> bool:
+        return bool(self._pending.get(user_id))
+
+    def _profile_stale(self, user_id: str) -> bool:
+        # 有未提交的写入时保留缓存（其中已包含这些写入），否则超时后重新载入
+        if self._pending.get(user_id):
+            return False
+        return time.monotonic() - self._loaded_at.get(user_id, float("-inf")) > self.cache_ttl
+
+    def _load_profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._conn()
+        profile = _empty_profile()
+        for field, name, score in conn.execute(
+            "SELECT field, name, score FROM user_profile_scores WHERE user_id = ?", (user_id,)
+        ):
+            profile[field][name] = score
+        rows = conn.execute(
+            "SELECT book FROM user_profile_books WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+            (user_id, PROFILE_HISTORY_LIMIT)
+        ).fetchall()
+        profile["books"] = [json.loads(row[0]) for row in reversed(rows)]
+        row = conn.execute(
+            "SELECT rating_sum, rating_count FROM user_profile_ratings WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if row:
+            profile["rating_sum"], profile["rating_count"] = row
+        return profile
+
+    def _save_delta(
+        self,
+        user_id: str,
+        scores: List[Tuple[str, str, float]],
+        book: Optional[Dict[str, Any]],
+        rating: Optional[float]
+    ) -> None:
+        for field, name, weight in scores:
+            self._enqueue(
+                user_id,
+                "INSERT OR IGNORE INTO user_profile_scores (user_id, field, name) VALUES (?, ?, ?)",
+                (user_id, field, name)
+            )
+            self._enqueue(
+                user_id,
+                "UPDATE user_profile_scores SET score = score + ? WHERE user_id = ? AND field = ? AND name = ?",
+                (weight, user_id, field, name)
+            )
+        if book is not None:
+            # 同一本书重新写入后排到最新，只保留最近 PROFILE_HISTORY_LIMIT 本
+            self._enqueue(
+                user_id,
+                "INSERT OR REPLACE INTO user_profile_books (user_id, title, book) VALUES (?, ?, ?)",
+                (user_id, book["title"], json.dumps(book, ensure_ascii=False))
+            )
+            self._enqueue(
+                user_id,
+                "DELETE FROM user_profile_books WHERE user_id = ? AND id NOT IN "
+                "(SELECT id FROM user_profile_books WHERE user_id = ? ORDER BY id DESC LIMIT ?)",
+                (user_id, user_id, PROFILE_HISTORY_LIMIT)
+            )
+        if rating is not None:
+            self._enqueue(user_id, "INSERT OR IGNORE INTO user_profile_ratings (user_id) VALUES (?)", (user_id,))
+            self._enqueue(
+                user_id,
+                "UPDATE user_profile_ratings SET rating_sum = rating_sum + ?, rating_count = rating_count + 1 "
+                "WHERE user_id = ?",
+                (rating, user_id)
+            )
+
+    def append_history(self, user_id: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._enqueue(
+                user_id, "INSERT INTO user_history (user_id, entry) VALUES (?, ?)", (user_id, json.dumps(entry, ensure_ascii=False))
+            )
+
+    def load_history(self, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT entry FROM user_history WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, limit)
+        ).fetchall()
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def append_feedback(self, user_id: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._enqueue(
+                user_id, "INSERT INTO user_feedback (user_id, entry) VALUES (?, ?)", (user_id, json.dumps(entry, ensure_ascii=False))
+            )
+        super().append_feedback(user_id, entry)
+
+    def load_feedback(self, user_id: str) -> List[Dict[str, Any]]:
+        rows = self._conn().execute("SELECT entry FROM user_feedback WHERE user_id = ? ORDER BY id", (user_id,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def flush(self) -> None:
+        self._queue.join()
+
+    def close(self) -> None:
+        """提交剩余写入并停止写线程"""
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+
+
+def create_user_store() -> UserStore:
+    """按配置创建用户数据存储"""
+    if USER_STORE_BACKEND == "sqlite":
+        return SQLiteUserStore(
+            USER_STORE_PATH, USER_STORE_BATCH_SIZE, USER_STORE_FLUSH_INTERVAL, USER_STORE_CACHE_TTL, USER_STORE_MAX_PROFILES
+        )
+    return UserStore(USER_STORE_MAX_PROFILES)
+
+
+_user_store: Optional[UserStore] = None
+_user_store_lock = threading.Lock()
+
+
+def get_user_store() -> UserStore:
+    """获取进程内共享的用户数据存储，首次访问时创建"""
+    global _user_store
+    if _user_store is None:
+        with _user_store_lock:
+            if _user_store is None:
+                _user_store = create_user_store()
+    return _user_store
@@ -17,6 +17,62 @@ DEFAULT_USER_ID = os.getenv("DEFAULT_USER_ID", "default_user")
 RECOMMENDATION_LIMIT = int(os.getenv("RECOMMENDATION_LIMIT", "5"))
 SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "10"))
 
+# 图书目录配置（为空时使用内置目录）
+BOOK_CATALOG_PATH = os.getenv("BOOK_CATALOG_PATH", "")
+CATALOG_CHUNK_SIZE = int(os.getenv("CATALOG_CHUNK_SIZE", "1000"))
+# 目录存储后端："memory"（进程内字典）、"columnar"（进程内列式，省内存）或 "sqlite"（本地文件，多进程共享）
+BOOK_STORAGE_BACKEND = os.getenv("BOOK_STORAGE_BACKEND", "memory").lower()
+BOOK_SQLITE_PATH = os.getenv("BOOK_SQLITE_PATH", "book_catalog.db")
+# 内容向量索引：保存目录（为空时只在内存中构建）与哈希向量维度
+BOOK_EMBEDDING_PATH = os.getenv("BOOK_EMBEDDING_PATH", "")
+BOOK_EMBEDDING_DIM = int(os.getenv("BOOK_EMBEDDING_DIM", "512"))
+
+# 工具调度配置：同一轮的多个工具调用并发执行（TOOL_MAX_WORKERS 为 1 时顺序执行），
+# 单次调用超过 TOOL_CALL_TIMEOUT 秒返回超时错误（0 表示不限时）
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "4"))
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "30"))
+# 工具结果压缩：一轮对话中工具结果的估算 token 上限（0 表示不限）与简介最多保留的字符数
+TOOL_RESULT_TOKEN_BUDGET = int(os.getenv("TOOL_RESULT_TOKEN_BUDGET", "3000"))
+TOOL_RESULT_DESCRIPTION_CHARS = int(os.getenv("TOOL_RESULT_DESCRIPTION_CHARS", "80"))
+# 工具结果缓存：目录未变化时相同参数的推荐、搜索、相似图书等调用直接复用结果；是否启用与最多缓存条数
+TOOL_CACHE_ENABLED = os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true"
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "4096"))
+
+# LLM 响应缓存：是否启用、进程内最多缓存条数、过期秒数与 SQLite 文件（为空时只缓存在内存中）
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")
+# 语义响应缓存（默认关闭）：换了说法的同一问题直接复用最终回复；相似度阈值（0~1）、最多缓存条数与过期秒数
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.7"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2048"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "1800"))
+# 快速路由：搜索、详情、相似/类型/作者推荐等简单意图直接由工具与模板回答，不调用模型；
+# 可另外启用本地分类器（规则之外的变体按样例最近邻匹配）及其相似度阈值
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+FAST_PATH_CLASSIFIER = os.getenv("FAST_PATH_CLASSIFIER", "false").lower() == "true"
+FAST_PATH_CLASSIFIER_THRESHOLD = float(os.getenv("FAST_PATH_CLASSIFIER_THRESHOLD", "0.8"))
+
+# 用户数据存储：会话历史、反馈与偏好，"sqlite"（本地文件持久化，后台批量写入）或 "memory"（仅进程内）
+USER_STORE_BACKEND = os.getenv("USER_STORE_BACKEND", "sqlite").lower()
+USER_STORE_PATH = os.getenv("USER_STORE_PATH", "user_data.db")
+# 后台写线程每批最多提交的写入条数，以及凑批的最长等待秒数
+USER_STORE_BATCH_SIZE = int(os.getenv("USER_STORE_BATCH_SIZE", "200"))
+USER_STORE_FLUSH_INTERVAL = float(os.getenv("USER_STORE_FLUSH_INTERVAL", "0.2"))
+# 进程内缓存的用户偏好超过该秒数后重新载入，以看到其他 worker 的更新
+USER_STORE_CACHE_TTL = float(os.getenv("USER_STORE_CACHE_TTL", "5"))
+# 进程内最多缓存偏好的用户数，超出时淘汰最久未访问且没有未提交写入的用户
+# （memory 后端被淘汰用户的偏好随之丢弃）
+USER_STORE_MAX_PROFILES = int(os.getenv("USER_STORE_MAX_PROFILES", "10000"))
+# 进程内最多保留会话的用户数（超出时淘汰最久未访问且没有未提交写入的用户，再次访问时从存储重新载入），
+# 以及每个用户在内存中保留的最近反馈条数
+SESSION_MAX_USERS = int(os.getenv("SESSION_MAX_USERS", "10000"))
+SESSION_MAX_FEEDBACK = int(os.getenv("SESSION_MAX_FEEDBACK", "200"))
+
+# 异步服务配置（asgi.py）：单个进程同时运行的对话数上限，超出的请求排队等待
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "256"))
+
 # 知识图谱配置
 ENABLE_KNOWLEDGE_GRAPH = os.getenv("ENABLE_KNOWLEDGE_GRAPH", "true").lower() == "true"
 
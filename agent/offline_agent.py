@@ -3,6 +3,8 @@
 """
 import json
 import random
+import re
+from book_router import format_book_details, format_genre_recommendations, format_search_results, format_similar_books
 from book_tools import book_search_tool, book_recommendation_tool, book_analysis_tool
 
 class OfflineBookAgent:
@@ -21,17 +23,29 @@ class OfflineBookAgent:
         if "搜索" in message or "查找" in message:
             # 提取搜索关键词
             query = message.replace("搜索", "").replace("查找", "").replace("《", "").replace("》", "").strip()
-            result = self.search_tool.search_books(query, 5)
+            return format_search_results(self.search_tool.search_books(query, 5))
+        
+        # 按内容查找图书
+        elif "内容" in message and any(word in message for word in ("像", "类似", "相近", "关于")):
+            titles = re.findall(r"《(.+?)》", message)
+            if titles:
+                result = self.search_tool.search_by_content(title=titles[0])
+                header = f"与《{titles[0]}》内容相近的图书：\n"
+            else:
+                text = re.sub(r"内容|像|类似|相近|关于|的书|图书|找", "", message).strip()
+                result = self.search_tool.search_by_content(text=text)
+                header = f"内容与「{text}」相关的图书：\n"
             
             if result["success"] and result["results"]:
-                response = f"找到以下图书：\n"
-                for i, book in enumerate(result["results"], 1):
+                response = header
+                for i, item in enumerate(result["results"], 1):
+                    book = item["book"]
                     response += f"{i}. 《{book['title']}》- {book['author']} ({book['genre']})\n"
-                    response += f"   评分: {book['rating']}/10\n"
+                    response += f"   内容相似度: {item['score']:.2f}\n"
                     response += f"   描述: {book['description']}\n\n"
                 return response
             else:
-                return "抱歉，没有找到相关图书。"
+                return result.get("error", "抱歉，没有找到内容相近的图书。")
         
         # 推荐相似图书
         elif "推荐" in message and "相似" in message:
@@ -44,16 +58,7 @@ class OfflineBookAgent:
             if search_result["success"]:
                 book_info = search_result["book"]
                 result = self.recommendation_tool.recommend_by_knowledge_graph(book_info)
-                
-                if result["success"] and result["recommendations"]:
-                    response = f"基于《{book_title}》，我推荐以下图书：\n"
-                    for i, book in enumerate(result["recommendations"], 1):
-                        response += f"{i}. 《{book['title']}》- {book['author']} ({book['genre']})\n"
-                        response += f"   评分: {book['rating']}/10\n"
-                        response += f"   推荐理由: {result['reasons'][i-1] if i <= len(result['reasons']) else '相似类型'}\n\n"
-                    return response
-                else:
-                    return "抱歉，无法找到相似图书。"
+                return format_similar_books(result, book_title)
             else:
                 return f"抱歉，没有找到图书《{book_title}》。"
         
@@ -62,40 +67,17 @@ class OfflineBookAgent:
             # 提取类型
             genre = message.replace("推荐", "").replace("类型", "").replace("的", "").strip()
             result = self.recommendation_tool.recommend_by_genre(genre)
-            
-            if result["success"] and result["recommendations"]:
-                response = f"推荐{genre}类型的图书：\n"
-                for i, book in enumerate(result["recommendations"], 1):
-                    response += f"{i}. 《{book['title']}》- {book['author']}\n"
-                    response += f"   评分: {book['rating']}/10\n"
-                    response += f"   描述: {book['description']}\n\n"
-                return response
-            else:
-                return f"抱歉，没有找到{genre}类型的图书。"
+            return format_genre_recommendations(result["recommendations"], genre)
         
         # 获取图书详情
         elif "详情" in message or "信息" in message:
             # 提取图书名称
             book_title = message.replace("详情", "").replace("信息", "").replace("《", "").replace("》", "").strip()
-            result = self.search_tool.get_book_details(book_title)
-            
-            if result["success"]:
-                book = result["book"]
-                response = f"《{book['title']}》详细信息：\n"
-                response += f"作者: {book['author']}\n"
-                response += f"类型: {book['genre']}\n"
-                response += f"评分: {book['rating']}/10\n"
-                response += f"出版年份: {book['publication_year']}\n"
-                response += f"出版社: {book['publisher']}\n"
-                response += f"ISBN: {book['isbn']}\n"
-                response += f"描述: {book['description']}\n"
-                return response
-            else:
-                return f"抱歉，没有找到图书《{book_title}》。"
+            return format_book_details(self.search_tool.get_book_details(book_title), book_title)
         
         # 默认回复
         else:
-            return "我是图书推荐助手，可以帮您：\n1. 搜索图书：'搜索《书名》'\n2. 推荐相似图书：'推荐《书名》的相似图书'\n3. 类型推荐：'推荐科幻类型图书'\n4. 查看详情：'《书名》的详细信息'"
+            return "我是图书推荐助手，可以帮您：\n1. 搜索图书：'搜索《书名》'\n2. 推荐相似图书：'推荐《书名》的相似图书'\n3. 类型推荐：'推荐科幻类型图书'\n4. 查看详情：'《书名》的详细信息'\n5. 内容相近：'找内容像《书名》的书' 或 '找内容关于宇宙文明的书'"
 
 def main():
     """主函数"""
@@ -108,12 +90,14 @@ def main():
     print("   • 基于您浏览的图书推荐相似图书")
     print("   • 根据图书类型推荐图书")
     print("   • 查看图书详细信息")
+    print("   • 按内容查找相近的图书")
     print("="*60)
     print("💬 使用示例：")
     print("   • '搜索《三体》'")
     print("   • '推荐《三体》的相似图书'")
     print("   • '推荐科幻类型图书'")
     print("   • '《三体》的详细信息'")
+    print("   • '找内容像《三体》的书'")
     print("="*60)
     print("❌ 输入 'quit' 或 'exit' 退出")
     print("="*60 + "\n")
@@ -242,13 +242,37 @@ function sendMessage() {
     
     // 显示"正在生成中"提示
     const typingIndicator = showTypingIndicator();
+    const request = { message: message, user_id: 'frontend_user' };
 
-    fetch(`${API_URL}/chat`, {
+    // 浏览器不支持流式读取时退回一次性接口
+    const reply = window.ReadableStream && window.TextDecoder
+        ? streamReply(request, typingIndicator)
+        : blockingReply(request, typingIndicator);
+
+    reply
+    .catch(error => {
+        // 移除"正在生成中"提示
+        removeTypingIndicator(typingIndicator);
+        
+        console.error('Error:', error);
+        appendMessage('agent-message', `Sorry, a connection error occurred: ${error.message}`, true);
+    })
+    .finally(() => {
+        // 重新启用输入框和按钮
+        userInput.disabled = false;
+        sendButton.disabled = false;
+        userInput.focus();
+    });
+}
+
+// 一次性接口：等待完整回复
+function blockingReply(request, typingIndicator) {
+    return fetch(`${API_URL}/chat`, {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ message: message, user_id: 'frontend_user' })
+        body: JSON.stringify(request)
     })
     .then(response => {
         if (!response.ok) {
@@ -265,22 +289,85 @@ function sendMessage() {
         } else if (data.error) {
             appendMessage('agent-message', `Error: ${data.error}`, true);
         }
-    })
-    .catch(error => {
-        // 移除"正在生成中"提示
-        removeTypingIndicator(typingIndicator);
-        
-        console.error('Error:', error);
-        appendMessage('agent-message', `Sorry, a connection error occurred: ${error.message}`, true);
-    })
-    .finally(() => {
-        // 重新启用输入框和按钮
-        userInput.disabled = false;
-        sendButton.disabled = false;
-        userInput.focus();
     });
 }
 
+// 流式接口：读取 /chat/stream 的 SSE 事件，边收边渲染
+async function streamReply(request, typingIndicator) {
+    const response = await fetch(`${API_URL}/chat/stream`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(request)
+    });
+    if (response.status === 404) {
+        // 后端未提供流式接口
+        return blockingReply(request, typingIndicator);
+    }
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    let buffer = '';
+    let text = '';
+    let bubble = null;
+    let finished = false;
+
+    const render = (content) => {
+        if (!bubble) {
+            removeTypingIndicator(typingIndicator);
+            bubble = appendMessage('agent-message', '', false);
+        }
+        bubble.innerHTML = formatMessage(content);
+        chatBox.scrollTop = chatBox.scrollHeight;
+    };
+
+    const handleEvent = (event) => {
+        if (event.type === 'token') {
+            text += event.content;
+            render(text);
+        } else if (event.type === 'tool') {
+            // 模型调用工具期间更新提示；调用前输出的片段以最终回复为准
+            const label = typingIndicator.querySelector('.typing-text');
+            if (label) {
+                label.textContent = `正在查询（${event.name}）...`;
+            }
+        } else if (event.type === 'done') {
+            finished = true;
+            render(event.response);
+            saveMessageToConversation(currentConversationId, 'agent-message', event.response);
+        } else if (event.type === 'error') {
+            finished = true;
+            render(`Error: ${event.error}`);
+            saveMessageToConversation(currentConversationId, 'agent-message', `Error: ${event.error}`);
+        }
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // 事件之间以空行分隔
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            const dataLine = rawEvent.split('\n').find(line => line.startsWith('data:'));
+            if (dataLine) {
+                handleEvent(JSON.parse(dataLine.slice(5)));
+            }
+        }
+    }
+
+    if (!finished) {
+        throw new Error('stream ended unexpectedly');
+    }
+}
+
 // 显示"正在生成中"提示
 function showTypingIndicator() {
     const messageElement = document.createElement('div');
@@ -379,6 +466,8 @@ function appendMessage(className, message, saveToStorage = true) {
     if (saveToStorage && currentConversationId) {
         saveMessageToConversation(currentConversationId, className, message);
     }
+    
+    return bubble;
 }
 
 // 重命名会话